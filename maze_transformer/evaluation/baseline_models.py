@@ -45,7 +45,11 @@ class RandomBaseline(HookedTransformer):
         ), f"config must be a ConfigHolder, got {str(type(config)) = }"
         self.config: ConfigHolder = config
         self.bias: float = bias
-        super().__init__(cfg=config.hooked_transformer_cfg, tokenizer=config.tokenizer)
+        super().__init__(
+            cfg=config.hooked_transformer_cfg,
+            tokenizer=config.tokenizer,
+            default_padding_side=config.tokenizer.padding_side,
+        )
 
     def _get_coord_neighbors(
         self, maze: LatticeMaze, current_position: CoordTup
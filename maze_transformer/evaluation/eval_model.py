@@ -1,10 +1,10 @@
 import json
 from pathlib import Path
-from typing import cast
 
 import numpy as np
 import torch
-from jaxtyping import Float, Int
+import torch.nn.functional as F
+from jaxtyping import Bool, Float, Int
 
 # maze dataset
 from maze_dataset import (
@@ -18,24 +18,35 @@ from maze_dataset.tokenization import MazeTokenizer
 from maze_dataset.tokenization.token_utils import (
     WhenMissing,
     get_context_tokens,
-    get_path_tokens,
-    remove_padding_from_token_str,
     strings_to_coords,
 )
 
 # muutils
-from muutils.mlutils import chunks
 from muutils.statcounter import StatCounter
 
 # TransformerLens
 from transformer_lens import HookedTransformer
-from transformer_lens import utils as tl_utils
 
-from maze_transformer.evaluation.path_evals import PathEvalFunction, PathEvals
-from maze_transformer.tokenizer import HuggingMazeTokenizer
+from maze_transformer.evaluation.incremental_decoding import (
+    generate_continuous_batching,
+    generate_with_kv_cache,
+)
+from maze_transformer.evaluation.path_evals import (
+    BatchedPathEvals,
+    PathEvalFunction,
+    PathEvals,
+)
 from maze_transformer.training.config import ConfigHolder
+from maze_transformer.training.tokenized_dataset import TokenizedMazeDataset
 from maze_transformer.training.train_save_files import TRAIN_SAVE_FILES
-from maze_transformer.utils.padding import pad_and_batch_tensors
+from maze_transformer.utils.padding import (
+    get_length_bucket_order,
+    get_padded_fraction,
+    pad_and_batch_tensors,
+    restore_order,
+    update_padding_stats,
+)
+from maze_transformer.utils.precision import Precision, autocast_context
 
 # pylint: disable=protected-access
 
@@ -113,6 +124,64 @@ def load_model_with_configs(
     return model, config_holder
 
 
+def get_token_coords_arr(maze_tokenizer: MazeTokenizer) -> Int[np.ndarray, "d_vocab 2"]:
+    """coordinate of each token id, or `(-1, -1)` for tokens which are not coordinates. UT tokenizations only"""
+    assert (
+        maze_tokenizer.is_UT()
+    ), f"only UT tokenizations have a single token per coordinate, got {maze_tokenizer.tokenization_mode = }"
+    coords_arr: Int[np.ndarray, "d_vocab 2"] = np.full(
+        (maze_tokenizer.vocab_size, 2), -1, dtype=np.int64
+    )
+    for i, coord in enumerate(
+        strings_to_coords(maze_tokenizer.token_arr, when_noncoord="include")
+    ):
+        if not isinstance(coord, str):
+            coords_arr[i] = coord
+    return coords_arr
+
+
+def get_paths_from_token_ids(
+    paths_ids: list[list[int]],
+    maze_tokenizer: MazeTokenizer,
+    when_noncoord: WhenMissing = "skip",
+) -> list[list[str | CoordTup]]:
+    """convert token ids of paths to coordinates, equivalent to decoding and calling `strings_to_coords`
+
+    for UT tokenizations, this is a lookup into `get_token_coords_arr` rather than parsing strings
+    """
+    if not maze_tokenizer.is_UT():
+        return [
+            strings_to_coords(maze_tokenizer.decode(ids), when_noncoord=when_noncoord)
+            for ids in paths_ids
+        ]
+
+    coords_arr: Int[np.ndarray, "d_vocab 2"] = get_token_coords_arr(maze_tokenizer)
+    token_arr: list[str] = maze_tokenizer.token_arr
+    paths: list[list[str | CoordTup]] = list()
+    for ids in paths_ids:
+        ids_arr: Int[np.ndarray, "n_tokens"] = np.array(ids, dtype=np.int64)
+        coords: Int[np.ndarray, "n_tokens 2"] = coords_arr[ids_arr]
+        is_coord: np.ndarray = coords[:, 0] >= 0
+        if when_noncoord == "skip":
+            paths.append(list(map(tuple, coords[is_coord].tolist())))
+        elif when_noncoord == "include":
+            paths.append(
+                [
+                    tuple(coord) if valid else token_arr[i]
+                    for i, coord, valid in zip(ids, coords.tolist(), is_coord)
+                ]
+            )
+        elif when_noncoord == "error":
+            if not is_coord.all():
+                raise ValueError(
+                    f"Invalid non-coordinate token '{token_arr[ids_arr[~is_coord][0]]}' in path: {maze_tokenizer.decode(ids)}"
+                )
+            paths.append(list(map(tuple, coords.tolist())))
+        else:
+            raise ValueError(f"Invalid when_noncoord value '{when_noncoord}'")
+    return paths
+
+
 def predict_maze_paths(
     tokens_batch: list[list[str]],
     data_cfg: MazeDatasetConfig,
@@ -124,8 +193,20 @@ def predict_maze_paths(
     when_noncoord: WhenMissing = "skip",
     temperature: float = 0.0,
     batch_size: int | None = None,
+    bucket_by_length: bool = False,
+    padding_stats: dict[str, int] | None = None,
+    compile_backend: str | None = None,
 ) -> list[list[str | tuple[int, int]]]:
-    """given the model and a batch of context tokens, make predictions for the path"""
+    """given the model and a batch of context tokens, make predictions for the path
+
+    if `batch_size` is given, contexts are generated for in batches. `bucket_by_length` then
+    groups contexts of similar length to reduce padding (predictions are still returned in
+    the original order), and the number of prefilled tokens and how many of them were padding
+    are added to `padding_stats["n_tokens"]` and `padding_stats["n_padding"]` if given
+
+    with `batch_size`, models using `HookedTransformer.generate` decode incrementally with a key/value
+    cache, and `compile_backend` compiles the decoding step with `torch.compile` (see `KVCacheDecoder`)
+    """
 
     # check types
     assert isinstance(
@@ -155,8 +236,9 @@ def predict_maze_paths(
 
     predictions_out: list[list[str]] = list()
 
+    eos_token_id: int = model.tokenizer._tokenizer_map[SPECIAL_TOKENS.PATH_END]
     generate_kwargs: dict = dict(
-        eos_token_id=model.tokenizer._tokenizer_map[SPECIAL_TOKENS.PATH_END],
+        eos_token_id=eos_token_id,
         stop_at_eos=True,
         verbose=verbose,
         # return_type="str",
@@ -166,18 +248,58 @@ def predict_maze_paths(
     else:
         generate_kwargs["top_k"] = 1
 
-    if batch_size is not None:
+    # models which override `generate` (i.e. `RandomBaseline`) do not have a real forward pass,
+    # so only use incremental decoding for models that use `HookedTransformer.generate`
+    use_kv_cache: bool = type(model).generate is HookedTransformer.generate
+
+    if batch_size is not None and use_kv_cache:
+        # same as `to_tokens` in the per-sample path (and in training), prepend the BOS token
+        if model.cfg.default_prepend_bos:
+            contexts_tokens = [
+                [model.tokenizer.bos_token_id] + x for x in contexts_tokens
+            ]
+
+        # continuous batching: finished sequences are retired and replaced by pending ones
+        generated: list[list[int]] = generate_continuous_batching(
+            model,
+            contexts_tokens,
+            batch_size=batch_size,
+            max_new_tokens=(
+                [model.cfg.n_ctx - len(x) - 1 for x in contexts_tokens]
+                if smart_max_new_tokens
+                else max_new_tokens
+            ),
+            padding_idx=maze_tokenizer.padding_token_index,
+            eos_token_id=eos_token_id,
+            temperature=temperature,
+            bucket_by_length=bucket_by_length,
+            padding_stats=padding_stats,
+            compile_backend=compile_backend,
+        )
+
+        # stay on token ids: the path starts at the `PATH_START` in the context, and
+        # generation already stopped at the first `PATH_END`
+        path_start_id: int = maze_tokenizer.tokenizer_map[SPECIAL_TOKENS.PATH_START]
+        path_ids: list[list[int]] = [
+            context[context.index(path_start_id) :] + new_tokens
+            for context, new_tokens in zip(contexts_tokens, generated)
+        ]
+
+        return get_paths_from_token_ids(
+            path_ids, maze_tokenizer, when_noncoord=when_noncoord
+        )
+
+    elif batch_size is not None:
         # tensor, pad, and batch the tokens
         contexts_tensored: list[Int[torch.Tensor, "batch pos"]] = pad_and_batch_tensors(
             contexts_tokens=contexts_tokens,
             batch_size=batch_size,
             padding_idx=maze_tokenizer.padding_token_index,
             padding_dir="left",  # TODO: read this from model, but it breaks for the RandomBaseline
+            bucket_by_length=bucket_by_length,
         )
-
-        # print(f"{len(contexts_tensored) = }")
-        # print(f"{[x.shape for x in contexts_tensored]}")
-        # print(f"{contexts_tensored = }")
+        if padding_stats is not None:
+            update_padding_stats(padding_stats, contexts_tensored, contexts_tokens)
 
         for batch in contexts_tensored:
             if smart_max_new_tokens:
@@ -202,12 +324,31 @@ def predict_maze_paths(
                     f"Unexpected type for predictions: {type(predictions)}\n{predictions = }"
                 )
 
+        if bucket_by_length:
+            predictions_out = restore_order(
+                predictions_out, get_length_bucket_order(contexts_tokens)
+            )
+
     else:
         # pass string prompts one at a time
         for i, context in enumerate(contexts_strings):
             if smart_max_new_tokens:
                 max_new_tokens = model.cfg.n_ctx - len(contexts_lists[i]) - 1
 
+            if use_kv_cache:
+                # `to_tokens` handles prepending the BOS token, same as `generate` would
+                new_tokens: Int[torch.Tensor, "1 new_tokens"] = generate_with_kv_cache(
+                    model,
+                    model.to_tokens(context),
+                    max_new_tokens=max_new_tokens,
+                    eos_token_id=eos_token_id,
+                    temperature=temperature,
+                )
+                predictions_out.append(
+                    contexts_lists[i] + maze_tokenizer.decode(new_tokens[0].tolist())
+                )
+                continue
+
             prediction: str = model.generate(
                 context,
                 max_new_tokens=max_new_tokens,
@@ -268,10 +409,22 @@ def evaluate_model(
     max_new_tokens: int = 8,
     batch_size: int = 64,
     verbose: bool = False,
+    token_cache_dir: Path | None = None,
+    bucket_by_length: bool = True,
+    precision: Precision = "fp32",
+    compile_backend: str | None = None,
+    padding_stats: dict[str, int] | None = None,
 ) -> dict[str, StatCounter]:
     """Run a set of eval functions on a model for a given dataset. Returns a seperate StatCounter for each eval function.
 
     if dataset_tokens is provided, we assume that the dataset has already been tokenized and we skip tokenization. MAKE SURE THERE IS NOT A MISMATCH BETWEEN THE DATASET AND DATASET_TOKENS
+    otherwise, if token_cache_dir is provided, the tokens are read from (or written to) the token cache there
+
+    `bucket_by_length` groups mazes with similar context lengths when batching generation, to reduce padding. the number of generation input tokens and how many of them were padding
+    are added to `padding_stats` if given (see `get_padded_fraction`), and with `verbose` the padded fraction is printed
+
+    generation runs under autocast for `precision` ("fp32", "bf16" or "fp16"), see `autocast_context`,
+    and the decoding step is compiled with `compile_backend` if given (see `predict_maze_paths`)
     """
 
     if not eval_functions:
@@ -283,73 +436,181 @@ def evaluate_model(
     }
 
     if dataset_tokens is None:
-        dataset_tokens = dataset.as_tokens(
-            model.config.maze_tokenizer, join_tokens_individual_maze=False
-        )
+        if token_cache_dir is not None:
+            dataset_tokens = TokenizedMazeDataset.from_maze_dataset(
+                dataset, model.config.maze_tokenizer, cache_dir=token_cache_dir
+            ).as_tokens(model.config.maze_tokenizer)
+        else:
+            dataset_tokens = dataset.as_tokens(
+                model.config.maze_tokenizer, join_tokens_individual_maze=False
+            )
     else:
         assert len(dataset) == len(
             dataset_tokens
         ), f"dataset and dataset_tokens must be the same length and must be from corresponding mazes, got {len(dataset) = } and {len(dataset_tokens) = }"
 
-    for batch in chunks(zip(dataset, dataset_tokens), batch_size):
-        maze_batch, tokens_batch = zip(*batch)
-        predictions: list[str | list[tuple[int, int]]] = predict_maze_paths(
-            tokens_batch=tokens_batch,
+    # a single call, so that continuous batching can keep `batch_size` mazes in flight throughout
+    if padding_stats is None:
+        padding_stats = dict()
+    with autocast_context(precision, model.cfg.device):
+        predictions: list[list[str | CoordTup]] = predict_maze_paths(
+            tokens_batch=dataset_tokens,
             data_cfg=dataset.cfg,
             model=model,
             max_new_tokens=max_new_tokens,
             verbose=verbose,
+            batch_size=batch_size,
+            bucket_by_length=bucket_by_length,
+            padding_stats=padding_stats,
+            compile_backend=compile_backend,
         )
 
-        for name, func in eval_functions.items():
-            score_counters[name].update(
-                func(
-                    maze=solved_maze,
-                    solution=np.array(solved_maze.solution),
-                    prediction=np.array(prediction),
-                    model=model,
-                )
-                for solved_maze, prediction in zip(maze_batch, predictions)
+    # evals with a vectorized implementation are computed for all mazes at once
+    batched_names: list[str] = [
+        name
+        for name, func in eval_functions.items()
+        if name in BatchedPathEvals.EVALS and func is PathEvals.fast.get(name)
+    ]
+    if batched_names:
+        batched_scores: dict[str, np.ndarray] = BatchedPathEvals.from_paths(
+            mazes=dataset.mazes,
+            solutions=[solved_maze.solution for solved_maze in dataset],
+            predictions=[np.array(prediction) for prediction in predictions],
+        ).compute(batched_names)
+        for name, values in batched_scores.items():
+            score_counters[name].update(values.tolist())
+
+    for name, func in eval_functions.items():
+        if name in batched_names:
+            continue
+        score_counters[name].update(
+            func(
+                maze=solved_maze,
+                solution=np.array(solved_maze.solution),
+                prediction=np.array(prediction),
+                model=model,
             )
+            for solved_maze, prediction in zip(dataset, predictions)
+        )
+
+    if verbose and padding_stats:
+        print(
+            f"padded fraction of generation inputs: {get_padded_fraction(padding_stats):.3f}"
+        )
 
     return score_counters
 
 
+def _get_path_region(
+    batch: Int[torch.Tensor, "batch pos"],
+    config: ConfigHolder,
+) -> tuple[
+    Bool[torch.Tensor, "batch"],
+    Int[torch.Tensor, "batch 1"],
+    Int[torch.Tensor, "batch 1"],
+]:
+    """whether each sequence has a `PATH_START`, and the indices into the targets `batch[:, 1:]`
+    of the first path token (the origin) and of the first `PATH_END` after it"""
+    tokenizer_map: dict[str, int] = config.maze_tokenizer.tokenizer_map
+    targets: Int[torch.Tensor, "batch pos-1"] = batch[:, 1:]
+    positions: Int[torch.Tensor, "1 pos-1"] = torch.arange(
+        targets.shape[1], device=batch.device
+    )[None, :]
+
+    is_path_start: Bool[torch.Tensor, "batch pos"] = (
+        batch == tokenizer_map[SPECIAL_TOKENS.PATH_START]
+    )
+    has_path: Bool[torch.Tensor, "batch"] = is_path_start.any(dim=1)
+    path_start: Int[torch.Tensor, "batch 1"] = is_path_start.int().argmax(dim=1)[
+        :, None
+    ]
+    is_path_end: Bool[torch.Tensor, "batch pos-1"] = (
+        targets == tokenizer_map[SPECIAL_TOKENS.PATH_END]
+    ) & (positions >= path_start)
+    path_end: Int[torch.Tensor, "batch 1"] = torch.where(
+        is_path_end.any(dim=1),
+        is_path_end.int().argmax(dim=1),
+        targets.shape[1] - 1,
+    )[:, None]
+    return has_path, path_start, path_end
+
+
+def _path_region_mask(
+    has_path: Bool[torch.Tensor, "batch"],
+    path_start: Int[torch.Tensor, "batch 1"],
+    path_end: Int[torch.Tensor, "batch 1"],
+    n_targets: int,
+) -> Bool[torch.Tensor, "batch pos-1"]:
+    positions: Int[torch.Tensor, "1 pos-1"] = torch.arange(
+        n_targets, device=path_start.device
+    )[None, :]
+    return (positions >= path_start) & (positions <= path_end) & has_path[:, None]
+
+
+def get_path_target_mask(
+    batch: Int[torch.Tensor, "batch pos"],
+    config: ConfigHolder,
+) -> Bool[torch.Tensor, "batch pos-1"]:
+    """which of the targets `batch[:, 1:]` are in the path region, as defined in `evaluate_logits`"""
+    has_path, path_start, path_end = _get_path_region(batch, config)
+    return _path_region_mask(has_path, path_start, path_end, batch.shape[1] - 1)
+
+
 def evaluate_logits(
     logits: Float[torch.Tensor, "batch pos d_vocab"],
-    batch: list[int],
+    batch: Int[torch.Tensor, "batch pos"],
     config: ConfigHolder,
-    tokenizer: HuggingMazeTokenizer,
-    path_evals: dict[str, PathEvalFunction] | None = None,
 ) -> dict[str, StatCounter]:
-    """Runs a set of eval functions on the provided logits. For path evals, an attempt will be made to extract a predicted path from the logits (it is assumed that the logits are an entire sequence output from training, so they contain the adj_list plus path)"""
+    """teacher-forced evals on the path, from the logits of a forward pass over full sequences
 
-    raise NotImplementedError(
-        "evaluate_logits does not function correctly, and at the moment there are only path evals anyway"
-    )
+    `logits` are those of the training forward pass, either for every position of `batch` or
+    with the last position (the prediction after `PATH_END`) already removed. The path region
+    is every target token after `PATH_START` up to and including `PATH_END` (or the end of the
+    sequence, if it was truncated). Sequences without a `PATH_START` are ignored. Returns:
 
-    scores: dict[str, StatCounter] = {}
-
-    if path_evals:
-        # TODO: this is pretty much wrong -- sampling from the logits over the sequence should not produce a valid path
-        sampled_logits = tl_utils.sample_logits(logits)
-        prediction_tokens = tokenizer.batch_decode(sampled_logits)
-        predicted_paths = []
-        for tokens in prediction_tokens:
-            # this returns first path_start to end of list. Early in training there may be multiple path_start tokens, so results should be treated with caution
-            path_tokens = get_path_tokens(tokens.split(" "))
-            path_coords = strings_to_coords(path_tokens, when_noncoord="skip")
-            predicted_paths.append(cast(list[tuple[int, int]], path_coords))
-
-        maze_tokens = [
-            remove_padding_from_token_str(token_str)
-            for token_str in tokenizer.batch_decode(batch)
-        ]
+    - `teacher_forced/token_accuracy`: whether each path token is the argmax prediction
+    - `teacher_forced/token_loss`: cross entropy of each path token
+    - `teacher_forced/first_choice_accuracy`: whether the first step after the origin is correct
+    - `teacher_forced/exact_path`: whether every path token of a sequence is correct
+    """
+    if logits.shape[1] == batch.shape[1]:
+        logits = logits[:, :-1, :]
+    assert (
+        logits.shape[1] == batch.shape[1] - 1
+    ), f"logits must cover every position but the last, got {logits.shape = } and {batch.shape = }"
+
+    batch = batch.to(logits.device)
+    targets: Int[torch.Tensor, "batch pos-1"] = batch[:, 1:]
+    has_path, path_start, path_end = _get_path_region(batch, config)
+    path_mask: Bool[torch.Tensor, "batch pos-1"] = _path_region_mask(
+        has_path, path_start, path_end, targets.shape[1]
+    )
 
-        solved_mazes = [
-            SolvedMaze.from_tokens(tokens.split(" "), config.dataset_cfg)
-            for tokens in maze_tokens
-        ]
-        scores |= evaluate_path_predictions(solved_mazes, predicted_paths, path_evals)
+    with torch.no_grad():
+        correct: Bool[torch.Tensor, "batch pos-1"] = logits.argmax(dim=-1) == targets
+        token_loss: Float[torch.Tensor, "batch pos-1"] = F.cross_entropy(
+            logits.float().transpose(1, 2), targets, reduction="none"
+        )
 
-    return scores
+    # the first choice is the step after the origin, which is `PATH_END` if origin == target
+    first_choice_idx: Int[torch.Tensor, "batch"] = (path_start[:, 0] + 1).clamp(
+        max=targets.shape[1] - 1
+    )
+    has_first_choice: Bool[torch.Tensor, "batch"] = has_path & (
+        first_choice_idx <= path_end[:, 0]
+    )
+    first_choice_correct: Bool[torch.Tensor, "batch"] = correct[
+        torch.arange(len(batch), device=logits.device), first_choice_idx
+    ]
+    exact_path: Bool[torch.Tensor, "batch"] = (correct | ~path_mask).all(dim=1)
+
+    return {
+        "teacher_forced/token_accuracy": StatCounter(
+            correct[path_mask].float().tolist()
+        ),
+        "teacher_forced/token_loss": StatCounter(token_loss[path_mask].tolist()),
+        "teacher_forced/first_choice_accuracy": StatCounter(
+            first_choice_correct[has_first_choice].float().tolist()
+        ),
+        "teacher_forced/exact_path": StatCounter(exact_path[has_path].float().tolist()),
+    }
@@ -0,0 +1,370 @@
+import typing
+from collections import deque
+from typing import Sequence
+
+import torch
+import torch.nn.functional as F
+from jaxtyping import Bool, Float, Int
+from transformer_lens import HookedTransformer
+from transformer_lens import utils as tl_utils
+from transformer_lens.past_key_value_caching import (
+    HookedTransformerKeyValueCache,
+    HookedTransformerKeyValueCacheEntry,
+)
+
+from maze_transformer.utils.compile import (
+    AttentionMaskHook,
+    compile_dynamic,
+    get_attention_mask_hook,
+)
+from maze_transformer.utils.padding import (
+    get_length_bucket_order,
+    pad_and_batch_tensors,
+    update_padding_stats,
+)
+
+
+class KVCacheDecoder:
+    """incremental decoding of a batch of left-padded prompts with a per-layer key/value cache
+
+    `prefill` runs the model once over the prompts and stores the keys and values of every
+    layer, after which each `step` only runs the model on a single new token per row. The
+    left attention mask is kept alongside the cache and extended by one each step, so that
+    padding is never attended to and positional embeddings start at the first real token.
+
+    rather than going through `HookedTransformer.forward`, which rebuilds a `[batch, pos, pos]`
+    left-padding mask row by row in every layer, the padding is masked out with a single
+    `[batch, 1, 1, pos]` mask on the attention scores via `hook_attn_scores`. All
+    other hook points are still run as usual.
+
+    with `compile_backend`, the transformer blocks are run through `torch.compile` with
+    dynamic shapes, so the growing cache does not trigger a recompile at every step
+    """
+
+    def __init__(
+        self,
+        model: HookedTransformer,
+        compile_backend: str | None = None,
+    ) -> None:
+        assert (
+            model.tokenizer is not None
+        ), "incremental decoding needs a tokenizer to find the padding"
+        assert (
+            model.cfg.positional_embedding_type == "standard"
+        ), f"only standard positional embeddings are supported, got {model.cfg.positional_embedding_type = }"
+        self.model: HookedTransformer = model
+        self.compile_backend: str | None = compile_backend
+        self.kv_cache: HookedTransformerKeyValueCache | None = None
+        self.attention_mask: Int[torch.Tensor, "batch pos"] | None = None
+        self._mask_hook: AttentionMaskHook = get_attention_mask_hook(model)
+        self._run_blocks: typing.Callable = (
+            _run_blocks
+            if compile_backend is None
+            else compile_dynamic(_run_blocks, compile_backend)
+        )
+
+    @property
+    def batch_size(self) -> int:
+        return 0 if self.attention_mask is None else self.attention_mask.shape[0]
+
+    @property
+    def cache_len(self) -> int:
+        return 0 if self.attention_mask is None else self.attention_mask.shape[1]
+
+    @torch.no_grad()
+    def prefill(
+        self,
+        tokens: Int[torch.Tensor, "batch pos"],
+    ) -> Float[torch.Tensor, "batch d_vocab"]:
+        """run the model over the (left-padded) prompts, filling the cache. returns the logits at the last position"""
+        tokens = tokens.to(self.model.cfg.device)
+        self.kv_cache = HookedTransformerKeyValueCache.init_cache(
+            self.model.cfg, self.model.cfg.device, tokens.shape[0]
+        )
+        # only leading padding is padding
+        self.attention_mask = (
+            tokens.ne(self.model.tokenizer.pad_token_id).cumsum(dim=-1) > 0
+        ).long()
+        return self._forward(tokens)
+
+    @torch.no_grad()
+    def step(
+        self,
+        next_tokens: Int[torch.Tensor, "batch"],
+    ) -> Float[torch.Tensor, "batch d_vocab"]:
+        """feed one new token per row, appending to the cache. returns the logits for the next token"""
+        assert self.kv_cache is not None, "must call `prefill` before `step`"
+        self.attention_mask = tl_utils.extend_tensor_with_ones(self.attention_mask)
+        return self._forward(next_tokens.to(self.model.cfg.device)[:, None])
+
+    def _forward(
+        self,
+        tokens: Int[torch.Tensor, "batch pos_new"],
+    ) -> Float[torch.Tensor, "batch d_vocab"]:
+        """run `tokens` through the model, given that `self.attention_mask` already covers them"""
+        model: HookedTransformer = self.model
+        assert (
+            self.cache_len <= model.cfg.n_ctx
+        ), f"cache length {self.cache_len} exceeds {model.cfg.n_ctx = }"
+
+        # positions count from the first non-padding token
+        position_ids: Int[torch.Tensor, "batch pos_new"] = (
+            self.attention_mask.cumsum(dim=-1) - 1
+        ).clamp(min=0)[:, -tokens.shape[1] :]
+        residual: Float[torch.Tensor, "batch pos_new d_model"] = model.hook_embed(
+            model.embed(tokens)
+        ) + model.hook_pos_embed(model.pos_embed.W_pos[position_ids])
+
+        with model.hooks(
+            fwd_hooks=[
+                (f"blocks.{i}.attn.hook_attn_scores", self._mask_hook)
+                for i in range(model.cfg.n_layers)
+            ]
+        ):
+            residual = self._run_blocks(
+                model,
+                residual,
+                self.kv_cache.entries,
+                self._mask_hook,
+                self.attention_mask.bool()[:, None, None, :],
+            )
+        self._mask_hook.mask = None
+
+        residual = residual[:, -1:, :]
+        if model.cfg.normalization_type is not None:
+            residual = model.ln_final(residual)
+        return model.unembed(residual)[:, -1, :]
+
+    @torch.no_grad()
+    def select(self, rows: Int[torch.Tensor, "batch_new"]) -> None:
+        """keep only the given rows of the cache, i.e. to retire finished sequences
+
+        leading positions which are padding in every remaining row are dropped as well
+        """
+        rows = rows.to(self.attention_mask.device)
+        self.attention_mask = self.attention_mask[rows]
+        for entry in self.kv_cache.entries:
+            entry.past_keys = entry.past_keys[rows]
+            entry.past_values = entry.past_values[rows]
+        self._trim()
+
+    @torch.no_grad()
+    def extend(
+        self,
+        tokens: Int[torch.Tensor, "batch_new pos"],
+    ) -> Float[torch.Tensor, "batch_new d_vocab"]:
+        """prefill new (left-padded) prompts and append them as rows after the existing ones
+
+        the caches are left-padded to a common length before concatenating, which is safe
+        since positions are computed from the attention mask. returns the logits at the last
+        position of the new rows
+        """
+        if self.kv_cache is None or self.batch_size == 0:
+            return self.prefill(tokens)
+
+        new: KVCacheDecoder = KVCacheDecoder(self.model, self.compile_backend)
+        logits: Float[torch.Tensor, "batch_new d_vocab"] = new.prefill(tokens)
+
+        cache_len: int = max(self.cache_len, new.cache_len)
+        for entry, new_entry in zip(self.kv_cache.entries, new.kv_cache.entries):
+            entry.past_keys = torch.cat(
+                [
+                    _left_pad_pos(entry.past_keys, cache_len),
+                    _left_pad_pos(new_entry.past_keys, cache_len),
+                ]
+            )
+            entry.past_values = torch.cat(
+                [
+                    _left_pad_pos(entry.past_values, cache_len),
+                    _left_pad_pos(new_entry.past_values, cache_len),
+                ]
+            )
+        self.attention_mask = torch.cat(
+            [
+                _left_pad_pos(self.attention_mask, cache_len),
+                _left_pad_pos(new.attention_mask, cache_len),
+            ]
+        )
+        return logits
+
+    def _trim(self) -> None:
+        """drop leading positions which no row attends to"""
+        if self.batch_size == 0:
+            return
+        n_trim: int = int(self.attention_mask.any(dim=0).int().argmax())
+        if n_trim > 0:
+            self.attention_mask = self.attention_mask[:, n_trim:]
+            for entry in self.kv_cache.entries:
+                entry.past_keys = entry.past_keys[:, n_trim:]
+                entry.past_values = entry.past_values[:, n_trim:]
+
+
+def _run_blocks(
+    model: HookedTransformer,
+    residual: Float[torch.Tensor, "batch pos_new d_model"],
+    kv_cache_entries: list[HookedTransformerKeyValueCacheEntry],
+    mask_hook: AttentionMaskHook,
+    mask: Bool[torch.Tensor, "batch 1 1 pos"],
+) -> Float[torch.Tensor, "batch pos_new d_model"]:
+    """run the transformer blocks of `model`, appending to the cache of each
+
+    `mask` is set on the hook here rather than by the caller, so that it is part of the compiled graph
+    """
+    mask_hook.mask = mask
+    for block, cache_entry in zip(model.blocks, kv_cache_entries):
+        residual = block(residual, past_kv_cache_entry=cache_entry)
+    return residual
+
+
+def _left_pad_pos(x: torch.Tensor, length: int) -> torch.Tensor:
+    """left-pad the position (second) dimension of `x` with zeros up to `length`"""
+    n_pad: int = length - x.shape[1]
+    if n_pad == 0:
+        return x
+    # `F.pad` takes padding for the last dimension first
+    return F.pad(x, [0, 0] * (x.ndim - 2) + [n_pad, 0])
+
+
+def sample_next_tokens(
+    logits: Float[torch.Tensor, "batch d_vocab"],
+    temperature: float = 0.0,
+) -> Int[torch.Tensor, "batch"]:
+    """greedy if `temperature` is zero, otherwise sample at that temperature"""
+    if temperature == 0.0:
+        return logits.argmax(dim=-1)
+    return tl_utils.sample_logits(logits, temperature=temperature)
+
+
+@torch.no_grad()
+def generate_with_kv_cache(
+    model: HookedTransformer,
+    tokens: Int[torch.Tensor, "batch pos"],
+    max_new_tokens: int,
+    eos_token_id: int | None = None,
+    temperature: float = 0.0,
+    compile_backend: str | None = None,
+) -> Int[torch.Tensor, "batch new_tokens"]:
+    """generate up to `max_new_tokens` for each row of the left-padded `tokens`
+
+    returns only the generated tokens. once a row emits `eos_token_id`, the rest of that row is
+    filled with `eos_token_id`, and generation stops once every row has finished.
+    `compile_backend` is passed to `KVCacheDecoder`
+    """
+    if max_new_tokens <= 0:
+        return torch.zeros((tokens.shape[0], 0), dtype=torch.long)
+
+    decoder: KVCacheDecoder = KVCacheDecoder(model, compile_backend)
+    generated: list[Int[torch.Tensor, "batch"]] = list()
+    finished: torch.Tensor = torch.zeros(
+        tokens.shape[0], dtype=torch.bool, device=model.cfg.device
+    )
+
+    logits: Float[torch.Tensor, "batch d_vocab"] = decoder.prefill(tokens)
+    for i in range(max_new_tokens):
+        next_tokens: Int[torch.Tensor, "batch"] = sample_next_tokens(
+            logits, temperature
+        )
+        if eos_token_id is not None:
+            next_tokens[finished] = eos_token_id
+            finished |= next_tokens == eos_token_id
+        generated.append(next_tokens)
+
+        if finished.all() or i == max_new_tokens - 1:
+            break
+        logits = decoder.step(next_tokens)
+
+    return torch.stack(generated, dim=1).cpu()
+
+
+@torch.no_grad()
+def generate_continuous_batching(
+    model: HookedTransformer,
+    contexts_tokens: list[list[int]],
+    batch_size: int,
+    max_new_tokens: int | Sequence[int],
+    padding_idx: int,
+    eos_token_id: int | None = None,
+    temperature: float = 0.0,
+    bucket_by_length: bool = False,
+    padding_stats: dict[str, int] | None = None,
+    compile_backend: str | None = None,
+) -> list[list[int]]:
+    """generate for every context, keeping at most `batch_size` sequences in flight
+
+    a row is retired from the cache as soon as it emits `eos_token_id` or reaches its
+    `max_new_tokens` (which may be given per context), and the free slots are refilled from
+    the queue of pending contexts. This way a single long path does not hold up the rest of
+    the batch. returns the generated tokens for each context, in order, up to and including
+    `eos_token_id`
+
+    if `bucket_by_length` is set, the queue is sorted by context length, so that contexts
+    prefilled together need less padding. if `padding_stats` is given, the number of prefilled
+    tokens and how many of them were padding are added to its `"n_tokens"` and `"n_padding"`.
+    `compile_backend` is passed to `KVCacheDecoder`
+    """
+    n_contexts: int = len(contexts_tokens)
+    if isinstance(max_new_tokens, int):
+        max_new_tokens = [max_new_tokens] * n_contexts
+    assert (
+        len(max_new_tokens) == n_contexts
+    ), f"need one max_new_tokens per context, got {len(max_new_tokens) = } and {n_contexts = }"
+
+    generated: list[list[int]] = [list() for _ in range(n_contexts)]
+    pending: deque[int] = deque(
+        i
+        for i in (
+            get_length_bucket_order(contexts_tokens)
+            if bucket_by_length
+            else range(n_contexts)
+        )
+        if max_new_tokens[i] > 0
+    )
+    # index of the context for each row of the decoder
+    active: list[int] = list()
+    decoder: KVCacheDecoder = KVCacheDecoder(model, compile_backend)
+    logits: Float[torch.Tensor, "batch d_vocab"] | None = None
+
+    while pending or active:
+        # refill free slots from the queue
+        if pending and len(active) < batch_size:
+            new_rows: list[int] = [
+                pending.popleft()
+                for _ in range(min(batch_size - len(active), len(pending)))
+            ]
+            new_contexts: list[list[int]] = [contexts_tokens[i] for i in new_rows]
+            new_batch: Int[torch.Tensor, "batch_new pos"] = pad_and_batch_tensors(
+                new_contexts,
+                batch_size=len(new_rows),
+                padding_idx=padding_idx,
+                padding_dir="left",
+            )[0]
+            if padding_stats is not None:
+                update_padding_stats(padding_stats, [new_batch], new_contexts)
+            new_logits: Float[torch.Tensor, "batch_new d_vocab"] = decoder.extend(
+                new_batch
+            )
+            logits = new_logits if not active else torch.cat([logits, new_logits])
+            active.extend(new_rows)
+
+        next_tokens: Int[torch.Tensor, "batch"] = sample_next_tokens(
+            logits, temperature
+        )
+
+        keep: list[int] = list()
+        for row, (idx, token) in enumerate(zip(active, next_tokens.tolist())):
+            generated[idx].append(token)
+            if token != eos_token_id and len(generated[idx]) < max_new_tokens[idx]:
+                keep.append(row)
+
+        if len(keep) < len(active):
+            keep_tensor: Int[torch.Tensor, "batch_new"] = torch.tensor(
+                keep, dtype=torch.long
+            )
+            decoder.select(keep_tensor)
+            next_tokens = next_tokens[keep_tensor.to(next_tokens.device)]
+            active = [active[row] for row in keep]
+
+        if active:
+            logits = decoder.step(next_tokens)
+
+    return generated
@@ -12,6 +12,11 @@ def load_model_with_test_data(
     n_examples: int | None = 128,
     verbose: bool = True,
 ) -> tuple[ZanjHookedTransformer, MazeDataset | None]:
+    """load a model, and the dataset it was trained on (or `dataset_cfg_source`)
+
+    to evaluate on memory-mapped tokens instead of tokenizing the dataset again, pass a
+    `token_cache_dir` to `evaluate_model`
+    """
     model_path = Path(model_path)
 
     # load model
@@ -2,7 +2,7 @@ import typing
 import warnings
 
 import numpy as np
-from jaxtyping import Bool, Int
+from jaxtyping import Bool, Float, Int
 from maze_dataset import (
     SPECIAL_TOKENS,
     Coord,
@@ -203,6 +203,266 @@ class PathEvals:
         return np.linalg.norm(distance_between_nodes, axis=1).mean()
 
 
+def pad_coord_arrays(
+    paths: typing.Sequence[CoordArray],
+) -> tuple[Int[np.ndarray, "n_paths max_len 2"], Int[np.ndarray, "n_paths"]]:
+    """stack paths of different lengths into a zero-padded array, plus the length of each path"""
+    lengths: Int[np.ndarray, "n_paths"] = np.array(
+        [len(path) for path in paths], dtype=np.int64
+    )
+    padded: Int[np.ndarray, "n_paths max_len 2"] = np.zeros(
+        (len(paths), max(lengths.max(initial=0), 1), 2), dtype=np.int64
+    )
+    for i, path in enumerate(paths):
+        if len(path) > 0:
+            padded[i, : len(path)] = path
+    return padded, lengths
+
+
+class BatchedPathEvals:
+    """vectorized versions of `PathEvals.fast`, computed for many mazes at once
+
+    paths are given as zero-padded `(n_mazes, max_len, 2)` arrays with their lengths, and
+    the mazes as stacked `(n_mazes, 2, grid_n, grid_n)` connection lists. Quantities shared
+    between evals (steps, masks, lattice and maze adjacency) are computed once, and each eval
+    in `EVALS` returns one value per maze, matching the corresponding `PathEvals` function
+    """
+
+    EVALS: dict[str, typing.Callable[["BatchedPathEvals"], np.ndarray]] = {}
+
+    def __init__(
+        self,
+        predictions: Int[np.ndarray, "n_mazes pred_len 2"],
+        prediction_lengths: Int[np.ndarray, "n_mazes"],
+        solutions: Int[np.ndarray, "n_mazes sol_len 2"],
+        solution_lengths: Int[np.ndarray, "n_mazes"],
+        connection_lists: Bool[np.ndarray, "n_mazes lattice_dim grid_n grid_n"],
+    ) -> None:
+        self.predictions: Int[np.ndarray, "n_mazes pred_len 2"] = predictions
+        self.prediction_lengths: Int[np.ndarray, "n_mazes"] = prediction_lengths
+        self.solutions: Int[np.ndarray, "n_mazes sol_len 2"] = solutions
+        self.solution_lengths: Int[np.ndarray, "n_mazes"] = solution_lengths
+        self.connection_lists: Bool[
+            np.ndarray, "n_mazes lattice_dim grid_n grid_n"
+        ] = connection_lists
+
+        n_mazes: int = len(predictions)
+        self.pred_mask: Bool[np.ndarray, "n_mazes pred_len"] = (
+            np.arange(predictions.shape[1])[None, :] < prediction_lengths[:, None]
+        )
+        self.sol_mask: Bool[np.ndarray, "n_mazes sol_len"] = (
+            np.arange(solutions.shape[1])[None, :] < solution_lengths[:, None]
+        )
+
+        # steps between consecutive nodes of the prediction
+        self.step_mask: Bool[np.ndarray, "n_mazes pred_len-1"] = self.pred_mask[:, 1:]
+        self.steps: Int[np.ndarray, "n_mazes pred_len-1 2"] = (
+            predictions[:, 1:] - predictions[:, :-1]
+        )
+        self.step_sizes: Float[np.ndarray, "n_mazes pred_len-1"] = np.sqrt(
+            (self.steps**2).sum(axis=-1)
+        )
+        self.step_lattice_adjacent: Bool[np.ndarray, "n_mazes pred_len-1"] = (
+            np.abs(self.steps).sum(axis=-1) == 1
+        ) & self.step_mask
+
+        # same as `LatticeMaze.nodes_connected`: look up the wall in the direction of the
+        # step, from whichever node has the lower coordinate
+        grid_n: int = connection_lists.shape[-1]
+        step_dim: Int[np.ndarray, "n_mazes pred_len-1"] = np.argmax(
+            np.abs(self.steps), axis=-1
+        )
+        clist_node: Int[np.ndarray, "n_mazes pred_len-1 2"] = np.where(
+            (self.steps.sum(axis=-1) > 0)[..., None],
+            predictions[:, :-1],
+            predictions[:, 1:],
+        )
+        in_bounds: Bool[np.ndarray, "n_mazes pred_len-1"] = (
+            (clist_node >= 0) & (clist_node < grid_n)
+        ).all(axis=-1)
+        clist_node = np.clip(clist_node, 0, grid_n - 1)
+        self.step_maze_connected: Bool[np.ndarray, "n_mazes pred_len-1"] = (
+            connection_lists[
+                np.arange(n_mazes)[:, None],
+                step_dim,
+                clist_node[..., 0],
+                clist_node[..., 1],
+            ]
+            & self.step_lattice_adjacent
+            & in_bounds
+        )
+
+    @classmethod
+    def from_paths(
+        cls,
+        mazes: typing.Sequence[LatticeMaze],
+        solutions: typing.Sequence[CoordArray],
+        predictions: typing.Sequence[CoordArray],
+    ) -> "BatchedPathEvals":
+        """pad the paths and stack the connection lists (padding smaller grids with walls)"""
+        grid_n: int = max(maze.grid_shape[0] for maze in mazes)
+        connection_lists: Bool[
+            np.ndarray, "n_mazes lattice_dim grid_n grid_n"
+        ] = np.stack(
+            [
+                np.pad(
+                    maze.connection_list,
+                    [(0, 0)] + [(0, grid_n - n) for n in maze.grid_shape],
+                    constant_values=False,
+                )
+                for maze in mazes
+            ]
+        )
+        return cls(
+            *pad_coord_arrays(predictions),
+            *pad_coord_arrays(solutions),
+            connection_lists=connection_lists,
+        )
+
+    def __len__(self) -> int:
+        return len(self.prediction_lengths)
+
+    def compute(
+        self, eval_names: typing.Iterable[str] | None = None
+    ) -> dict[str, Float[np.ndarray, "n_mazes"]]:
+        """compute the given evals (all of `EVALS` by default), one value per maze"""
+        if eval_names is None:
+            eval_names = self.EVALS.keys()
+        return {name: self.EVALS[name](self) for name in eval_names}
+
+    @register_method(EVALS)
+    def node_overlap(self) -> Float[np.ndarray, "n_mazes"]:
+        # membership of every node of the lattice, so that sets become boolean arrays
+        n_nodes_side: int = (
+            max(self.predictions.max(initial=0), self.solutions.max(initial=0)) + 1
+        )
+        rows: Int[np.ndarray, "n_mazes 1"] = np.arange(len(self))[:, None]
+        in_pred: Bool[np.ndarray, "n_mazes n_nodes"] = np.zeros(
+            (len(self), n_nodes_side**2), dtype=bool
+        )
+        in_sol: Bool[np.ndarray, "n_mazes n_nodes"] = np.zeros_like(in_pred)
+        in_pred[
+            np.broadcast_to(rows, self.pred_mask.shape)[self.pred_mask],
+            (self.predictions[..., 0] * n_nodes_side + self.predictions[..., 1])[
+                self.pred_mask
+            ],
+        ] = True
+        in_sol[
+            np.broadcast_to(rows, self.sol_mask.shape)[self.sol_mask],
+            (self.solutions[..., 0] * n_nodes_side + self.solutions[..., 1])[
+                self.sol_mask
+            ],
+        ] = True
+
+        n_sol: Int[np.ndarray, "n_mazes"] = in_sol.sum(axis=1)
+        if (n_sol == 0).any():
+            warnings.warn(
+                f"node_overlap called on {(n_sol == 0).sum()} solutions with no nodes, returning NaN for those",
+                RuntimeWarning,
+            )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(
+                n_sol > 0, (in_pred & in_sol).sum(axis=1) / n_sol, float("NaN")
+            )
+
+    @register_method(EVALS)
+    def num_connections_adjacent_lattice(self) -> Float[np.ndarray, "n_mazes"]:
+        return self.step_lattice_adjacent.sum(axis=1).astype(float)
+
+    @register_method(EVALS)
+    def fraction_connections_adjacent_lattice(self) -> Float[np.ndarray, "n_mazes"]:
+        if (self.prediction_lengths == 1).any():
+            warnings.warn(
+                f"fraction_connections_adjacent_lattice called on {(self.prediction_lengths == 1).sum()} paths of length 1, returning NaN for those",
+                RuntimeWarning,
+            )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.select(
+                [self.prediction_lengths == 0, self.prediction_lengths == 1],
+                [0.0, float("NaN")],
+                self.num_connections_adjacent_lattice() / self.prediction_lengths,
+            )
+
+    @register_method(EVALS)
+    def num_connections_adjacent(self) -> Float[np.ndarray, "n_mazes"]:
+        return self.step_maze_connected.sum(axis=1).astype(float)
+
+    @register_method(EVALS)
+    def fraction_connections_adjacent(self) -> Float[np.ndarray, "n_mazes"]:
+        return self.num_connections_adjacent() / np.maximum(
+            self.prediction_lengths - 1.0, 1.0
+        )
+
+    @register_method(EVALS)
+    def exact_path_predicted(self) -> Float[np.ndarray, "n_mazes"]:
+        max_len: int = max(self.predictions.shape[1], self.solutions.shape[1])
+        predictions: Int[np.ndarray, "n_mazes max_len 2"] = _pad_len(
+            self.predictions, max_len
+        )
+        solutions: Int[np.ndarray, "n_mazes max_len 2"] = _pad_len(
+            self.solutions, max_len
+        )
+        return (
+            (self.prediction_lengths == self.solution_lengths)
+            & (predictions == solutions).all(axis=(1, 2))
+        ).astype(float)
+
+    @register_method(EVALS)
+    def solution_length(self) -> Float[np.ndarray, "n_mazes"]:
+        return self.solution_lengths.astype(float)
+
+    @register_method(EVALS)
+    def streak_length_until_incorrect(self) -> Float[np.ndarray, "n_mazes"]:
+        max_len: int = max(self.predictions.shape[1], self.solutions.shape[1])
+        matches: Bool[np.ndarray, "n_mazes max_len"] = (
+            _pad_len(self.predictions, max_len) == _pad_len(self.solutions, max_len)
+        ).all(axis=-1) & (
+            np.arange(max_len)[None, :]
+            < np.minimum(self.prediction_lengths, self.solution_lengths)[:, None]
+        )
+        return np.cumprod(matches, axis=1).sum(axis=1).astype(float)
+
+    @register_method(EVALS)
+    def distance_between_end_nodes(self) -> Float[np.ndarray, "n_mazes"]:
+        rows: Int[np.ndarray, "n_mazes"] = np.arange(len(self))
+        pred_end: Int[np.ndarray, "n_mazes 2"] = self.predictions[
+            rows, np.maximum(self.prediction_lengths - 1, 0)
+        ]
+        sol_end: Int[np.ndarray, "n_mazes 2"] = self.solutions[
+            rows, np.maximum(self.solution_lengths - 1, 0)
+        ]
+        return np.where(
+            self.prediction_lengths <= 1,
+            0.0,
+            np.sqrt(((sol_end - pred_end) ** 2).sum(axis=-1)),
+        )
+
+    @register_method(EVALS)
+    def corner_jumps(self) -> Float[np.ndarray, "n_mazes"]:
+        return (
+            ((np.abs(self.steps) == 1).all(axis=-1) & self.step_mask)
+            .sum(axis=1)
+            .astype(float)
+        )
+
+    @register_method(EVALS)
+    def average_predicted_step_size(self) -> Float[np.ndarray, "n_mazes"]:
+        n_steps: Int[np.ndarray, "n_mazes"] = self.step_mask.sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(
+                n_steps > 0,
+                np.where(self.step_mask, self.step_sizes, 0.0).sum(axis=1) / n_steps,
+                0.0,
+            )
+
+
+def _pad_len(
+    paths: Int[np.ndarray, "n_paths len 2"], length: int
+) -> Int[np.ndarray, "n_paths length 2"]:
+    """zero-pad the length dimension of a padded paths array"""
+    return np.pad(paths, [(0, 0), (0, length - paths.shape[1]), (0, 0)])
+
+
 # TODO: split these up into path evals / rollout evals / etc. see https://github.com/understanding-search/maze-transformer/issues/200
 def rollout_evals(
     predictions: list[str],
@@ -0,0 +1,25 @@
+import os
+import sys
+import traceback
+import typing
+
+
+def run_without_teardown(rank: int, fn: typing.Callable, *args) -> typing.NoReturn:
+    """run `fn(rank, *args)` in a process started by `mp.spawn`, then exit without destroying the process group
+
+    destroying a gloo process group joins its worker threads while holding the GIL. A worker
+    which still has to free the last reference to a tensor created from python needs the GIL
+    for that, so the two deadlock, and no waiting beforehand rules this out. `os._exit` skips
+    the teardown, as well as the interpreter's, which would destroy the group the same way.
+    Exceptions are printed, and exit with code 1
+    """
+    exit_code: int = 0
+    try:
+        fn(rank, *args)
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(exit_code)
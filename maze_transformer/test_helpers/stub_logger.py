@@ -1,7 +1,7 @@
-from maze_transformer.training.wandb_logger import WandbLogger
+from maze_transformer.training.base_logger import BaseLogger
 
 
-class StubLogger(WandbLogger):
+class StubLogger(BaseLogger):
     """Drop-in replacement for the WandbLogger to make it easy to inspect logs during tests (and avoid uploading models and datasets in unit tests)"""
 
     def __init__(self):
@@ -1,6 +1,8 @@
 # Avoid circular import from training/config.py
+import itertools
 from typing import TYPE_CHECKING, Sequence  # need Union as "a" | "b" doesn't work
 
+import numpy as np
 import torch
 from maze_dataset import SPECIAL_TOKENS, LatticeMaze
 from maze_dataset.plotting import MazePlot
@@ -38,6 +40,15 @@ class HuggingMazeTokenizer(PreTrainedTokenizer):
 
     name_or_path = "hugging_maze_tokenizer"
 
+    # kwargs to `__call__` which the fast path knows how to handle
+    _FAST_CALL_KWARGS: set[str] = {
+        "return_tensors",
+        "padding",
+        "truncation",
+        "max_length",
+        "add_special_tokens",
+    }
+
     def apply_overrides(self) -> None:
         """Overwrite class attributes to deal with padding direction issues
 
@@ -97,12 +108,154 @@ class HuggingMazeTokenizer(PreTrainedTokenizer):
         self.eos_token_id: int = self.added_tokens_encoder[self.eos_token]
         self.pad_token_id: int = self.added_tokens_encoder[self.pad_token]
 
+        # lookup tables for the fast encode/decode paths
+        self._decode_arr: NDArray = np.array(
+            [self.added_tokens_decoder[i] for i in range(len(vocab))], dtype=object
+        )
+        self._special_ids_mask: NDArray = np.isin(
+            np.arange(len(vocab)), self.all_special_ids
+        )
+
+    def _encode_fast(self, text: str) -> list[int] | None:
+        """encode a string via dict lookups on the whitespace-split tokens
+
+        tokens which are glued together (i.e. the bos token prepended by TransformerLens)
+        are split with the trie, same as the slow path. returns `None` if a token is not
+        in the vocab, so that the slow path can raise the appropriate error
+        """
+        try:
+            # mapped in C, this is faster than a numpy lookup, which first has to build an
+            # array of the split strings
+            return list(map(self.vocab.__getitem__, text.split()))
+        except KeyError:
+            pass
+        output: list[int] = list()
+        for piece in text.split():
+            idx: int | None = self.vocab.get(piece)
+            if idx is not None:
+                output.append(idx)
+                continue
+            for sub_piece in self.tokens_trie.split(piece):
+                idx = self.vocab.get(sub_piece)
+                if idx is None:
+                    return None
+                output.append(idx)
+        return output
+
+    def _call_fast(
+        self,
+        text: str | list[str],
+        return_tensors: str | None = None,
+        padding: bool | str = False,
+        truncation: bool | str = False,
+        max_length: int | None = None,
+        add_special_tokens: bool = True,
+    ) -> BatchEncoding | None:
+        """fast path for `__call__`, returns `None` for anything it can't handle identically"""
+        is_single: bool = isinstance(text, str)
+        texts: list[str]
+        if is_single:
+            texts = [text]
+        elif (
+            isinstance(text, (list, tuple))
+            and len(text) > 0
+            and all(isinstance(x, str) for x in text)
+        ):
+            texts = list(text)
+        else:
+            return None
+
+        padding = {True: "longest", False: "do_not_pad"}.get(padding, padding)
+        truncation = {True: "longest_first", False: "do_not_truncate"}.get(
+            truncation, truncation
+        )
+        if (
+            return_tensors not in (None, "pt", "np")
+            or padding not in ("longest", "max_length", "do_not_pad")
+            or truncation not in ("longest_first", "only_first", "do_not_truncate")
+        ):
+            return None
+        if max_length is None and (
+            padding == "max_length" or truncation != "do_not_truncate"
+        ):
+            max_length = self.model_max_length
+
+        input_ids: list[list[int]] = list()
+        for x in texts:
+            ids: list[int] | None = self._encode_fast(x)
+            if not ids:
+                # empty sequences are never padded by the slow path
+                return None
+            if truncation != "do_not_truncate" and len(ids) > max_length:
+                ids = (
+                    ids[-max_length:]
+                    if self.truncation_side == "left"
+                    else ids[:max_length]
+                )
+            input_ids.append(ids)
+
+        lengths: NDArray = np.array([len(ids) for ids in input_ids])
+        pad_to: int | None = {
+            "longest": int(lengths.max()),
+            "max_length": max_length,
+            "do_not_pad": None,
+        }[padding]
+        data: dict[str, list | NDArray]
+        if pad_to is None and (lengths != lengths[0]).any():
+            if return_tensors is not None:
+                return None
+            data = {
+                "input_ids": input_ids,
+                "token_type_ids": [[0] * len(ids) for ids in input_ids],
+                "attention_mask": [[1] * len(ids) for ids in input_ids],
+            }
+        else:
+            if pad_to is None:
+                pad_to = int(lengths[0])
+            elif lengths.max() > pad_to:
+                return None
+            # fill the padded rows at once, row-major order matches the concatenated ids
+            start: NDArray = (
+                pad_to - lengths
+                if self.padding_side == "left"
+                else np.zeros_like(lengths)
+            )
+            positions: NDArray = np.arange(pad_to)
+            attention_mask: NDArray = (positions >= start[:, None]) & (
+                positions < (start + lengths)[:, None]
+            )
+            ids_padded: NDArray = np.full(
+                (len(input_ids), pad_to), self.pad_token_id, dtype=np.int64
+            )
+            ids_padded[attention_mask] = np.fromiter(
+                itertools.chain.from_iterable(input_ids),
+                dtype=np.int64,
+                count=lengths.sum(),
+            )
+            data = {
+                "input_ids": ids_padded,
+                "token_type_ids": np.zeros_like(ids_padded),
+                "attention_mask": attention_mask.astype(np.int64),
+            }
+            if return_tensors is None:
+                data = {k: v.tolist() for k, v in data.items()}
+
+        if is_single:
+            data = {k: v[0] for k, v in data.items()}
+        return BatchEncoding(
+            data, tensor_type=return_tensors, prepend_batch_axis=is_single
+        )
+
     def __call__(self, text, **kwargs) -> BatchEncoding:
         """
         Tokenizer will take a list of strings and encode each
         I.e. a single example should be a continuous string
             "a b c d e f" not ["a", "b", "c", "d", "e", "f"]
         """
+        if set(kwargs.keys()) <= self._FAST_CALL_KWARGS:
+            output: BatchEncoding | None = self._call_fast(text, **kwargs)
+            if output is not None:
+                return output
         try:
             return super().__call__(text, **kwargs)
         except (NotImplementedError, ValueError) as e:
@@ -122,6 +275,44 @@ class HuggingMazeTokenizer(PreTrainedTokenizer):
         else:
             raise ValueError(f"Token not in vocab: '{token}'")
 
+    def _ids_to_tokens_fast(self, ids: NDArray) -> NDArray | None:
+        """gather the string tokens for an array of ids, or `None` if any id is out of range"""
+        if ids.size > 0 and (ids.min() < 0 or ids.max() >= len(self._decode_arr)):
+            return None
+        return self._decode_arr[ids]
+
+    def _batch_decode_fast(
+        self,
+        sequences: list[int] | list[list[int]] | ATensor,
+        skip_special_tokens: bool = False,
+    ) -> list[str] | None:
+        """fast path for `batch_decode`, returns `None` if it can't decode identically"""
+        rows: list[NDArray]
+        if isinstance(sequences, torch.Tensor) and sequences.ndim == 2:
+            rows = list(sequences.cpu().numpy())
+        elif isinstance(sequences, (list, tuple)):
+            rows = [
+                x.cpu().numpy() if isinstance(x, torch.Tensor) else np.asarray(x)
+                for x in sequences
+            ]
+        else:
+            return None
+
+        output: list[str] = list()
+        for ids in rows:
+            if ids.ndim != 1 or not np.issubdtype(ids.dtype, np.integer):
+                return None
+            tokens: NDArray | None = self._ids_to_tokens_fast(ids)
+            if tokens is None:
+                return None
+            if skip_special_tokens:
+                tokens = tokens[~self._special_ids_mask[ids]]
+            text: str = " ".join(tokens.tolist())
+            if self.clean_up_tokenization_spaces:
+                text = self.clean_up_tokenization(text)
+            output.append(text)
+        return output
+
     def batch_decode(
         self,
         sequences: list[int] | list[list[int]] | ATensor,
@@ -131,6 +322,12 @@ class HuggingMazeTokenizer(PreTrainedTokenizer):
         if isinstance(sequences, torch.Tensor) and sequences.ndim == 1:
             # Because the slow tokenizer behaves differently to fast ones...
             sequences = sequences.unsqueeze(-1)
+        if not kwargs:
+            output: list[str] | None = self._batch_decode_fast(
+                sequences, skip_special_tokens
+            )
+            if output is not None:
+                return output
         return super().batch_decode(sequences, skip_special_tokens, **kwargs)
 
     def to_ascii(
@@ -147,7 +344,11 @@ class HuggingMazeTokenizer(PreTrainedTokenizer):
             sequence = torch.tensor(sequence)
             assert sequence.ndim == 1, f"Expected 1D sequence, got {sequence.ndim}D"
             sequence = sequence[sequence != self.pad_token_id]
-            str_sequence = self.batch_decode(sequence)
+            str_sequence = self._ids_to_tokens_fast(sequence.cpu().numpy())
+            if str_sequence is None:
+                str_sequence = self.batch_decode(sequence)
+            else:
+                str_sequence = str_sequence.tolist()
 
         lattice_maze = LatticeMaze.from_tokens(str_sequence, self._maze_tokenizer)
         return MazePlot(lattice_maze).to_ascii()
@@ -0,0 +1,127 @@
+import copy
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import torch
+from maze_dataset import MazeDataset
+from muutils.statcounter import StatCounter
+
+from maze_transformer.evaluation.eval_model import evaluate_model
+from maze_transformer.evaluation.path_evals import PathEvalFunction
+from maze_transformer.training.base_logger import BaseLogger
+from maze_transformer.training.checkpointing import snapshot_state_dict
+from maze_transformer.training.config import ConfigHolder, ZanjHookedTransformer
+from maze_transformer.utils.padding import get_padded_fraction
+from maze_transformer.utils.precision import Precision
+
+
+class AsyncEvaluator:
+    """run `evaluate_model` on weight snapshots in a background thread
+
+    the evals run on a separate copy of the model (on `device`, CPU by default), which has
+    the snapshot loaded before every job, so the training loop only pays for copying the
+    weights. Jobs run one at a time in submission order. At most `max_pending` jobs are
+    queued, after which `submit` blocks on the oldest one, to bound the memory held by
+    snapshots.
+
+    results are logged via `logger.log_metric_hist`, together with the `iteration` the
+    snapshot was taken at, from `log_completed` (called by the training loop) and `close`
+    """
+
+    def __init__(
+        self,
+        cfg: ConfigHolder,
+        logger: BaseLogger,
+        val_dataset: MazeDataset,
+        val_dataset_tokens: list[list[str]] | None = None,
+        device: torch.device | str = "cpu",
+        max_pending: int = 2,
+    ) -> None:
+        assert max_pending >= 1, f"max_pending must be at least 1, got {max_pending}"
+        self.cfg: ConfigHolder = cfg
+        self.logger: BaseLogger = logger
+        self.val_dataset: MazeDataset = val_dataset
+        self.val_dataset_tokens: list[list[str]] | None = val_dataset_tokens
+        self.max_pending: int = max_pending
+
+        # the weights are overwritten by every snapshot, so don't consume the training RNG.
+        # built from a copy of `cfg`, so it gets its own tokenizer instead of the one
+        # memoized on `cfg`, which building a model modifies and the training model uses
+        with torch.random.fork_rng(devices=[]):
+            self.eval_model: ZanjHookedTransformer = copy.deepcopy(
+                cfg
+            ).create_model_zanj()
+        assert (
+            self.eval_model.tokenizer.padding_side == "left"
+        ), f"eval model must pad on the left, got {self.eval_model.tokenizer.padding_side}"
+        self.eval_model.to(device)
+        self.eval_model.eval()
+        # fp16 autocast needs CUDA, bf16 has the same memory savings elsewhere
+        self.precision: Precision = (
+            "bf16"
+            if cfg.train_cfg.precision == "fp16" and torch.device(device).type != "cuda"
+            else cfg.train_cfg.precision
+        )
+
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="async_evals"
+        )
+        self._pending: list[Future] = []
+
+    def submit(
+        self,
+        model: torch.nn.Module,
+        iteration: int,
+        eval_functions: dict[str, PathEvalFunction],
+    ) -> None:
+        """snapshot the weights of `model` and queue `eval_functions` to run on them"""
+        while len(self._pending) >= self.max_pending:
+            self._log_result(self._pending.pop(0))
+
+        self._pending.append(
+            self._executor.submit(
+                self._run_evals,
+                snapshot_state_dict(model),
+                iteration,
+                eval_functions,
+            )
+        )
+
+    def _run_evals(
+        self,
+        state_dict: dict[str, torch.Tensor],
+        iteration: int,
+        eval_functions: dict[str, PathEvalFunction],
+    ) -> tuple[int, dict[str, StatCounter | float]]:
+        self.eval_model.load_state_dict(state_dict)
+        padding_stats: dict[str, int] = dict()
+        scores: dict[str, StatCounter] = evaluate_model(
+            model=self.eval_model,
+            dataset=self.val_dataset,
+            dataset_tokens=self.val_dataset_tokens,
+            eval_functions=eval_functions,
+            batch_size=self.cfg.train_cfg.batch_size,
+            max_new_tokens=self.cfg.train_cfg.evals_max_new_tokens,
+            precision=self.precision,
+            padding_stats=padding_stats,
+        )
+        return iteration, {
+            **scores,
+            "eval_pad_fraction": get_padded_fraction(padding_stats),
+        }
+
+    def _log_result(self, future: Future) -> None:
+        iteration, scores = future.result()
+        self.logger.log_metric_hist({"iteration": iteration, **scores})
+
+    def log_completed(self) -> None:
+        """log the results of finished jobs, in submission order"""
+        while self._pending and self._pending[0].done():
+            self._log_result(self._pending.pop(0))
+
+    def close(self) -> None:
+        """wait for all queued jobs, log their results, and stop the worker"""
+        try:
+            while self._pending:
+                self._log_result(self._pending.pop(0))
+        finally:
+            self._executor.shutdown(wait=True, cancel_futures=True)
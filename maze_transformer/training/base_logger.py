@@ -0,0 +1,59 @@
+import abc
+import logging
+import sys
+from pathlib import Path
+from typing import Any, Dict
+
+from muutils.statcounter import StatCounter
+
+
+def setup_logging() -> None:
+    """print `progress` messages to stdout, with timestamps"""
+    logging.basicConfig(
+        stream=sys.stdout,
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+
+
+class BaseLogger(abc.ABC):
+    """interface of the loggers training reports to, see `WandbLogger` and `JSONLLogger`
+
+    each backend has its own `create` classmethod, since they need different things to start
+    a run. `progress` messages go to the python logging module unless overridden, and
+    `close` is called once training is done
+    """
+
+    @abc.abstractmethod
+    def upload_model(self, model_path: Path, aliases=None) -> None:
+        pass
+
+    @abc.abstractmethod
+    def upload_dataset(self, name: str, path: Path) -> None:
+        pass
+
+    @abc.abstractmethod
+    def log_metric(self, data: Dict[str, Any]) -> None:
+        pass
+
+    @abc.abstractmethod
+    def log_metric_hist(self, data: dict[str, float | int | StatCounter]) -> None:
+        pass
+
+    @abc.abstractmethod
+    def summary(self, data: Dict[str, Any]) -> None:
+        pass
+
+    @property
+    @abc.abstractmethod
+    def url(self) -> str:
+        pass
+
+    @staticmethod
+    def progress(message: str) -> None:
+        logging.info(message)
+
+    def close(self) -> None:
+        """write out anything still buffered, nothing to do by default"""
+        pass
@@ -0,0 +1,230 @@
+import atexit
+import copy
+import os
+import random
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import torch
+from zanj import ZANJ
+
+from maze_transformer.training.base_logger import BaseLogger
+from maze_transformer.training.config import ZanjHookedTransformer
+from maze_transformer.training.train_save_files import TRAIN_SAVE_FILES
+
+
+def _snapshot_tensors(obj: Any, cuda_copies: list[bool]) -> Any:
+    """recursively copy the tensors in a nest of dicts, lists and tuples to CPU"""
+    if isinstance(obj, torch.Tensor):
+        obj = obj.detach()
+        if obj.is_cuda:
+            cuda_copies.append(True)
+            return torch.empty(obj.shape, dtype=obj.dtype, pin_memory=True).copy_(
+                obj, non_blocking=True
+            )
+        return obj.to("cpu", copy=True)
+    elif isinstance(obj, dict):
+        return {
+            key: _snapshot_tensors(value, cuda_copies) for key, value in obj.items()
+        }
+    elif isinstance(obj, (list, tuple)):
+        return type(obj)(_snapshot_tensors(value, cuda_copies) for value in obj)
+    else:
+        return copy.deepcopy(obj)
+
+
+def snapshot_tensors(obj: Any) -> Any:
+    """copy all tensors in `obj` (i.e. a state dict) to CPU, so training can keep updating them
+
+    tensors on a GPU are copied into pinned memory asynchronously, with a single
+    synchronization at the end
+    """
+    cuda_copies: list[bool] = []
+    snapshot: Any = _snapshot_tensors(obj, cuda_copies)
+    if cuda_copies:
+        torch.cuda.synchronize()
+    return snapshot
+
+
+def snapshot_state_dict(
+    model: torch.nn.Module,
+) -> dict[str, torch.Tensor]:
+    """copy the weights of `model` to CPU, see `snapshot_tensors`"""
+    return snapshot_tensors(model.state_dict())
+
+
+def get_rng_state() -> dict[str, Any]:
+    """the state of every random number generator used during training"""
+    return dict(
+        python=random.getstate(),
+        numpy=np.random.get_state(),
+        torch=torch.get_rng_state(),
+        cuda=torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+    )
+
+
+def set_rng_state(rng_state: dict[str, Any]) -> None:
+    """restore random number generators from `get_rng_state`"""
+    random.setstate(rng_state["python"])
+    np.random.set_state(rng_state["numpy"])
+    torch.set_rng_state(rng_state["torch"])
+    if rng_state["cuda"] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(rng_state["cuda"])
+
+
+def get_train_state(
+    model: torch.nn.Module,
+    optimizer: torch.optim.Optimizer,
+    iteration: int,
+    sampler_state: dict[str, int] | None = None,
+    scaler: torch.cuda.amp.GradScaler | None = None,
+) -> dict[str, Any]:
+    """everything needed to resume training after `iteration`, see `train(resume_state=...)`
+
+    the raw model state dict is stored here as well, since loading a ZANJ checkpoint
+    processes the weights, which would no longer match the optimizer state
+    """
+    return dict(
+        iteration=iteration,
+        model=model.state_dict(),
+        optimizer=optimizer.state_dict(),
+        scaler=scaler.state_dict() if scaler is not None else None,
+        sampler=sampler_state,
+        rng=get_rng_state(),
+    )
+
+
+def save_train_state(train_state: dict[str, Any], path: Path) -> None:
+    """`torch.save` via a temp file and rename, so a run stopped mid-write leaves no partial file"""
+    path_tmp: Path = path.with_name(f"{path.name}.tmp")
+    torch.save(train_state, path_tmp)
+    os.replace(path_tmp, path)
+
+
+def find_train_state(resume_from: str | Path) -> Path:
+    """find the training state to resume from
+
+    `resume_from` is either a training state file, or a run directory (or its checkpoints
+    directory), in which case the training state with the latest iteration is used
+    """
+    resume_from = Path(resume_from)
+    if resume_from.is_file():
+        return resume_from
+
+    checkpoints_dir: Path = (
+        resume_from / TRAIN_SAVE_FILES.checkpoints
+        if (resume_from / TRAIN_SAVE_FILES.checkpoints).is_dir()
+        else resume_from
+    )
+    train_states: dict[int, Path] = {
+        int(match.group(1)): path
+        for path in checkpoints_dir.glob(TRAIN_SAVE_FILES.train_state_checkpt("*"))
+        if (match := re.fullmatch(r"train_state\.iter_(\d+)\.pt", path.name))
+    }
+    if not train_states:
+        raise FileNotFoundError(
+            f"no training state to resume from found in {checkpoints_dir.as_posix()}"
+        )
+    return train_states[max(train_states)]
+
+
+class AsyncCheckpointWriter:
+    """write ZANJ checkpoints of the model in a background thread
+
+    `save` only snapshots the weights (see `snapshot_state_dict`), the snapshot is then
+    loaded into a CPU copy of the model (created from its config on the first save) which is written with `zanj.save` and uploaded
+    via `logger.upload_model`, so the files are the same as saving the model directly.
+    Writes happen one at a time in submission order. At most `max_in_flight` saves are
+    queued, after which `save` blocks on the oldest one.
+
+    if a `train_state` (see `get_train_state`) is passed to `save`, it is snapshotted
+    the same way and written to `train_state_path` with `save_train_state`
+
+    `flush` waits for all queued saves, and is also called on interpreter exit, so
+    checkpoints are not lost if training stops early
+    """
+
+    def __init__(
+        self,
+        logger: BaseLogger,
+        zanj: ZANJ | None = None,
+        max_in_flight: int = 2,
+    ) -> None:
+        assert (
+            max_in_flight >= 1
+        ), f"max_in_flight must be at least 1, got {max_in_flight}"
+        self.logger: BaseLogger = logger
+        self.zanj: ZANJ = zanj if zanj is not None else ZANJ()
+        self.max_in_flight: int = max_in_flight
+
+        self.cpu_model: ZanjHookedTransformer | None = None
+
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="async_checkpoints"
+        )
+        self._in_flight: list[Future] = []
+        atexit.register(self.close)
+
+    def save(
+        self,
+        model: ZanjHookedTransformer,
+        path: Path,
+        aliases: list[str] | None = None,
+        train_state: dict[str, Any] | None = None,
+        train_state_path: Path | None = None,
+    ) -> None:
+        """snapshot `model` (and `train_state`) and queue writing it to `path`"""
+        assert (train_state is None) == (
+            train_state_path is None
+        ), "train_state and train_state_path must be given together"
+        while len(self._in_flight) >= self.max_in_flight:
+            self._in_flight.pop(0).result()
+
+        if self.cpu_model is None:
+            # the weights are overwritten by every snapshot, so don't consume the training RNG
+            with torch.random.fork_rng(devices=[]):
+                self.cpu_model = model.zanj_model_config.create_model_zanj()
+
+        self._in_flight.append(
+            self._executor.submit(
+                self._write,
+                snapshot_state_dict(model),
+                copy.deepcopy(model.training_records),
+                path,
+                aliases,
+                snapshot_tensors(train_state),
+                train_state_path,
+            )
+        )
+
+    def _write(
+        self,
+        state_dict: dict[str, torch.Tensor],
+        training_records: dict | None,
+        path: Path,
+        aliases: list[str] | None,
+        train_state: dict[str, Any] | None,
+        train_state_path: Path | None,
+    ) -> None:
+        if train_state is not None:
+            save_train_state(train_state, train_state_path)
+        self.cpu_model.load_state_dict(state_dict)
+        self.cpu_model.training_records = training_records
+        self.zanj.save(self.cpu_model, path)
+        self.logger.upload_model(path, aliases=aliases)
+
+    def flush(self) -> None:
+        """wait for all queued saves to be written, raising any error from the writer"""
+        while self._in_flight:
+            self._in_flight.pop(0).result()
+
+    def close(self) -> None:
+        """flush, and stop the writer thread"""
+        atexit.unregister(self.close)
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
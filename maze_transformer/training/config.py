@@ -105,12 +105,39 @@ class TrainConfig(SerializableDataclass):
     - `name: str`: name of the training configuration
     - `optimizer: Type[torch.optim.Optimizer]`: optimizer class to use
     - `optimizer_kwargs: dict[str, Any]`: kwargs to pass to the optimizer
-    - `batch_size: int`: batch size
+    - `batch_size: int`: batch size of every forward/backward pass (the micro-batch)
+    - `grad_accumulation_steps: int`: how many micro-batches to accumulate gradients over before
+        each optimizer step, so the optimizer batch is `effective_batch_size = batch_size * grad_accumulation_steps`
     - `dataloader_cfg: dict`: kwargs to pass to the dataloader
-    - `intervals: dict[str, int]`: intervals at which to perform certain actions:
-        "print_loss", "checkpoint", "eval_fast", "eval_slow"
+    - `intervals: dict[str, int]`: intervals (in samples) at which to perform certain actions:
+        "print_loss", "checkpoint", "eval_fast", "eval_slow". `get_intervals` converts these to optimizer steps
     - `intervals_count: dict[str, int]`: how many of each action to do over the course of the training run
     - `evals_max_new_tokens: int`: how many new tokens to generate during evaluation
+    - `teacher_forced_evals: bool`: whether to compute teacher-forced path metrics from the
+        training logits at every step, see `evaluate_logits`
+    - `precision: str`: one of "fp32", "bf16" or "fp16". For the latter two, the forward pass and
+        eval generation run under `torch.autocast`, and fp16 uses a `GradScaler` (CUDA only)
+    - `async_evals: bool`: whether to run the `eval_fast`/`eval_slow` evals on a snapshot of the
+        weights in a background thread, instead of blocking the training loop, see `AsyncEvaluator`.
+        The scores are logged once they are done, tagged with the `iteration` they belong to, so
+        they land on a later wandb step. `WandbLogger` plots them against `iteration` instead
+    - `async_checkpoints: bool`: whether to write checkpoints in a background thread from a
+        snapshot of the weights, instead of blocking the training loop, see `AsyncCheckpointWriter`
+    - `compile_backend: str|None`: if given (i.e. "inductor"), the `torch.compile` backend for the
+        training step (see `LeftPaddedForward`, batches are padded as for `padding_mode="bucket"`)
+        and the decoding step of the synchronous evals
+    - `padding_mode: str`: how training batches are padded, one of
+        - "longest": to the longest maze in the batch, with the loss of `HookedTransformer`,
+            which includes predicting the padding
+        - "bucket": to the next multiple of `PADDING_BUCKET_SIZE` tokens (at most `seq_len_max`),
+            so there are only a few distinct batch shapes
+        - "length_class": as for "bucket", but batches are drawn from mazes of similar length
+            by a `LengthGroupedSampler`, so they need little padding
+
+        for the latter two the loss ignores padding, see `next_token_loss_ignore_padding`.
+        The number of tokens per batch and the fraction of padding are logged in any case
+    - `path_only_loss: bool`: whether the training loss only covers the path tokens (after
+        `PATH_START`), which is what the evals measure, rather than every token. See `path_token_loss`
     - `validation_dataset_cfg: None|int|GPTDatasetConfig`: validation dataset
         - if `None`, evals are disabled
         - if `int`, a dataset of that size is created by sampling from the training dataset using `torch.utils.data.random_split`
@@ -128,6 +155,34 @@ class TrainConfig(SerializableDataclass):
         default=None,
         loading_fn=lambda data: data.get("validation_dataset_cfg", None),
     )
+    teacher_forced_evals: bool = serializable_field(
+        default=False,
+        loading_fn=lambda data: data.get("teacher_forced_evals", False),
+    )
+    precision: str = serializable_field(
+        default="fp32",
+        loading_fn=lambda data: data.get("precision", "fp32"),
+    )
+    async_evals: bool = serializable_field(
+        default=False,
+        loading_fn=lambda data: data.get("async_evals", False),
+    )
+    async_checkpoints: bool = serializable_field(
+        default=False,
+        loading_fn=lambda data: data.get("async_checkpoints", False),
+    )
+    compile_backend: str | None = serializable_field(
+        default=None,
+        loading_fn=lambda data: data.get("compile_backend", None),
+    )
+    padding_mode: str = serializable_field(
+        default="longest",
+        loading_fn=lambda data: data.get("padding_mode", "longest"),
+    )
+    path_only_loss: bool = serializable_field(
+        default=False,
+        loading_fn=lambda data: data.get("path_only_loss", False),
+    )
 
     optimizer: Type[torch.optim.Optimizer] = serializable_field(  # type: ignore
         default_factory=lambda: torch.optim.RMSprop,
@@ -145,6 +200,16 @@ class TrainConfig(SerializableDataclass):
 
     batch_size: int = serializable_field(default=128)
 
+    grad_accumulation_steps: int = serializable_field(
+        default=1,
+        loading_fn=lambda data: data.get("grad_accumulation_steps", 1),
+    )
+
+    @property
+    def effective_batch_size(self) -> int:
+        """number of samples per optimizer step"""
+        return self.batch_size * self.grad_accumulation_steps
+
     dataloader_cfg: dict = serializable_field(  # type: ignore
         default_factory=lambda: dict(
             shuffle=True,
@@ -171,8 +236,13 @@ class TrainConfig(SerializableDataclass):
         dataset_n_samples: int | None = None,
         use_defaults_if_missing: bool = True,
         mod_batch_size: bool = True,
+        world_size: int = 1,
     ) -> dict[str, int | float]:
-        """get the intervals"""
+        """get the intervals
+
+        with `mod_batch_size`, the intervals are in optimizer steps, each of which consumes
+        `effective_batch_size` samples on each of the `world_size` data-parallel processes
+        """
 
         # handle the case where both are missing
         if (self.intervals is None) and (self.intervals_count is None):
@@ -232,10 +302,10 @@ class TrainConfig(SerializableDataclass):
             if k not in intervals_new:
                 raise ValueError(f"missing key {k} in {intervals_new = }")
 
-        # actually return the intervals
+        # actually return the intervals, in optimizer steps
         if mod_batch_size:
             return {
-                k: max(1, v // self.batch_size)
+                k: max(1, v // (self.effective_batch_size * world_size))
                 if isinstance(v, int)
                 else v  # if float, leave it as is since its float("inf")
                 for k, v in intervals_new.items()
@@ -250,6 +320,7 @@ class TrainConfig(SerializableDataclass):
             optimizer=self.optimizer.__name__,
             optimizer_kwargs=self.optimizer_kwargs,
             batch_size=self.batch_size,
+            grad_accumulation_steps=self.grad_accumulation_steps,
             dataloader_cfg=self.dataloader_cfg,
             intervals=self.intervals,
             intervals_count=self.intervals_count,
@@ -262,6 +333,13 @@ class TrainConfig(SerializableDataclass):
                 )
                 else self.validation_dataset_cfg.summary()
             ),
+            teacher_forced_evals=self.teacher_forced_evals,
+            precision=self.precision,
+            async_evals=self.async_evals,
+            async_checkpoints=self.async_checkpoints,
+            compile_backend=self.compile_backend,
+            padding_mode=self.padding_mode,
+            path_only_loss=self.path_only_loss,
         )
 
 
@@ -436,6 +514,9 @@ class ConfigHolder(SerializableDataclass):
         self.maze_tokenizer.clear_cache()
 
     def __post_init__(self):
+        # cache for the tokenizer built by the `tokenizer` property, see `_tokenizer_cache_key`
+        self._tokenizer_cached: tuple[tuple, PreTrainedTokenizer] | None = None
+
         # fallback to default maze tokenizer if no kwargs are provided
         if self.pretrainedtokenizer_kwargs is None:
             if self.maze_tokenizer is None:
@@ -468,27 +549,54 @@ class ConfigHolder(SerializableDataclass):
     def seed(self) -> int:
         return self.dataset_cfg.seed
 
+    def _tokenizer_cache_key(self) -> tuple:
+        """everything the tokenizer is built from -- if this changes, the cached tokenizer is stale"""
+        return (
+            json.dumps(self.pretrainedtokenizer_kwargs),
+            (
+                json.dumps(self.maze_tokenizer.serialize())
+                if self.maze_tokenizer is not None
+                else None
+            ),
+            self.dataset_cfg.seq_len_max,
+        )
+
     @property
     def tokenizer(self) -> PreTrainedTokenizer:
-        """get a tokenizer via a pretrainedtokenizer_kwargs, or a hugging maze tokenizer"""
-        if self._tokenizer is None:
-            if self.pretrainedtokenizer_kwargs is not None:
-                return PreTrainedTokenizer(**self.pretrainedtokenizer_kwargs)
-            elif self.maze_tokenizer is not None:
-                return HuggingMazeTokenizer(
-                    seq_len_max=self.dataset_cfg.seq_len_max,
-                    maze_tokenizer=self.maze_tokenizer,
-                    name_or_path=(
-                        "hugging_maze_tokenizer"
-                        if self.maze_tokenizer is None
-                        else f"hugging_maze_tokenizer{self.maze_tokenizer.name}"
-                    ),
-                )
-            else:
-                raise ValueError("no tokenizer specified")
-        else:
+        """get a tokenizer via a pretrainedtokenizer_kwargs, or a hugging maze tokenizer
+
+        the tokenizer is built once and cached, and only rebuilt if `pretrainedtokenizer_kwargs`,
+        `maze_tokenizer`, or `dataset_cfg.seq_len_max` change (i.e. via `update_from_nested_dict`)
+        """
+        if self._tokenizer is not None:
             return self._tokenizer
 
+        cache_key: tuple = self._tokenizer_cache_key()
+        if (
+            self._tokenizer_cached is not None
+            and self._tokenizer_cached[0] == cache_key
+        ):
+            return self._tokenizer_cached[1]
+
+        tokenizer: PreTrainedTokenizer
+        if self.pretrainedtokenizer_kwargs is not None:
+            tokenizer = PreTrainedTokenizer(**self.pretrainedtokenizer_kwargs)
+        elif self.maze_tokenizer is not None:
+            tokenizer = HuggingMazeTokenizer(
+                seq_len_max=self.dataset_cfg.seq_len_max,
+                maze_tokenizer=self.maze_tokenizer,
+                name_or_path=(
+                    "hugging_maze_tokenizer"
+                    if self.maze_tokenizer is None
+                    else f"hugging_maze_tokenizer{self.maze_tokenizer.name}"
+                ),
+            )
+        else:
+            raise ValueError("no tokenizer specified")
+
+        self._tokenizer_cached = (cache_key, tokenizer)
+        return tokenizer
+
     @cached_property
     def hooked_transformer_cfg(self) -> HookedTransformerConfig:
         return HookedTransformerConfig(
@@ -508,9 +616,12 @@ class ConfigHolder(SerializableDataclass):
         return self.hooked_transformer_cfg
 
     def create_model(self) -> HookedTransformer:
+        # the tokenizer is shared, so keep its padding side rather than letting
+        # `HookedTransformer.__init__` reset it for every other model from this config
         return HookedTransformer(
             cfg=self.hooked_transformer_cfg,
             tokenizer=self.tokenizer,
+            default_padding_side=self.tokenizer.padding_side,
         )
 
     def create_model_zanj(self) -> ZanjHookedTransformer:
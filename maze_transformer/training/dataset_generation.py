@@ -0,0 +1,206 @@
+import multiprocessing
+import multiprocessing.pool
+import os
+import shutil
+import time
+import typing
+from pathlib import Path
+
+import numpy as np
+from jaxtyping import Bool, Int
+from maze_dataset import MazeDataset, MazeDatasetConfig, SolvedMaze
+
+from maze_transformer.training.streaming_dataset import generate_solved_maze
+
+# appended to `cfg.to_fname()` for the datasets saved by `generate_datasets`, see there
+GENERATED_FNAME_SUFFIX: str = "-indexseeded"
+
+
+def generated_dataset_fname(cfg: MazeDatasetConfig) -> str:
+    """name (without extension) of the dataset for `cfg` saved by `generate_datasets`"""
+    return f"{cfg.to_fname()}{GENERATED_FNAME_SUFFIX}"
+
+
+def read_generated_dataset(
+    cfg: MazeDatasetConfig,
+    local_base_path: str | Path,
+) -> MazeDataset | None:
+    """the dataset for `cfg` saved in `local_base_path` by `generate_datasets`, if there is one"""
+    dataset_path: Path = Path(local_base_path) / f"{generated_dataset_fname(cfg)}.zanj"
+    if not dataset_path.exists():
+        return None
+    return MazeDataset.read(dataset_path)
+
+
+def _chunk_path(chunks_dir: Path, start: int) -> Path:
+    return chunks_dir / f"chunk_{start:012d}.npz"
+
+
+def _write_chunk(path: Path, mazes: list[SolvedMaze]) -> None:
+    """save `mazes` as their stacked connection lists and concatenated solutions, and their generation metadata"""
+    solutions: list[np.ndarray] = [maze.solution for maze in mazes]
+    generation_meta: np.ndarray = np.empty(len(mazes), dtype=object)
+    generation_meta[:] = [maze.generation_meta for maze in mazes]
+    tmp_path: Path = path.with_suffix(".tmp.npz")
+    np.savez(
+        tmp_path,
+        connection_lists=np.stack([maze.connection_list for maze in mazes]),
+        solutions=np.concatenate(solutions),
+        offsets=np.cumsum([0] + [len(x) for x in solutions]),
+        generation_meta=generation_meta,
+    )
+    # so an interrupted write never leaves a chunk which looks complete
+    os.replace(tmp_path, path)
+
+
+def _read_chunk(path: Path) -> list[SolvedMaze]:
+    # the generation metadata is pickled, chunks are only ever written by `_write_chunk`
+    with np.load(path, allow_pickle=True) as data:
+        connection_lists: Bool[np.ndarray, "n lattice_dim x y"] = data[
+            "connection_lists"
+        ]
+        solutions: Int[np.ndarray, "n_coords 2"] = data["solutions"]
+        offsets: Int[np.ndarray, "n+1"] = data["offsets"]
+        generation_meta: np.ndarray = data["generation_meta"]
+    return [
+        SolvedMaze(
+            connection_list=connection_list,
+            solution=solutions[offsets[i] : offsets[i + 1]],
+            generation_meta=generation_meta[i],
+        )
+        for i, connection_list in enumerate(connection_lists)
+    ]
+
+
+def _generate_chunk(
+    args: tuple[MazeDatasetConfig, int, int, Path],
+) -> tuple[Path, int]:
+    """generate mazes `start` to `stop` of `cfg` and write them to `path`, in a pool worker"""
+    cfg, start, stop, path = args
+    _write_chunk(
+        path, [generate_solved_maze(cfg, cfg.seed, i) for i in range(start, stop)]
+    )
+    return path, stop - start
+
+
+def generate_datasets(
+    cfgs: typing.Sequence[MazeDatasetConfig],
+    local_base_path: str | Path,
+    n_workers: int | None = None,
+    chunk_size: int = 1024,
+    progress: typing.Callable[[str], None] | None = None,
+) -> list[MazeDataset]:
+    """get the datasets for `cfgs` from `local_base_path`, generating the missing ones together in a process pool
+
+    each missing dataset is split into chunks of `chunk_size` mazes, and the chunks of all
+    of them are generated by the same pool of `n_workers` processes (all cpus by default, no
+    pool if 1). Maze `i` of a dataset only depends on its seed and `i` (see
+    `generate_solved_maze`), so the result doesn't depend on `n_workers` or `chunk_size`
+
+    these are not the mazes `MazeDataset.generate` gives for the same config: it draws every
+    maze from a single random stream (or one per process when parallel), which can't be
+    split up. So the datasets are saved as `generated_dataset_fname(cfg)`, rather than
+    where `MazeDataset.from_config` reads and writes them, and only this function reads
+    them back (or `read_generated_dataset`). A dataset generated here is only reproduced by
+    generating it here again
+
+    finished chunks are written to a `<fname>.chunks` directory as they come in, and chunks
+    already there are reused, so an interrupted generation picks up where it stopped. Once
+    a dataset is complete, its filters are applied (including collecting the generation
+    metadata, if configured), it is saved, and the chunks are removed. The throughput in
+    mazes/sec is passed to `progress`. A config given more than once is generated once, and
+    the same dataset is returned for each
+    """
+    local_base_path = Path(local_base_path)
+    local_base_path.mkdir(parents=True, exist_ok=True)
+    progress = progress if progress is not None else lambda msg: None
+
+    datasets: list[MazeDataset | None] = [None for _ in cfgs]
+    # a config given more than once (i.e. validation the same as training) is only read or
+    # generated at its first index, and the same dataset is returned for the others
+    first_index: dict[str, int] = dict()
+    chunk_paths: dict[int, list[Path]] = dict()
+    tasks: list[tuple[MazeDatasetConfig, int, int, Path]] = list()
+    for i, cfg in enumerate(cfgs):
+        if generated_dataset_fname(cfg) in first_index:
+            continue
+        first_index[generated_dataset_fname(cfg)] = i
+        datasets[i] = read_generated_dataset(cfg, local_base_path)
+        if datasets[i] is not None:
+            continue
+        chunks_dir: Path = local_base_path / f"{generated_dataset_fname(cfg)}.chunks"
+        chunks_dir.mkdir(exist_ok=True)
+        chunk_paths[i] = list()
+        for start in range(0, cfg.n_mazes, chunk_size):
+            path: Path = _chunk_path(chunks_dir, start)
+            chunk_paths[i].append(path)
+            if not path.exists():
+                tasks.append((cfg, start, min(start + chunk_size, cfg.n_mazes), path))
+
+    if tasks:
+        n_mazes: int = sum(stop - start for _, start, stop, _ in tasks)
+        n_workers = min(n_workers or os.cpu_count() or 1, len(tasks))
+        progress(
+            f"generating {n_mazes} mazes for {len(chunk_paths)} datasets in {len(tasks)} chunks with {n_workers} processes"
+        )
+        start_time: float = time.perf_counter()
+        n_done: int = 0
+        pool: multiprocessing.pool.Pool | None = (
+            multiprocessing.Pool(n_workers) if n_workers > 1 else None
+        )
+        try:
+            results: typing.Iterable[tuple[Path, int]] = (
+                pool.imap_unordered(_generate_chunk, tasks)
+                if pool is not None
+                else map(_generate_chunk, tasks)
+            )
+            for _, n_chunk_mazes in results:
+                n_done += n_chunk_mazes
+                elapsed: float = time.perf_counter() - start_time
+                progress(
+                    f"generated {n_done}/{n_mazes} mazes, {n_done / elapsed:.1f} mazes/sec"
+                )
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+    for i, paths in chunk_paths.items():
+        # a copy, like `MazeDataset.generate`, since filters update the config
+        cfg: MazeDatasetConfig = MazeDatasetConfig.load(cfgs[i].serialize())
+        dataset: MazeDataset = MazeDataset(
+            cfg=cfg,
+            mazes=[maze for path in paths for maze in _read_chunk(path)],
+        )._apply_filters_from_config()
+        dataset.save(local_base_path / f"{generated_dataset_fname(cfgs[i])}.zanj")
+        shutil.rmtree(local_base_path / f"{generated_dataset_fname(cfgs[i])}.chunks")
+        datasets[i] = dataset
+    return [datasets[first_index[generated_dataset_fname(cfg)]] for cfg in cfgs]
+
+
+def split_validation_dataset(
+    dataset: MazeDataset,
+    n_validation: int,
+) -> tuple[MazeDataset, MazeDataset]:
+    """split the last `n_validation` mazes of `dataset` off into a validation dataset
+
+    both datasets get their own copy of the config, with `n_mazes` updated, so neither
+    `dataset.cfg` nor a config shared with it is modified
+    """
+    assert len(dataset) > n_validation, (
+        f"{n_validation = } "
+        + f"is greater than the length of the training dataset: {len(dataset) = }"
+    )
+    n_train: int = len(dataset) - n_validation
+    output: list[MazeDataset] = list()
+    for mazes in (dataset.mazes[:n_train], dataset.mazes[n_train:]):
+        cfg: MazeDatasetConfig = MazeDatasetConfig.load(dataset.cfg.serialize())
+        cfg.n_mazes = len(mazes)
+        output.append(
+            MazeDataset(
+                cfg,
+                mazes=mazes,
+                generation_metadata_collected=dataset.generation_metadata_collected,
+            )
+        )
+    return output[0], output[1]
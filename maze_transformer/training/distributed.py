@@ -0,0 +1,136 @@
+import os
+import typing
+
+import torch
+import torch.distributed as dist
+from maze_dataset import MazeDataset
+from muutils.statcounter import StatCounter
+
+from maze_transformer.training.base_logger import BaseLogger
+
+
+def init_distributed(backend: str | None = None) -> bool:
+    """initialize the default process group from the environment set by `torchrun`
+
+    does nothing (and returns `False`) unless `WORLD_SIZE` is set to more than 1. The
+    backend defaults to nccl if CUDA is available, and gloo (which works on CPU) otherwise
+    """
+    if dist.is_initialized():
+        return True
+    if int(os.environ.get("WORLD_SIZE", 1)) <= 1:
+        return False
+    if backend is None:
+        backend = "nccl" if torch.cuda.is_available() else "gloo"
+    dist.init_process_group(backend=backend)
+    return True
+
+
+def is_distributed() -> bool:
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank() -> int:
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size() -> int:
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process() -> bool:
+    """only the main process (rank 0) writes files and logs to wandb"""
+    return get_rank() == 0
+
+
+def get_distributed_device() -> torch.device:
+    """the device for this process: `cuda:LOCAL_RANK` if CUDA is available, otherwise the CPU"""
+    if torch.cuda.is_available():
+        return torch.device("cuda", int(os.environ.get("LOCAL_RANK", 0)))
+    return torch.device("cpu")
+
+
+def barrier() -> None:
+    if is_distributed():
+        dist.barrier()
+
+
+def broadcast_object(obj: typing.Any) -> typing.Any:
+    """send `obj` from the main process to every process"""
+    if not is_distributed():
+        return obj
+    objects: list[typing.Any] = [obj]
+    dist.broadcast_object_list(objects, src=0)
+    return objects[0]
+
+
+def all_reduce_mean(value: float) -> float:
+    """mean of a scalar across processes"""
+    if not is_distributed():
+        return value
+    tensor: torch.Tensor = torch.tensor(
+        [value],
+        dtype=torch.float64,
+        device=get_distributed_device() if dist.get_backend() == "nccl" else "cpu",
+    )
+    dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return float(tensor.item()) / get_world_size()
+
+
+def reduce_stat_counters(scores: dict[str, StatCounter]) -> dict[str, StatCounter]:
+    """merge the `StatCounter`s computed by each process on its shard, on every process"""
+    if not is_distributed():
+        return scores
+    gathered: list[dict[str, StatCounter] | None] = [None] * get_world_size()
+    dist.all_gather_object(gathered, scores)
+    reduced: dict[str, StatCounter] = {key: StatCounter() for key in scores}
+    for process_scores in gathered:
+        for key, value in process_scores.items():
+            reduced.setdefault(key, StatCounter()).update(value)
+    return reduced
+
+
+def shard_dataset(
+    dataset: MazeDataset,
+    dataset_tokens: list[list[str]] | None = None,
+) -> tuple[MazeDataset, list[list[str]] | None]:
+    """the mazes (and their tokens, if given) this process evaluates: every `world_size`-th one"""
+    if not is_distributed():
+        return dataset, dataset_tokens
+    rank, world_size = get_rank(), get_world_size()
+    return (
+        MazeDataset(
+            dataset.cfg,
+            mazes=dataset.mazes[rank::world_size],
+            generation_metadata_collected=dataset.generation_metadata_collected,
+        ),
+        dataset_tokens[rank::world_size] if dataset_tokens is not None else None,
+    )
+
+
+class NonMainProcessLogger(BaseLogger):
+    """logger for processes other than the main one: progress is printed with the rank, everything else is dropped"""
+
+    def __init__(self):
+        self.rank: int = get_rank()
+
+    def upload_model(self, *args, **kwargs) -> None:
+        pass
+
+    def upload_dataset(self, *args, **kwargs) -> None:
+        pass
+
+    def log_metric(self, *args, **kwargs) -> None:
+        pass
+
+    def log_metric_hist(self, *args, **kwargs) -> None:
+        pass
+
+    def summary(self, *args, **kwargs) -> None:
+        pass
+
+    def progress(self, message: str) -> None:
+        super().progress(f"[rank {self.rank}] {message}")
+
+    @property
+    def url(self) -> str:
+        return f"not logged from rank {self.rank}"
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+from enum import Enum
+from pathlib import Path
+from typing import Any, Dict
+
+from muutils.json_serialize import json_serialize
+from muutils.statcounter import StatCounter
+
+from maze_transformer.training.base_logger import BaseLogger, setup_logging
+from maze_transformer.training.train_save_files import TRAIN_SAVE_FILES
+
+
+def _serialize_record(record: dict[str, Any]) -> str:
+    """one line of the log. `StatCounter`s are kept whole, with their summary"""
+    if record["type"] == "metric":
+        record = dict(
+            record,
+            data={
+                key: value.serialize() if isinstance(value, StatCounter) else value
+                for key, value in record["data"].items()
+            },
+        )
+    return json.dumps(json_serialize(record))
+
+
+class JSONLLogger(BaseLogger):
+    """logs locally to a `log.jsonl` file in the run directory, no network needed
+
+    every call appends a record `{"type": ..., "time": ..., ...}` to a queue, and a
+    background thread writes them out in batches: whatever has been queued within
+    `flush_interval` seconds of the first record of a batch, up to `max_batch_size`
+    records. Training only pays for putting a record on the queue, serializing (including
+    the `StatCounter` summaries) happens on the writer thread. The record types are:
+
+    - `config`: the config, project and job type of the run, from `create`
+    - `metric`: `data` from `log_metric` or `log_metric_hist`, with a `step` counting the
+      metric records like wandb does. `StatCounter`s are saved whole (see
+      `StatCounter.serialize`), not just their mean
+    - `summary`: `data` passed to `summary`
+    - `progress`: a progress `message`, which is also logged as usual
+    - `model` and `dataset`: the `path` of an uploaded artifact, which is not copied
+
+    records are appended, so a resumed run continues the same log. Call `close` to write
+    out everything still queued, it is also called at exit
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        flush_interval: float = 1.0,
+        max_batch_size: int = 1024,
+    ) -> None:
+        self.path: Path = Path(path)
+        self.flush_interval: float = flush_interval
+        self.max_batch_size: int = max_batch_size
+        self._step: int = 0
+        self._lock: threading.RLock = threading.RLock()
+        self._queue: queue.Queue[dict | None] = queue.Queue()
+        self._closed: bool = False
+        self._thread: threading.Thread = threading.Thread(
+            target=self._write_loop, name="JSONLLogger", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    @classmethod
+    def create(
+        cls,
+        config: Dict,
+        project: Enum | str,
+        job_type: Enum | str,
+        output_dir: str | Path,
+        **kwargs,
+    ) -> JSONLLogger:
+        """log to `output_dir / TRAIN_SAVE_FILES.log`, `kwargs` are passed to `__init__`"""
+        setup_logging()
+        logger: JSONLLogger = cls(Path(output_dir) / TRAIN_SAVE_FILES.log, **kwargs)
+        logger._put(
+            "config",
+            config=config,
+            project=project.value if isinstance(project, Enum) else project,
+            job_type=job_type.value if isinstance(job_type, Enum) else job_type,
+        )
+        logger.progress(f"logging to {logger.path.as_posix()}")
+        return logger
+
+    def _put(self, record_type: str, **fields) -> None:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"can't log to closed {self.__class__.__name__}")
+            self._queue.put(dict(type=record_type, time=time.time(), **fields))
+
+    def _write_loop(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a") as f:
+            done: bool = False
+            while not done:
+                batch: list[dict] = list()
+                record: dict | None = self._queue.get()
+                deadline: float = time.monotonic() + self.flush_interval
+                while record is not None:
+                    batch.append(record)
+                    timeout: float = deadline - time.monotonic()
+                    if len(batch) >= self.max_batch_size or timeout <= 0:
+                        break
+                    try:
+                        record = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                # `None` is put by `close`, after the last record
+                done = record is None
+                if batch:
+                    f.write("".join(_serialize_record(r) + "\n" for r in batch))
+                    f.flush()
+
+    def upload_model(self, model_path: Path, aliases=None) -> None:
+        self._put("model", path=Path(model_path).as_posix(), aliases=aliases)
+
+    def upload_dataset(self, name: str, path: Path) -> None:
+        self._put("dataset", name=name, path=Path(path).as_posix())
+
+    def log_metric(self, data: Dict[str, Any]) -> None:
+        self.log_metric_hist(data)
+
+    def log_metric_hist(self, data: dict[str, float | int | StatCounter]) -> None:
+        # evals are logged from their own thread, so the steps need a lock
+        with self._lock:
+            # copied, since it is only serialized later on
+            self._put("metric", step=self._step, data=dict(data))
+            self._step += 1
+
+    def summary(self, data: Dict[str, Any]) -> None:
+        self._put("summary", data=data)
+
+    def progress(self, message: str) -> None:
+        logging.info(message)
+        self._put("progress", message=message)
+
+    @property
+    def url(self) -> str:
+        return self.path.absolute().as_posix()
+
+    def close(self) -> None:
+        """write out everything queued, and stop the writer thread. Further logging raises"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+        atexit.unregister(self.close)
@@ -0,0 +1,46 @@
+import torch
+import torch.nn.functional as F
+from jaxtyping import Bool, Float, Int
+
+
+def next_token_loss_ignore_padding(
+    logits: Float[torch.Tensor, "batch pos d_vocab"],
+    tokens: Int[torch.Tensor, "batch pos"],
+    padding_idx: int,
+) -> Float[torch.Tensor, ""]:
+    """mean next-token cross-entropy, over the positions where neither the token nor the next one is padding
+
+    unlike `HookedTransformer.loss_fn`, nothing is predicted from or for the padding of
+    left-padded sequences, so the loss doesn't depend on how much a batch was padded
+    """
+    tokens = tokens.to(logits.device)
+    targets: Int[torch.Tensor, "batch pos-1"] = tokens[:, 1:].masked_fill(
+        tokens[:, :-1] == padding_idx, padding_idx
+    )
+    return F.cross_entropy(
+        logits[:, :-1, :].flatten(0, 1),
+        targets.flatten(),
+        ignore_index=padding_idx,
+    )
+
+
+def path_token_loss(
+    logits: Float[torch.Tensor, "batch pos d_vocab"],
+    tokens: Int[torch.Tensor, "batch pos"],
+    path_mask: Bool[torch.Tensor, "batch pos-1"],
+) -> Float[torch.Tensor, ""]:
+    """mean next-token cross-entropy over the path tokens only
+
+    `path_mask` marks which targets `tokens[:, 1:]` count, see `get_path_target_mask`. The
+    logits of those positions are gathered first, so the log-softmax only runs on them
+    rather than on every position of the sequence. Without any path tokens in the batch, the
+    loss is zero (with zero gradients), rather than the NaN mean over no tokens
+    """
+    batch_idx, pos_idx = path_mask.to(logits.device).nonzero(as_tuple=True)
+    if batch_idx.numel() == 0:
+        # still connected to the graph, so that backward (and DDP) see every parameter
+        return logits.sum() * 0
+    return F.cross_entropy(
+        logits[batch_idx, pos_idx],
+        tokens.to(logits.device)[batch_idx, pos_idx + 1],
+    )
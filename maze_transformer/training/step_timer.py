@@ -0,0 +1,111 @@
+import contextlib
+import sys
+import time
+import typing
+
+import torch
+
+# sections of a training step timed by `StepTimer`, in the order they happen
+STEP_SECTIONS: tuple[str, ...] = (
+    "data_wait",
+    "forward",
+    "backward",
+    "optimizer",
+    "eval",
+    "checkpoint",
+)
+
+
+def get_peak_memory_mb(device: torch.device) -> float | None:
+    """peak memory since the last call: allocated by torch on a CUDA `device`, otherwise the
+    peak RSS of the process (which is never reset). `None` if neither is available"""
+    if device.type == "cuda":
+        peak: int = torch.cuda.max_memory_allocated(device)
+        torch.cuda.reset_peak_memory_stats(device)
+        return peak / 2**20
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return max_rss / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+class StepTimer:
+    """time the sections of the training loop, and aggregate them between calls to `summary`
+
+    wrap each section in `with timer.section(name)`, or `add` a duration measured
+    elsewhere. On CUDA the device is synchronized at the end of every section, since
+    kernels run asynchronously and would otherwise be attributed to whichever section
+    happens to wait on them. Iterate over the dataloader via `time_iterator` to time
+    waiting for data. Count the samples and (non-padding) tokens of each micro-batch with
+    `count`, and the optimizer steps with `step`
+    """
+
+    def __init__(self, device: torch.device) -> None:
+        self.device: torch.device = device
+        self.reset()
+
+    def reset(self) -> None:
+        self.times: dict[str, float] = {name: 0.0 for name in STEP_SECTIONS}
+        self.n_steps: int = 0
+        self.n_samples: int = 0
+        self.n_tokens: int = 0
+        self.start_time: float = time.perf_counter()
+
+    def _synchronize(self) -> None:
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+
+    @contextlib.contextmanager
+    def section(self, name: str) -> typing.Iterator[None]:
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._synchronize()
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.times[name] += seconds
+
+    def time_iterator(
+        self, iterator: typing.Iterator, name: str = "data_wait"
+    ) -> typing.Iterator:
+        """yield from `iterator`, adding the time spent waiting on each item to section `name`"""
+        while True:
+            start: float = time.perf_counter()
+            try:
+                item: typing.Any = next(iterator)
+            except StopIteration:
+                return
+            self.add(name, time.perf_counter() - start)
+            yield item
+
+    def count(self, n_samples: int, n_tokens: int) -> None:
+        self.n_samples += n_samples
+        self.n_tokens += n_tokens
+
+    def step(self) -> None:
+        self.n_steps += 1
+
+    def summary(self) -> dict[str, float]:
+        """seconds per optimizer step spent in each section, throughput and peak memory since the last summary, then reset
+
+        the throughput is that of this process, multiply by the number of processes for the total
+        """
+        elapsed: float = time.perf_counter() - self.start_time
+        n_steps: int = max(self.n_steps, 1)
+        output: dict[str, float] = {
+            f"timing/{name}": seconds / n_steps for name, seconds in self.times.items()
+        }
+        output["timing/step"] = elapsed / n_steps
+        output["throughput/samples_per_sec"] = self.n_samples / elapsed
+        output["throughput/tokens_per_sec"] = self.n_tokens / elapsed
+        peak_memory_mb: float | None = get_peak_memory_mb(self.device)
+        output["memory/peak_mb"] = (
+            peak_memory_mb if peak_memory_mb is not None else float("nan")
+        )
+        self.reset()
+        return output
@@ -0,0 +1,269 @@
+import ctypes
+import hashlib
+import math
+import multiprocessing
+import random
+import typing
+import warnings
+
+import numpy as np
+import torch
+from jaxtyping import Int
+from maze_dataset import MazeDataset, MazeDatasetConfig, SolvedMaze
+from maze_dataset.dataset.maze_dataset import MazeDatasetFilters
+from maze_dataset.maze import LatticeMaze
+from maze_dataset.tokenization import MazeTokenizer
+from torch.utils.data import IterableDataset, get_worker_info
+
+from maze_transformer.training.distributed import get_rank, get_world_size
+
+
+def maze_hash_key(maze: SolvedMaze) -> bytes:
+    """bytes identifying a solved maze: its connections and its solution"""
+    return maze.connection_list.tobytes() + maze.solution.tobytes()
+
+
+class SharedHashFilter:
+    """approximate set of keys shared between processes: a bloom filter in shared memory
+
+    created in the main process, and shared with dataloader workers when they are started.
+    `add` never misses a key which was added before, but may report a new key as already
+    present. How often depends on `n_bits` and how many keys were added, see `for_capacity`
+    """
+
+    def __init__(self, n_bits: int = 2**27, n_hashes: int = 4) -> None:
+        self.n_bits: int = n_bits
+        self.n_hashes: int = n_hashes
+        self._bits = multiprocessing.Array(ctypes.c_uint8, (n_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(
+        cls, n_keys: int, false_positive_rate: float = 1e-3
+    ) -> "SharedHashFilter":
+        """a filter sized so that once `n_keys` keys were added, a new key is reported as
+        present with probability `false_positive_rate`"""
+        n_keys = max(n_keys, 1)
+        n_bits: int = math.ceil(
+            -n_keys * math.log(false_positive_rate) / math.log(2) ** 2
+        )
+        return cls(
+            n_bits=n_bits,
+            n_hashes=max(1, round(n_bits / n_keys * math.log(2))),
+        )
+
+    def _positions(self, key: bytes) -> list[int]:
+        # double hashing, so any number of positions can come from one digest
+        digest: bytes = hashlib.blake2b(key, digest_size=16).digest()
+        h1: int = int.from_bytes(digest[:8], "little")
+        h2: int = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.n_bits for i in range(self.n_hashes)]
+
+    def add(self, key: bytes) -> bool:
+        """add `key`, returning whether it was (probably) already present"""
+        positions: list[int] = self._positions(key)
+        with self._bits.get_lock():
+            present: bool = all(self._bits[p >> 3] & (1 << (p & 7)) for p in positions)
+            for p in positions:
+                self._bits[p >> 3] |= 1 << (p & 7)
+        return present
+
+
+# `MazeDatasetFilters` which keep or drop each maze on its own, so mazes can be filtered as they are generated
+STREAMING_FILTERS: tuple[str, ...] = ("path_length", "start_end_distance")
+
+
+def check_streaming_filters(cfg: MazeDatasetConfig) -> None:
+    """raise a `ValueError` if `cfg.applied_filters` has a filter not in `STREAMING_FILTERS`,
+    i.e. one which needs the whole dataset"""
+    for filter_info in cfg.applied_filters:
+        if filter_info["name"] not in STREAMING_FILTERS:
+            raise ValueError(
+                f"can't apply filter {filter_info['name']!r} to generated mazes one at a time, only {STREAMING_FILTERS}"
+            )
+
+
+def passes_filters(maze: SolvedMaze, cfg: MazeDatasetConfig) -> bool:
+    """whether `maze` is kept by every filter in `cfg.applied_filters`, as `MazeDataset.from_config` would"""
+    return all(
+        # the per-maze function, which `register_maze_filter` wraps to act on a dataset
+        getattr(MazeDatasetFilters, filter_info["name"]).__wrapped__(
+            maze,
+            *filter_info.get("args", ()),
+            **filter_info.get("kwargs", dict()),
+        )
+        for filter_info in cfg.applied_filters
+    )
+
+
+def generate_solved_maze(cfg: MazeDatasetConfig, seed: int, index: int) -> SolvedMaze:
+    """generate maze `index` of the stream seeded by `seed`, as `MazeDataset.generate` does for one maze
+
+    the random generators are seeded from `seed` and `index` only, so the maze does not
+    depend on which process generates it. Their previous state is restored afterwards
+    """
+    np_state: dict = np.random.get_state()
+    py_state: tuple = random.getstate()
+    try:
+        np.random.seed([seed, index])
+        random.seed(seed * 2**32 + index)
+        maze: LatticeMaze = cfg.maze_ctor(
+            grid_shape=cfg.grid_shape_np,
+            **cfg.maze_ctor_kwargs,
+        )
+        return SolvedMaze.from_lattice_maze(
+            lattice_maze=maze,
+            solution=maze.generate_random_path(),
+        )
+    finally:
+        np.random.set_state(np_state)
+        random.setstate(py_state)
+
+
+def generate_distinct_mazes(
+    cfg: MazeDatasetConfig,
+    n_mazes: int,
+    seed: int,
+) -> MazeDataset:
+    """a `MazeDataset` of `n_mazes` distinct mazes from `generate_solved_maze`, i.e. a held-out validation set
+
+    unlike `MazeDataset.generate`, the mazes only depend on `seed`, so every process generates the same ones.
+    Mazes are filtered by `cfg.applied_filters`, which must all be in `STREAMING_FILTERS`
+    """
+    check_streaming_filters(cfg)
+    cfg = MazeDatasetConfig.load(cfg.serialize())
+    seen: set[bytes] = set()
+    mazes: list[SolvedMaze] = list()
+    index: int = 0
+    while len(mazes) < n_mazes:
+        maze: SolvedMaze = generate_solved_maze(cfg, seed, index)
+        index += 1
+        if passes_filters(maze, cfg) and maze_hash_key(maze) not in seen:
+            seen.add(maze_hash_key(maze))
+            mazes.append(maze)
+    dataset: MazeDataset = MazeDataset(cfg, mazes=mazes)
+    dataset.update_self_config()
+    return dataset
+
+
+class StreamingMazeDataset(IterableDataset):
+    """mazes generated lazily from `cfg`, instead of materializing a `MazeDataset` up front
+
+    the stream holds `cfg.n_mazes` mazes. Candidate `i` is generated from `seed` and `i` by
+    `generate_solved_maze`, and candidates are split between processes (when training
+    distributed) and their dataloader workers, so every process yields the same number
+    of mazes. Candidates already seen by any worker of this process (or in `exclude`,
+    i.e. the validation set) are skipped via a `SharedHashFilter`, so a held-out set is
+    never trained on. Unless `hash_filter` is given, it is sized for `cfg.n_mazes` mazes
+    and the excluded ones, so that about `false_positive_rate` of new mazes are wrongly
+    skipped as duplicates. Which worker yields a duplicate first is not deterministic,
+    everything else is
+
+    candidates are filtered by `cfg.applied_filters` one at a time, so those must all be in
+    `STREAMING_FILTERS`, and the stream still holds `cfg.n_mazes` mazes which pass them
+
+    mazes are yielded as `SolvedMaze`s, or as token ids (like `TokenizedMazeDataset`) if
+    `maze_tokenizer` is given. A dataset is meant to be iterated over once, since every maze
+    is in the filter afterwards. To resume, pass `start_index` (see `state_dict`): the
+    stream then starts from that candidate. This needs at most one dataloader worker (set
+    `num_workers` to match), since with more the mazes used so far are not a prefix of the
+    candidates
+    """
+
+    def __init__(
+        self,
+        cfg: MazeDatasetConfig,
+        maze_tokenizer: MazeTokenizer | None = None,
+        seed: int | None = None,
+        start_index: int = 0,
+        exclude: typing.Iterable[SolvedMaze] = (),
+        hash_filter: SharedHashFilter | None = None,
+        false_positive_rate: float = 1e-3,
+        max_consecutive_duplicates: int = 10_000,
+        num_workers: int = 0,
+    ) -> None:
+        check_streaming_filters(cfg)
+        self.cfg: MazeDatasetConfig = cfg
+        self.maze_tokenizer: MazeTokenizer | None = maze_tokenizer
+        self.seed: int = seed if seed is not None else cfg.seed
+        self.start_index: int = start_index
+        self.max_consecutive_duplicates: int = max_consecutive_duplicates
+        self.num_workers: int = num_workers
+        self.rank: int = get_rank()
+        self.world_size: int = get_world_size()
+        exclude = list(exclude)
+        self.hash_filter: SharedHashFilter = (
+            hash_filter
+            if hash_filter is not None
+            else SharedHashFilter.for_capacity(
+                cfg.n_mazes + len(exclude), false_positive_rate
+            )
+        )
+        for maze in exclude:
+            self.hash_filter.add(maze_hash_key(maze))
+
+    def __len__(self) -> int:
+        """number of mazes this process yields, like `len` of a `ResumableSampler`"""
+        return max(0, self.cfg.n_mazes - self.start_index) // self.world_size
+
+    def state_dict(self, n_consumed: int) -> dict[str, int]:
+        """arguments to resume from, once `n_consumed` mazes have been used by all processes since the start
+
+        candidates skipped as duplicates or by filters aren't counted, so when there were any
+        the resumed stream repeats a few mazes. `num_workers` is saved so that `load_state_dict`
+        can refuse a state saved with several workers
+        """
+        return dict(
+            seed=self.seed, start_index=n_consumed, num_workers=self.num_workers
+        )
+
+    def load_state_dict(self, state: dict[str, int]) -> None:
+        """continue from `state` (see `state_dict`), raises a `ValueError` if it was saved or
+        is loaded with more than one dataloader worker"""
+        num_workers: int = max(state.get("num_workers", 0), self.num_workers)
+        if num_workers > 1 and state["start_index"] > 0:
+            raise ValueError(
+                f"can't resume a streaming dataset with {num_workers = }, the mazes used so far are only a prefix of the candidates with at most one worker"
+            )
+        self.seed = state["seed"]
+        self.start_index = state["start_index"]
+
+    def _encode(self, maze: SolvedMaze) -> SolvedMaze | Int[torch.Tensor, "pos"]:
+        if self.maze_tokenizer is None:
+            return maze
+        return torch.tensor(
+            self.maze_tokenizer.encode(maze.as_tokens(self.maze_tokenizer)),
+            dtype=torch.long,
+        )
+
+    def __iter__(self) -> typing.Iterator[SolvedMaze | Int[torch.Tensor, "pos"]]:
+        worker_info = get_worker_info()
+        worker_id: int = worker_info.id if worker_info is not None else 0
+        num_workers: int = worker_info.num_workers if worker_info is not None else 1
+
+        # each process yields the same number of mazes, split between its workers
+        n_per_process: int = len(self)
+        n_to_yield: int = n_per_process // num_workers + int(
+            worker_id < n_per_process % num_workers
+        )
+        shard: int = self.rank * num_workers + worker_id
+        n_shards: int = self.world_size * num_workers
+
+        index: int = self.start_index + shard
+        n_yielded: int = 0
+        n_skipped: int = 0
+        while n_yielded < n_to_yield:
+            maze: SolvedMaze = generate_solved_maze(self.cfg, self.seed, index)
+            index += n_shards
+            if not passes_filters(maze, self.cfg) or self.hash_filter.add(
+                maze_hash_key(maze)
+            ):
+                n_skipped += 1
+                if n_skipped >= self.max_consecutive_duplicates:
+                    warnings.warn(
+                        f"stopping after {n_yielded} of {n_to_yield} mazes: the last {n_skipped} generated were all duplicates or filtered out"
+                    )
+                    return
+                continue
+            n_skipped = 0
+            n_yielded += 1
+            yield self._encode(maze)
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import torch
+from jaxtyping import Int
+from maze_dataset import MazeDataset
+from maze_dataset.tokenization import MazeTokenizer
+from muutils.misc import sanitize_fname
+from torch.utils.data import Dataset
+
+
+def dataset_content_hash(dataset: MazeDataset) -> str:
+    """sha256 hex digest of the connection list and solution of every maze in `dataset`, in order
+
+    computed once, and stored on `dataset` for later calls as long as its list of mazes is
+    the same (filters and splits make new datasets). Looking up the cache of a dataset again,
+    i.e. at every eval, then doesn't go over all of its mazes
+    """
+    stored: tuple[list, int, str] | None = getattr(dataset, "_content_hash", None)
+    if (
+        stored is not None
+        and stored[0] is dataset.mazes
+        and stored[1] == len(dataset.mazes)
+    ):
+        return stored[2]
+    content_hash = hashlib.sha256()
+    for maze in dataset.mazes:
+        solution: np.ndarray = np.asarray(maze.solution, dtype=np.int64)
+        content_hash.update(np.asarray(maze.connection_list).tobytes())
+        # the solution length, so that the boundaries between mazes are unambiguous
+        content_hash.update(np.int64(len(solution)).tobytes())
+        content_hash.update(solution.tobytes())
+    dataset._content_hash = (
+        dataset.mazes,
+        len(dataset.mazes),
+        content_hash.hexdigest(),
+    )
+    return dataset._content_hash[2]
+
+
+def token_cache_fname(dataset: MazeDataset, maze_tokenizer: MazeTokenizer) -> str:
+    """filename stem for the token cache of `dataset` encoded with `maze_tokenizer`
+
+    keyed by the dataset config, the tokenizer (mode and `max_grid_size`), and the
+    stored hash of the contents of every maze (see `dataset_content_hash`), so that datasets with the same
+    config but different mazes (i.e. two halves of a train/validation split, or differently
+    filtered datasets) never share a cache
+    """
+    key: str = json.dumps(
+        [
+            dataset.cfg.serialize(),
+            maze_tokenizer.serialize(),
+            dataset_content_hash(dataset),
+        ]
+    )
+    key_hash: str = hashlib.sha256(key.encode()).hexdigest()[:16]
+    return sanitize_fname(
+        f"{dataset.cfg.to_fname()}-{maze_tokenizer.name}-tokcache-h{key_hash}"
+    )
+
+
+def _save_npy_atomic(path: Path, arr: np.ndarray) -> None:
+    """save via a temp file and rename, so readers never see a partial file"""
+    path_tmp: Path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(path_tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(path_tmp, path)
+
+
+class TokenizedMazeDataset(Dataset):
+    """a `MazeDataset` encoded once into a packed integer array plus offsets
+
+    the tokens of maze `i` are `tokens[offsets[i] : offsets[i + 1]]`. Note that since
+    encoding happens once, the adjacency list of each maze is shuffled once at encoding
+    time, rather than every time the maze is drawn from the dataloader.
+
+    when read from a token cache, the arrays are memory-mapped and only the paths are
+    pickled, so dataloader workers share the same pages
+    """
+
+    def __init__(
+        self,
+        tokens: Int[np.ndarray, "n_tokens"],
+        offsets: Int[np.ndarray, "n_mazes_plus_1"],
+        cache_paths: tuple[Path, Path] | None = None,
+    ) -> None:
+        assert tokens.ndim == 1, f"tokens must be 1D, got {tokens.shape = }"
+        assert offsets.ndim == 1, f"offsets must be 1D, got {offsets.shape = }"
+        assert offsets[0] == 0 and offsets[-1] == len(
+            tokens
+        ), f"offsets must span the tokens array, got {offsets[0] = }, {offsets[-1] = }, {len(tokens) = }"
+        self.tokens: Int[np.ndarray, "n_tokens"] = tokens
+        self.offsets: Int[np.ndarray, "n_mazes_plus_1"] = offsets
+        self.cache_paths: tuple[Path, Path] | None = cache_paths
+
+    @classmethod
+    def from_maze_dataset(
+        cls,
+        dataset: MazeDataset,
+        maze_tokenizer: MazeTokenizer,
+        cache_dir: str | Path | None = None,
+    ) -> "TokenizedMazeDataset":
+        """tokenize and encode every maze in `dataset`, packing the results
+
+        if `cache_dir` is given, the encoded dataset is memory-mapped from the token cache
+        there if it exists, and otherwise written to it after encoding
+        """
+        if cache_dir is not None:
+            cache_dir = Path(cache_dir)
+            fname: str = token_cache_fname(dataset, maze_tokenizer)
+            cache_paths: tuple[Path, Path] = (
+                cache_dir / f"{fname}.tokens.npy",
+                cache_dir / f"{fname}.offsets.npy",
+            )
+            if all(p.exists() for p in cache_paths):
+                output: TokenizedMazeDataset = cls.read(*cache_paths)
+                if len(output) == len(dataset):
+                    return output
+
+        encoded: list[list[int]] = [
+            maze_tokenizer.encode(tokens)
+            for tokens in dataset.as_tokens(
+                maze_tokenizer, join_tokens_individual_maze=False
+            )
+        ]
+        lengths: Int[np.ndarray, "n_mazes"] = np.array(
+            [len(x) for x in encoded], dtype=np.int64
+        )
+        offsets: Int[np.ndarray, "n_mazes_plus_1"] = np.zeros(
+            len(encoded) + 1, dtype=np.int64
+        )
+        np.cumsum(lengths, out=offsets[1:])
+        tokens: Int[np.ndarray, "n_tokens"] = np.fromiter(
+            (t for x in encoded for t in x),
+            dtype=np.int32,
+            count=int(offsets[-1]),
+        )
+
+        if cache_dir is None:
+            return cls(tokens=tokens, offsets=offsets)
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        _save_npy_atomic(cache_paths[0], tokens)
+        _save_npy_atomic(cache_paths[1], offsets)
+        return cls.read(*cache_paths)
+
+    @classmethod
+    def read(cls, tokens_path: Path, offsets_path: Path) -> "TokenizedMazeDataset":
+        """memory-map a token cache written by `from_maze_dataset`"""
+        return cls(
+            tokens=np.load(tokens_path, mmap_mode="r"),
+            offsets=np.load(offsets_path),
+            cache_paths=(Path(tokens_path), Path(offsets_path)),
+        )
+
+    def __getstate__(self) -> dict:
+        if self.cache_paths is None:
+            return self.__dict__
+        return {"cache_paths": self.cache_paths}
+
+    def __setstate__(self, state: dict) -> None:
+        if "tokens" in state:
+            self.__dict__.update(state)
+        else:
+            self.__dict__.update(self.read(*state["cache_paths"]).__dict__)
+
+    @property
+    def lengths(self) -> Int[np.ndarray, "n_mazes"]:
+        return np.diff(self.offsets)
+
+    def as_tokens(self, maze_tokenizer: MazeTokenizer) -> list[list[str]]:
+        """decode back to string tokens, in the format of `MazeDataset.as_tokens`"""
+        token_arr: np.ndarray = np.array(maze_tokenizer.token_arr, dtype=object)
+        decoded: list[str] = token_arr[self.tokens].tolist()
+        return [
+            decoded[start:end]
+            for start, end in zip(self.offsets[:-1], self.offsets[1:])
+        ]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx: int) -> Int[torch.Tensor, "pos"]:
+        return torch.from_numpy(
+            self.tokens[self.offsets[idx] : self.offsets[idx + 1]].astype(np.int64)
+        )
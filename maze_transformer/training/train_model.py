@@ -10,12 +10,33 @@ from muutils.json_serialize import SerializableDataclass, serializable_dataclass
 from muutils.mlutils import get_device
 from torch.utils.data import DataLoader
 
+from maze_transformer.training.base_logger import BaseLogger
+from maze_transformer.training.checkpointing import find_train_state
 from maze_transformer.training.config import (
     GPT_CONFIGS,
     TRAINING_CONFIGS,
     ConfigHolder,
     ZanjHookedTransformer,
 )
+from maze_transformer.training.dataset_generation import (
+    generate_datasets,
+    read_generated_dataset,
+    split_validation_dataset,
+)
+from maze_transformer.training.distributed import (
+    NonMainProcessLogger,
+    barrier,
+    broadcast_object,
+    get_distributed_device,
+    init_distributed,
+    is_main_process,
+)
+from maze_transformer.training.jsonl_logger import JSONLLogger
+from maze_transformer.training.streaming_dataset import (
+    StreamingMazeDataset,
+    generate_distinct_mazes,
+)
+from maze_transformer.training.tokenized_dataset import TokenizedMazeDataset
 from maze_transformer.training.train_save_files import TRAIN_SAVE_FILES
 from maze_transformer.training.training import get_dataloader, train
 from maze_transformer.training.wandb_logger import (
@@ -42,9 +63,16 @@ def train_model(
     cfg_names: typing.Sequence[str] | None = None,
     do_generate_dataset: bool = False,
     dataset_verbose: bool = False,
+    dataset_n_workers: int | None = None,
     dataset: MazeDataset | None = None,
     allow_dataset_override: bool = False,
+    pretokenize: bool = False,
+    streaming: bool = False,
+    streaming_false_positive_rate: float = 1e-3,
     device: torch.device | None = None,
+    resume_from: str | Path | None = None,
+    distributed_backend: str | None = None,
+    logger_backend: str = "wandb",
     help: bool = False,
     **kwargs,
 ) -> TrainingResult:
@@ -58,13 +86,61 @@ def train_model(
         - dataset config names: {dataset_cfg_names}
         - model config names: {model_cfg_names}
         - train config names: {train_cfg_names}
+
+    with `do_generate_dataset`, the training and validation datasets missing from `base_path`
+    are generated together by a pool of `dataset_n_workers` processes (all cpus by default),
+    and written there in chunks as they are generated (see `generate_datasets`). Their mazes
+    are seeded per maze, so they differ from those of `MazeDataset.from_config` for the same
+    config, and are saved under a name of their own. Without `do_generate_dataset`, datasets
+    generated that way are loaded if they are in `base_path` (i.e. when resuming such a run),
+    and the others via `MazeDataset.from_config`
+
+    if `pretokenize` is true, the training dataset is encoded to token ids once before training,
+    instead of being tokenized from strings at every step (see `get_dataloader`). The encoded
+    datasets are cached next to the datasets in `base_path`, and reused by later runs
+
+    if `streaming` is true, the training mazes are generated on the fly by the dataloader
+    workers (see `StreamingMazeDataset`) rather than generated or loaded up front, so
+    `cfg.dataset_cfg.n_mazes` can be far larger than fits in memory. An int
+    `validation_dataset_cfg` is then a held-out set of that many mazes, generated from a
+    different seed and never trained on. Duplicates are skipped with a bloom filter sized
+    for `cfg.dataset_cfg.n_mazes`, which wrongly skips about `streaming_false_positive_rate`
+    of new mazes
+
+    `resume_from` continues an earlier run from a training state saved with its checkpoints:
+    either a run directory (the latest training state is used) or a specific
+    `train_state.iter_*.pt` file. The run continues in the same directory, and uses the config
+    saved there unless another one is given. The dataset must be the same as for the original run
+
+    when launched with `torchrun` (i.e. `WORLD_SIZE` is more than 1), training is data-parallel
+    across the processes, using `distributed_backend` (nccl on GPU, gloo on CPU by default).
+    Each process trains on its own shard of the dataset on `cuda:LOCAL_RANK` (or the CPU), and
+    only the main process writes the config, checkpoints and logs
+
+    `logger_backend` is where metrics go: "wandb" logs to a wandb run in `wandb_project`,
+    "jsonl" appends them to `log.jsonl` in the run directory without needing a network
+    connection (see `JSONLLogger`)
     """
     if help:
         print(train_model.__doc__)
         return
+    if logger_backend not in ("wandb", "jsonl"):
+        raise ValueError(
+            f"unknown {logger_backend = }, expected one of 'wandb' or 'jsonl'"
+        )
 
+    distributed: bool = init_distributed(backend=distributed_backend)
     if device is None:
-        device = get_device()
+        device = get_distributed_device() if distributed else get_device()
+
+    train_state: dict[str, typing.Any] | None = None
+    run_path: Path | None = None
+    if resume_from is not None:
+        train_state_path: Path = find_train_state(resume_from)
+        run_path = train_state_path.parent.parent
+        train_state = torch.load(train_state_path, map_location="cpu")
+        if cfg is None and cfg_file is None and cfg_names is None:
+            cfg_file = run_path / TRAIN_SAVE_FILES.config_holder
 
     cfg = ConfigHolder.get_config_multisource(
         cfg=cfg,
@@ -76,19 +152,37 @@ def train_model(
     # set up path, save config
     base_path = Path(base_path)
     base_path.mkdir(parents=True, exist_ok=True)
-    output_path = base_path / TRAIN_SAVE_FILES.model_run_dir(cfg)
-    output_path = Path(output_path)
-    output_path.mkdir(parents=True)
-    with open(Path(output_path) / TRAIN_SAVE_FILES.config_holder, "w") as f:
-        json.dump(cfg.serialize(), f, indent="\t")
-    (output_path / TRAIN_SAVE_FILES.checkpoints).mkdir(parents=True)
+    if run_path is not None:
+        output_path = run_path
+    elif is_main_process():
+        output_path = base_path / TRAIN_SAVE_FILES.model_run_dir(cfg)
+        output_path = Path(output_path)
+        output_path.mkdir(parents=True)
+        with open(Path(output_path) / TRAIN_SAVE_FILES.config_holder, "w") as f:
+            json.dump(cfg.serialize(), f, indent="\t")
+        (output_path / TRAIN_SAVE_FILES.checkpoints).mkdir(parents=True)
+    else:
+        output_path = None
+    # the run directory name contains a timestamp, so use the one from the main process
+    output_path = broadcast_object(output_path)
 
     # set up logger
-    logger: WandbLogger = WandbLogger.create(
-        config=cfg.serialize(),
-        project=wandb_project,
-        job_type=WandbJobType.TRAIN_MODEL,
-    )
+    logger: BaseLogger
+    if is_main_process() and logger_backend == "jsonl":
+        logger = JSONLLogger.create(
+            config=cfg.serialize(),
+            project=wandb_project,
+            job_type=WandbJobType.TRAIN_MODEL,
+            output_dir=output_path,
+        )
+    elif is_main_process():
+        logger = WandbLogger.create(
+            config=cfg.serialize(),
+            project=wandb_project,
+            job_type=WandbJobType.TRAIN_MODEL,
+        )
+    else:
+        logger = NonMainProcessLogger()
     logger.progress("Initialized logger")
     logger.summary(
         dict(
@@ -106,14 +200,12 @@ def train_model(
     logger.progress("Summary logged, getting dataset")
 
     # load dataset
-    if dataset is None:
-        dataset = MazeDataset.from_config(
-            cfg=cfg.dataset_cfg,
-            do_generate=do_generate_dataset,
-            local_base_path=base_path,
-            verbose=dataset_verbose,
-        )
-    else:
+    # the main process generates (and saves) missing datasets first, the others then load them
+    if not is_main_process():
+        barrier()
+    if streaming:
+        assert dataset is None, "can't pass a dataset when streaming"
+    elif dataset is not None:
         if dataset.cfg == cfg.dataset_cfg:
             logger.progress(f"passed dataset has matching config, using that")
         else:
@@ -126,44 +218,94 @@ def train_model(
                     f"dataset has different config than cfg.dataset_cfg, and allow_dataset_override is False"
                 )
 
-    logger.progress(f"finished getting training dataset with {len(dataset)} samples")
+    # the training and validation datasets which aren't passed, streamed or split off
+    load_cfgs: list[MazeDatasetConfig] = list()
+    if dataset is None and not streaming:
+        load_cfgs.append(cfg.dataset_cfg)
+    if isinstance(cfg.train_cfg.validation_dataset_cfg, MazeDatasetConfig):
+        load_cfgs.append(cfg.train_cfg.validation_dataset_cfg)
+    loaded: list[MazeDataset]
+    if do_generate_dataset:
+        # the other processes read what the main process generated
+        loaded = generate_datasets(
+            load_cfgs,
+            local_base_path=base_path,
+            n_workers=dataset_n_workers,
+            progress=logger.progress,
+        )
+    else:
+        loaded = list()
+        for load_cfg in load_cfgs:
+            load_dataset: MazeDataset | None = read_generated_dataset(
+                load_cfg, base_path
+            )
+            if load_dataset is None:
+                load_dataset = MazeDataset.from_config(
+                    cfg=load_cfg,
+                    do_generate=False,
+                    local_base_path=base_path,
+                    verbose=dataset_verbose,
+                )
+            loaded.append(load_dataset)
+    if dataset is None and not streaming:
+        dataset = loaded.pop(0)
+
+    if not streaming:
+        logger.progress(
+            f"finished getting training dataset with {len(dataset)} samples"
+        )
     # validation dataset, if applicable
     val_dataset: MazeDataset | None = None
     if cfg.train_cfg.validation_dataset_cfg is not None:
-        if isinstance(cfg.train_cfg.validation_dataset_cfg, int):
-            # split the training dataset
-            assert len(dataset) > cfg.train_cfg.validation_dataset_cfg, (
-                f"{cfg.train_cfg.validation_dataset_cfg = } "
-                + f"is greater than the length of the training dataset: {len(dataset) = }"
-            )
-            split_dataset_sizes: tuple[int, int] = [
-                len(dataset) - cfg.train_cfg.validation_dataset_cfg,
-                cfg.train_cfg.validation_dataset_cfg,
-            ]
-            val_dataset = MazeDataset(
+        if streaming and isinstance(cfg.train_cfg.validation_dataset_cfg, int):
+            # held out from the stream, which skips these mazes
+            val_dataset = generate_distinct_mazes(
                 cfg.dataset_cfg,
-                mazes=dataset.mazes[-split_dataset_sizes[1] :],
-                generation_metadata_collected=dataset.generation_metadata_collected,
+                n_mazes=cfg.train_cfg.validation_dataset_cfg,
+                seed=cfg.dataset_cfg.seed + 1,
+            )
+            logger.progress(
+                f"generated held-out validation dataset with {len(val_dataset)} samples"
+            )
+        elif isinstance(cfg.train_cfg.validation_dataset_cfg, int):
+            dataset, val_dataset = split_validation_dataset(
+                dataset, cfg.train_cfg.validation_dataset_cfg
             )
-            dataset.mazes = dataset.mazes[: split_dataset_sizes[0]]
-            dataset.update_self_config()
-            val_dataset.update_self_config()
             logger.progress(
                 f"got validation dataset by splitting training dataset into {len(dataset)} train and {len(val_dataset)} validation samples"
             )
         elif isinstance(cfg.train_cfg.validation_dataset_cfg, MazeDatasetConfig):
-            val_dataset = MazeDataset.from_config(
-                cfg=cfg.train_cfg.validation_dataset_cfg,
-                do_generate=do_generate_dataset,
-                local_base_path=base_path,
-                verbose=dataset_verbose,
-            )
+            val_dataset = loaded.pop(0)
             logger.progress(
                 f"got custom validation dataset with {len(val_dataset)} samples"
             )
+    if streaming:
+        dataset = StreamingMazeDataset(
+            cfg.dataset_cfg,
+            exclude=val_dataset.mazes if val_dataset is not None else (),
+            false_positive_rate=streaming_false_positive_rate,
+        )
+        logger.progress(f"streaming training dataset of {len(dataset)} samples")
+    if is_main_process():
+        barrier()
 
     # get dataloader and then train
-    dataloader: DataLoader = get_dataloader(dataset, cfg, logger)
+    dataloader: DataLoader = get_dataloader(
+        dataset,
+        cfg,
+        logger,
+        pretokenize=pretokenize,
+        token_cache_dir=base_path if pretokenize else None,
+        sampler_state=train_state["sampler"] if train_state is not None else None,
+    )
+    val_dataset_tokens: list[list[str]] | None = None
+    if pretokenize and val_dataset is not None:
+        val_dataset_tokens = TokenizedMazeDataset.from_maze_dataset(
+            val_dataset,
+            cfg.maze_tokenizer,
+            # a held-out set has no file of its own to match the cache against
+            cache_dir=None if streaming else base_path,
+        ).as_tokens(cfg.maze_tokenizer)
 
     logger.progress("finished dataloader, passing to train()")
     trained_model: ZanjHookedTransformer = train(
@@ -173,7 +315,10 @@ def train_model(
         output_dir=output_path,
         device=device,
         val_dataset=val_dataset,
+        val_dataset_tokens=val_dataset_tokens,
+        resume_state=train_state,
     )
+    logger.close()
 
     return TrainingResult(
         output_path=output_path,
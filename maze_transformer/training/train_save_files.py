@@ -23,6 +23,9 @@ class TRAIN_SAVE_FILES:
     model_checkpt_zanj: Callable[
         [int], str
     ] = lambda iteration: f"model.iter_{iteration}.zanj"
+    train_state_checkpt: Callable[
+        [int], str
+    ] = lambda iteration: f"train_state.iter_{iteration}.pt"
     model_final_zanj: str = "model.final.zanj"
     model_run_dir: Callable[
         [ConfigHolder], str
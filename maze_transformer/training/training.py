@@ -1,41 +1,315 @@
+import contextlib
+import typing
 import warnings
 from functools import partial
 from pathlib import Path
 
 import torch
-from jaxtyping import Float
+from jaxtyping import Float, Int
 from maze_dataset import MazeDataset, SolvedMaze
 from maze_dataset.tokenization import MazeTokenizer
 from muutils.statcounter import StatCounter
-from torch.utils.data import DataLoader
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader, Sampler
 from transformer_lens.HookedTransformer import SingleLoss
 from zanj import ZANJ
 
-from maze_transformer.evaluation.eval_model import evaluate_model
-from maze_transformer.evaluation.path_evals import PathEvals
+from maze_transformer.evaluation.eval_model import (
+    evaluate_logits,
+    evaluate_model,
+    get_path_target_mask,
+)
+from maze_transformer.evaluation.path_evals import PathEvalFunction, PathEvals
 from maze_transformer.tokenizer import HuggingMazeTokenizer
+from maze_transformer.training.async_evals import AsyncEvaluator
+from maze_transformer.training.base_logger import BaseLogger
+from maze_transformer.training.checkpointing import (
+    AsyncCheckpointWriter,
+    get_train_state,
+    save_train_state,
+    set_rng_state,
+)
 from maze_transformer.training.config import ConfigHolder, ZanjHookedTransformer
+from maze_transformer.training.distributed import (
+    all_reduce_mean,
+    broadcast_object,
+    get_rank,
+    get_world_size,
+    is_distributed,
+    is_main_process,
+    reduce_stat_counters,
+    shard_dataset,
+)
+from maze_transformer.training.loss import (
+    next_token_loss_ignore_padding,
+    path_token_loss,
+)
+from maze_transformer.training.step_timer import STEP_SECTIONS, StepTimer
+from maze_transformer.training.streaming_dataset import StreamingMazeDataset
+from maze_transformer.training.tokenized_dataset import TokenizedMazeDataset
 from maze_transformer.training.train_save_files import TRAIN_SAVE_FILES
-from maze_transformer.training.wandb_logger import WandbLogger
+from maze_transformer.utils.compile import LeftPaddedForward
+from maze_transformer.utils.padding import (
+    PADDING_BUCKET_SIZE,
+    PADDING_MODES,
+    get_padded_fraction,
+    get_padding_stats,
+    pad_to_bucket,
+)
+from maze_transformer.utils.precision import autocast_context, get_grad_scaler
 
 
 def collate_batch(batch: list[SolvedMaze], maze_tokenizer: MazeTokenizer) -> list[str]:
     return [" ".join(maze.as_tokens(maze_tokenizer)) for maze in batch]
 
 
+def collate_batch_tokenized(
+    batch: list[Int[torch.Tensor, "pos"]],
+    padding_idx: int,
+    bos_token_idx: int | None = None,
+    max_len: int | None = None,
+) -> Int[torch.Tensor, "batch pos"]:
+    """left-pad a batch of pre-tokenized mazes into a single tensor
+
+    this produces the same tokens as passing the strings from `collate_batch` to
+    `HookedTransformer.to_tokens`: `bos_token_idx` is prepended if given, and sequences
+    longer than `max_len` are truncated from the left
+    """
+    sequences: list[Int[torch.Tensor, "pos"]] = [x.long() for x in batch]
+    if bos_token_idx is not None:
+        bos: Int[torch.Tensor, "1"] = torch.tensor([bos_token_idx], dtype=torch.long)
+        sequences = [torch.cat([bos, x]) for x in sequences]
+    if max_len is not None:
+        sequences = [x[-max_len:] for x in sequences]
+
+    batch_len: int = max(len(x) for x in sequences)
+    output: Int[torch.Tensor, "batch pos"] = torch.full(
+        (len(sequences), batch_len), padding_idx, dtype=torch.long
+    )
+    for i, x in enumerate(sequences):
+        output[i, batch_len - len(x) :] = x
+
+    return output
+
+
+class ResumableSampler(Sampler[int]):
+    """sample the indices of a dataset in an order determined by `seed`, from `start_index` on
+
+    with `shuffle`, the order is a permutation drawn from a generator seeded with `seed`
+    (itself drawn from the torch RNG if not given), so it can be regenerated to resume
+    partway through. `state_dict` gives the arguments to do so
+
+    like `DistributedSampler`, with `num_replicas > 1` the remaining indices are split
+    between processes, process `rank` taking every `num_replicas`-th one. The tail is
+    dropped so every process gets the same number of samples. `start_index` counts the
+    samples consumed by all processes, and every process must be given the same `seed`
+    """
+
+    def __init__(
+        self,
+        n_samples: int,
+        shuffle: bool = True,
+        seed: int | None = None,
+        start_index: int = 0,
+        num_replicas: int = 1,
+        rank: int = 0,
+    ) -> None:
+        assert (
+            0 <= rank < num_replicas
+        ), f"rank must be in [0, {num_replicas}), got {rank}"
+        self.n_samples: int = n_samples
+        self.shuffle: bool = shuffle
+        self.seed: int = (
+            seed if seed is not None else int(torch.randint(2**62, (1,)).item())
+        )
+        self.start_index: int = start_index
+        self.num_replicas: int = num_replicas
+        self.rank: int = rank
+
+    def get_order(self) -> Int[torch.Tensor, "n_samples"]:
+        """the order of all samples, before skipping to `start_index` and sharding"""
+        if self.shuffle:
+            return torch.randperm(
+                self.n_samples, generator=torch.Generator().manual_seed(self.seed)
+            )
+        return torch.arange(self.n_samples)
+
+    def __iter__(self) -> typing.Iterator[int]:
+        order: Int[torch.Tensor, "n_samples"] = self.get_order()
+        order = order[self.start_index :][: len(self) * self.num_replicas]
+        return iter(order[self.rank :: self.num_replicas].tolist())
+
+    def __len__(self) -> int:
+        return max(0, self.n_samples - self.start_index) // self.num_replicas
+
+    def state_dict(self, n_consumed: int) -> dict[str, int]:
+        """state to resume from, once `n_consumed` samples have been used"""
+        return dict(seed=self.seed, start_index=n_consumed)
+
+
+class LengthGroupedSampler(ResumableSampler):
+    """a `ResumableSampler` which draws batches of samples with similar lengths
+
+    the order of the `ResumableSampler` is cut into windows of `window_batches` batches,
+    each window is sorted by `lengths`, and (with `shuffle`) the batches within a window
+    are shuffled again. Batches then need much less padding, while the order is still
+    determined by `seed` alone. `batch_size` is per process, and `start_index` should be
+    a multiple of `batch_size * num_replicas` (which it is when resuming from a checkpoint)
+    """
+
+    def __init__(
+        self,
+        lengths: typing.Sequence[int],
+        batch_size: int,
+        window_batches: int = 64,
+        **kwargs,
+    ) -> None:
+        super().__init__(len(lengths), **kwargs)
+        self.lengths: Int[torch.Tensor, "n_samples"] = torch.as_tensor(
+            lengths, dtype=torch.long
+        )
+        self.batch_size: int = batch_size
+        self.window_batches: int = window_batches
+
+    def get_order(self) -> Int[torch.Tensor, "n_samples"]:
+        order: Int[torch.Tensor, "n_samples"] = super().get_order()
+        # the samples of one batch across all processes
+        block_size: int = self.batch_size * self.num_replicas
+        window_size: int = block_size * self.window_batches
+        generator: torch.Generator = torch.Generator().manual_seed(self.seed + 1)
+        windows: list[Int[torch.Tensor, "window"]] = list()
+        for window in order.split(window_size):
+            window = window[torch.sort(self.lengths[window], stable=True).indices]
+            if self.shuffle:
+                # keep a partial block at the end, so the batches stay aligned
+                n_full: int = len(window) // block_size
+                blocks: Int[torch.Tensor, "n_full block"] = window[
+                    : n_full * block_size
+                ].view(n_full, block_size)
+                window = torch.cat(
+                    [
+                        blocks[torch.randperm(n_full, generator=generator)].flatten(),
+                        window[n_full * block_size :],
+                    ]
+                )
+            windows.append(window)
+        return torch.cat(windows) if windows else order
+
+
+def get_token_lengths(
+    dataset: MazeDataset | TokenizedMazeDataset,
+    maze_tokenizer: MazeTokenizer,
+) -> list[int]:
+    """number of tokens of every maze in `dataset`"""
+    if isinstance(dataset, TokenizedMazeDataset):
+        return dataset.lengths.tolist()
+    return [len(maze.as_tokens(maze_tokenizer)) for maze in dataset.mazes]
+
+
 def get_dataloader(
-    dataset: MazeDataset, cfg: ConfigHolder, logger: WandbLogger
+    dataset: MazeDataset | StreamingMazeDataset,
+    cfg: ConfigHolder,
+    logger: BaseLogger,
+    pretokenize: bool = False,
+    token_cache_dir: Path | None = None,
+    sampler_state: dict[str, int] | None = None,
 ) -> DataLoader:
+    """create the training dataloader
+
+    if `pretokenize` is true, the whole dataset is encoded once up front into a
+    `TokenizedMazeDataset`, and batches are tensors of token ids instead of strings
+    which need to be tokenized again by the model on every step. If `token_cache_dir`
+    is also given, the encoded dataset is memory-mapped from (or written to) a token cache there
+
+    samples are drawn by a `ResumableSampler`, shuffled according to `dataloader_cfg["shuffle"]`,
+    or a `LengthGroupedSampler` if `train_cfg.padding_mode` is "length_class".
+    Pass `sampler_state` (from a training state, see `get_train_state`) to continue where it stopped.
+    When running distributed, each process only loads its shard of the dataset
+
+    a `StreamingMazeDataset` generates the mazes as they are loaded instead, in the order of
+    its own seed (which `sampler_state` then resumes, with at most one worker, see
+    `StreamingMazeDataset.load_state_dict`). With `pretokenize` they are encoded as they are generated
+    """
     if len(dataset) == 0:
         raise ValueError(f"Dataset is empty: {len(dataset) = }")
-    logger.progress(f"Loaded {len(dataset)} sequences")
+    streaming: bool = isinstance(dataset, StreamingMazeDataset)
+    logger.progress(
+        f"{'Streaming' if streaming else 'Loaded'} {len(dataset)} sequences"
+    )
+
+    collate_fn: typing.Callable
+    if pretokenize:
+        if streaming:
+            dataset.maze_tokenizer = cfg.maze_tokenizer
+        else:
+            logger.progress("Pre-tokenizing dataset")
+            dataset = TokenizedMazeDataset.from_maze_dataset(
+                dataset, cfg.maze_tokenizer, cache_dir=token_cache_dir
+            )
+        collate_fn = partial(
+            collate_batch_tokenized,
+            padding_idx=cfg.maze_tokenizer.padding_token_index,
+            bos_token_idx=(
+                cfg.maze_tokenizer.tokenizer_map[HuggingMazeTokenizer.bos_token]
+                if cfg.hooked_transformer_cfg.default_prepend_bos
+                else None
+            ),
+            max_len=cfg.dataset_cfg.seq_len_max,
+        )
+    else:
+        collate_fn = partial(collate_batch, maze_tokenizer=cfg.maze_tokenizer)
+
     logger.progress("Creating dataloader")
+    dataloader_cfg: dict = dict(cfg.train_cfg.dataloader_cfg)
+    if streaming:
+        # generated mazes are already in random order, and can't be grouped by length
+        dataloader_cfg.pop("shuffle", None)
+        if cfg.train_cfg.padding_mode == "length_class":
+            warnings.warn(
+                "a streaming dataset can't be grouped by length, batches are only padded to buckets"
+            )
+        dataset.num_workers = dataloader_cfg.get("num_workers", 0)
+        if dataset.num_workers > 1:
+            warnings.warn(
+                f"streaming with {dataset.num_workers} workers, checkpoints of this run can't be resumed"
+            )
+        if sampler_state is not None:
+            dataset.load_state_dict(sampler_state)
+        return DataLoader(
+            dataset,
+            collate_fn=collate_fn,
+            batch_size=cfg.train_cfg.batch_size,
+            **dataloader_cfg,
+        )
+
+    sampler_state = dict(sampler_state) if sampler_state is not None else dict()
+    # every process must draw the same order, and then take its own shard of it
+    sampler_state.setdefault(
+        "seed", broadcast_object(int(torch.randint(2**62, (1,)).item()))
+    )
+    sampler_kwargs: dict = dict(
+        shuffle=dataloader_cfg.pop("shuffle", False),
+        num_replicas=get_world_size(),
+        rank=get_rank(),
+        **sampler_state,
+    )
+    sampler: ResumableSampler
+    if cfg.train_cfg.padding_mode == "length_class":
+        logger.progress("Grouping samples by length")
+        sampler = LengthGroupedSampler(
+            get_token_lengths(dataset, cfg.maze_tokenizer),
+            batch_size=cfg.train_cfg.batch_size,
+            **sampler_kwargs,
+        )
+    else:
+        sampler = ResumableSampler(len(dataset), **sampler_kwargs)
     try:
         dataloader: DataLoader = DataLoader(
             dataset,
-            collate_fn=partial(collate_batch, maze_tokenizer=cfg.maze_tokenizer),
+            collate_fn=collate_fn,
             batch_size=cfg.train_cfg.batch_size,
-            **cfg.train_cfg.dataloader_cfg,
+            sampler=sampler,
+            **dataloader_cfg,
         )
     except ValueError as e:
         raise ValueError(
@@ -52,13 +326,21 @@ def get_dataloader(
 def train(
     cfg: ConfigHolder,
     dataloader: DataLoader,
-    logger: WandbLogger,
+    logger: BaseLogger,
     output_dir: Path,
     device: torch.device,
     val_dataset: MazeDataset | None = None,
+    val_dataset_tokens: list[list[str]] | None = None,
     zanj: ZANJ | None = None,
     model: ZanjHookedTransformer | None = None,
+    resume_state: dict[str, typing.Any] | None = None,
 ) -> ZanjHookedTransformer:
+    """train a model, saving checkpoints to `output_dir`
+
+    every checkpoint is saved together with a training state (see `get_train_state`). To
+    resume from one, pass it as `resume_state`, along with a dataloader created from its
+    `sampler` state -- training then continues exactly from the iteration after it
+    """
     # initialize
     # ==============================
     if zanj is None:
@@ -79,8 +361,44 @@ def train(
         model.parameters(),
         **cfg.train_cfg.optimizer_kwargs,
     )
+
+    scaler: torch.cuda.amp.GradScaler = get_grad_scaler(cfg.train_cfg.precision, device)
+
+    start_iteration: int = 0
+    if resume_state is not None:
+        start_iteration = resume_state["iteration"] + 1
+        logger.progress(f"Resuming training from iteration {start_iteration}")
+        model.load_state_dict(resume_state["model"])
+        optimizer.load_state_dict(resume_state["optimizer"])
+        if resume_state.get("scaler"):
+            scaler.load_state_dict(resume_state["scaler"])
     logger.summary(dict(model_n_params=model.cfg.n_params))
 
+    padding_mode: str = cfg.train_cfg.padding_mode
+    if padding_mode not in PADDING_MODES:
+        raise ValueError(
+            f"unknown padding mode {padding_mode = }, expected one of {PADDING_MODES}"
+        )
+    # a compiled step needs fixed sequence lengths
+    pad_to_buckets: bool = (
+        padding_mode != "longest" or cfg.train_cfg.compile_backend is not None
+    )
+    padding_idx: int = cfg.maze_tokenizer.padding_token_index
+
+    # the forward and backward passes go through `train_module` (compiled, and/or wrapped
+    # in DDP), everything else uses the model itself
+    compile_backend: str | None = cfg.train_cfg.compile_backend
+    train_module: torch.nn.Module = model
+    if compile_backend is not None:
+        logger.progress(f"Compiling training step with {compile_backend = }")
+        train_module = LeftPaddedForward(model, backend=compile_backend)
+    world_size: int = get_world_size()
+    if is_distributed():
+        logger.progress(f"Wrapping model in DDP, {world_size = }")
+        train_module = DistributedDataParallel(
+            train_module, device_ids=[device.index] if device.type == "cuda" else None
+        )
+
     # add wandb run url to model
     model.training_records = {
         "wandb_url": logger.url,
@@ -100,16 +418,24 @@ def train(
             )
             evals_enabled = False
 
-        val_dataset_tokens: list[list[str]] = val_dataset.as_tokens(
-            model.zanj_model_config.maze_tokenizer, join_tokens_individual_maze=False
-        )
+        if val_dataset_tokens is None:
+            val_dataset_tokens = val_dataset.as_tokens(
+                model.zanj_model_config.maze_tokenizer,
+                join_tokens_individual_maze=False,
+            )
+
+        # each process evaluates a shard, and the scores are reduced across processes
+        val_dataset, val_dataset_tokens = shard_dataset(val_dataset, val_dataset_tokens)
 
     # compute intervals
     n_samples: int = len(dataloader.dataset)
-    n_batches: int = len(dataloader)
+    grad_accumulation_steps: int = cfg.train_cfg.grad_accumulation_steps
+    effective_batch_size: int = cfg.train_cfg.effective_batch_size
+    n_batches: int = start_iteration + len(dataloader) // grad_accumulation_steps
     intervals: dict[str, int] = cfg.train_cfg.get_intervals(
         dataset_n_samples=n_samples,
         mod_batch_size=True,
+        world_size=world_size,
     )
     if not evals_enabled:
         intervals = {
@@ -117,12 +443,35 @@ def train(
             for key, value in intervals.items()
         }
     logger.summary(
-        {"n_batches": n_batches, "n_samples": n_samples, "intervals": intervals}
+        {
+            "n_batches": n_batches,
+            "n_samples": n_samples,
+            "effective_batch_size": effective_batch_size,
+            "intervals": intervals,
+        }
     )
     logger.progress(
-        f"will train for {n_batches} batches, {evals_enabled=}, with intervals: {intervals}"
+        f"will train for {n_batches} optimizer steps of {effective_batch_size} samples, {evals_enabled=}, with intervals: {intervals}"
     )
 
+    async_evaluator: AsyncEvaluator | None = None
+    if evals_enabled and cfg.train_cfg.async_evals and is_distributed():
+        warnings.warn(
+            "async evals can't reduce scores across processes, running evals synchronously"
+        )
+    elif evals_enabled and cfg.train_cfg.async_evals:
+        logger.progress("Starting background evaluator")
+        async_evaluator = AsyncEvaluator(
+            cfg=cfg,
+            logger=logger,
+            val_dataset=val_dataset,
+            val_dataset_tokens=val_dataset_tokens,
+        )
+
+    checkpoint_writer: AsyncCheckpointWriter | None = None
+    if cfg.train_cfg.async_checkpoints and is_main_process():
+        checkpoint_writer = AsyncCheckpointWriter(logger=logger, zanj=zanj)
+
     # TODO: add model output dir / run name to model.training_records
 
     # start up training
@@ -130,68 +479,229 @@ def train(
     model.train()
     logger.progress("Starting training")
 
-    for iteration, batch in enumerate(dataloader):
+    # creating the iterator draws a base seed, so restore the RNGs after it
+    dataloader_iter: typing.Iterator = iter(dataloader)
+    if resume_state is not None:
+        set_rng_state(resume_state["rng"])
+
+    # where the data order is resumed from, see `get_dataloader`
+    state_source: ResumableSampler | StreamingMazeDataset | None = (
+        dataloader.dataset
+        if isinstance(dataloader.dataset, StreamingMazeDataset)
+        else dataloader.sampler
+        if isinstance(dataloader.sampler, ResumableSampler)
+        else None
+    )
+
+    # `iteration` counts optimizer steps, each over `grad_accumulation_steps` micro-batches
+    micro_step: int = -1
+    loss_accumulated: float = 0.0
+    padding_stats: dict[str, int] = dict(n_tokens=0, n_padding=0)
+    teacher_forced_scores: dict[str, StatCounter] = dict()
+    # time spent in each part of the loop, summarized every `print_loss` steps
+    step_timer: StepTimer = StepTimer(device)
+    for micro_step, batch in enumerate(step_timer.time_iterator(dataloader_iter)):
+        with step_timer.section("data_wait"):
+            # string batches are tokenized here rather than in the forward pass, which is the same
+            batch: Int[torch.Tensor, "batch pos"] = (
+                batch if isinstance(batch, torch.Tensor) else model.to_tokens(batch)
+            )
+            if pad_to_buckets:
+                batch = pad_to_bucket(
+                    batch,
+                    padding_idx=padding_idx,
+                    bucket_size=PADDING_BUCKET_SIZE,
+                    max_len=min(cfg.dataset_cfg.seq_len_max, model.cfg.n_ctx),
+                )
+            batch_padding_stats: dict[str, int] = get_padding_stats(batch, padding_idx)
+            for key, value in batch_padding_stats.items():
+                padding_stats[key] += value
+            step_timer.count(
+                n_samples=batch.shape[0],
+                n_tokens=batch_padding_stats["n_tokens"]
+                - batch_padding_stats["n_padding"],
+            )
+            batch = batch.to(device)
+
         # forward pass
         # ------------------------------
         loss: SingleLoss
         logits: Float[torch.Tensor, "batch pos d_vocab"]
-        logits, loss = model(batch, return_type="both")
+        # with DDP, gradients are only all-reduced on the last micro-batch of an optimizer step
+        with (
+            train_module.no_sync()
+            if is_distributed() and (micro_step + 1) % grad_accumulation_steps != 0
+            else contextlib.nullcontext()
+        ):
+            with step_timer.section("forward"), autocast_context(
+                cfg.train_cfg.precision, device
+            ):
+                if cfg.train_cfg.path_only_loss:
+                    logits = train_module(batch, return_type="logits")
+                    loss = path_token_loss(
+                        logits, batch, get_path_target_mask(batch, cfg)
+                    )
+                elif padding_mode == "longest":
+                    logits, loss = train_module(batch, return_type="both")
+                else:
+                    logits = train_module(batch, return_type="logits")
+                    loss = next_token_loss_ignore_padding(logits, batch, padding_idx)
 
-        # backward pass
-        # ------------------------------
-        # Remove the last logit because it's the prediction for what comes after PATH_END (and so is meaningless)
-        # Do this after computing loss because the loss_fn already ignores the last logit
-        logits = logits[:, :-1, :]
-        loss.backward()
-        optimizer.step()
-        optimizer.zero_grad()
+            # backward pass
+            # ------------------------------
+            # each micro-batch contributes its share of the mean loss over the optimizer batch
+            with step_timer.section("backward"):
+                scaler.scale(loss / grad_accumulation_steps).backward()
+        loss_accumulated += float(loss) / grad_accumulation_steps
+
+        if cfg.train_cfg.teacher_forced_evals:
+            with step_timer.section("eval"):
+                for key, value in evaluate_logits(logits.detach(), batch, cfg).items():
+                    teacher_forced_scores.setdefault(key, StatCounter()).update(value)
+
+        del loss, logits
+
+        if (micro_step + 1) % grad_accumulation_steps != 0:
+            continue
+
+        iteration: int = start_iteration + micro_step // grad_accumulation_steps
+        with step_timer.section("optimizer"):
+            scaler.step(optimizer)
+            scaler.update()
+            optimizer.zero_grad()
+        step_timer.step()
 
         # log metrics
         # ------------------------------
-        metrics: dict[str, int | float | StatCounter] = {"loss": float(loss)}
-
-        if evals_enabled:
-            for interval_key, evals_dict in PathEvals.PATH_EVALS_MAP.items():
-                if iteration % intervals[interval_key] == 0:
-                    logger.progress(f"Running evals: {interval_key}")
-                    scores: dict[str, StatCounter] = evaluate_model(
-                        model=model,
-                        dataset=val_dataset,
-                        dataset_tokens=val_dataset_tokens,
-                        eval_functions=evals_dict,
-                        batch_size=cfg.train_cfg.batch_size,
-                        max_new_tokens=cfg.train_cfg.evals_max_new_tokens,
+        metrics: dict[str, int | float | StatCounter] = {
+            "loss": all_reduce_mean(loss_accumulated),
+            "tokens_per_batch": all_reduce_mean(
+                padding_stats["n_tokens"] / grad_accumulation_steps
+            ),
+            "pad_fraction": all_reduce_mean(get_padded_fraction(padding_stats)),
+            **reduce_stat_counters(teacher_forced_scores),
+        }
+        loss_accumulated = 0.0
+        padding_stats = dict(n_tokens=0, n_padding=0)
+        teacher_forced_scores = dict()
+
+        with step_timer.section("eval"):
+            if async_evaluator is not None:
+                evals_due: dict[str, PathEvalFunction] = dict()
+                for interval_key, evals_dict in PathEvals.PATH_EVALS_MAP.items():
+                    if iteration % intervals[interval_key] == 0:
+                        evals_due.update(evals_dict)
+                if evals_due:
+                    logger.progress(f"Queueing evals for iteration {iteration}")
+                    async_evaluator.submit(model, iteration, evals_due)
+                async_evaluator.log_completed()
+            elif evals_enabled:
+                eval_padding_stats: dict[str, int] = dict()
+                for interval_key, evals_dict in PathEvals.PATH_EVALS_MAP.items():
+                    if iteration % intervals[interval_key] == 0:
+                        logger.progress(f"Running evals: {interval_key}")
+                        scores: dict[str, StatCounter] = evaluate_model(
+                            model=model,
+                            dataset=val_dataset,
+                            dataset_tokens=val_dataset_tokens,
+                            eval_functions=evals_dict,
+                            batch_size=cfg.train_cfg.batch_size,
+                            max_new_tokens=cfg.train_cfg.evals_max_new_tokens,
+                            precision=cfg.train_cfg.precision,
+                            compile_backend=compile_backend,
+                            padding_stats=eval_padding_stats,
+                        )
+                        metrics.update(reduce_stat_counters(scores))
+                if eval_padding_stats:
+                    metrics["eval_pad_fraction"] = all_reduce_mean(
+                        get_padded_fraction(eval_padding_stats)
                     )
-                    metrics.update(scores)
-        logger.log_metric_hist(metrics)
 
         if iteration % intervals["print_loss"] == 0:
+            timing: dict[str, float] = step_timer.summary()
+            # throughput is summed over processes, timings are those of the main process
+            for key in ("throughput/samples_per_sec", "throughput/tokens_per_sec"):
+                timing[key] = all_reduce_mean(timing[key]) * world_size
+            metrics.update(timing)
             logger.progress(
-                f"iteration {iteration}/{n_batches}: loss={loss.item():.3f}"
+                f"iteration {iteration}/{n_batches} ({(iteration + 1) * effective_batch_size * world_size} samples): loss={metrics['loss']:.3f}, "
+                + f"{metrics['throughput/samples_per_sec']:.1f} samples/s, seconds per step: "
+                + ", ".join(
+                    f"{name}={metrics[f'timing/{name}']:.3f}"
+                    for name in (*STEP_SECTIONS, "step")
+                )
             )
-
-        del loss
+        logger.log_metric_hist(metrics)
 
         # checkpoints
         # ------------------------------
-        if iteration % intervals["checkpoint"] == 0:
-            model_save_path: Path = (
-                output_dir
-                / TRAIN_SAVE_FILES.checkpoints
-                / TRAIN_SAVE_FILES.model_checkpt_zanj(iteration)
-            )
-            logger.progress(f"Saving model checkpoint to {model_save_path.as_posix()}")
-            zanj.save(model, model_save_path)
-            logger.upload_model(
-                model_save_path, aliases=["latest", f"iter-{iteration}"]
-            )
+        if iteration % intervals["checkpoint"] == 0 and is_main_process():
+            with step_timer.section("checkpoint"):
+                model_save_path: Path = (
+                    output_dir
+                    / TRAIN_SAVE_FILES.checkpoints
+                    / TRAIN_SAVE_FILES.model_checkpt_zanj(iteration)
+                )
+                train_state_path: Path = (
+                    output_dir
+                    / TRAIN_SAVE_FILES.checkpoints
+                    / TRAIN_SAVE_FILES.train_state_checkpt(iteration)
+                )
+                train_state: dict[str, typing.Any] = get_train_state(
+                    model,
+                    optimizer,
+                    iteration,
+                    scaler=scaler,
+                    sampler_state=(
+                        state_source.state_dict(
+                            (iteration + 1) * effective_batch_size * world_size
+                        )
+                        if state_source is not None
+                        else None
+                    ),
+                )
+                logger.progress(
+                    f"Saving model checkpoint to {model_save_path.as_posix()}"
+                )
+                if checkpoint_writer is not None:
+                    checkpoint_writer.save(
+                        model,
+                        model_save_path,
+                        aliases=["latest", f"iter-{iteration}"],
+                        train_state=train_state,
+                        train_state_path=train_state_path,
+                    )
+                else:
+                    save_train_state(train_state, train_state_path)
+                    zanj.save(model, model_save_path)
+                    logger.upload_model(
+                        model_save_path, aliases=["latest", f"iter-{iteration}"]
+                    )
+
+    if (micro_step + 1) % grad_accumulation_steps != 0:
+        logger.progress(
+            f"Discarding gradients of the last {(micro_step + 1) % grad_accumulation_steps} micro-batches, which do not fill an optimizer step"
+        )
+        optimizer.zero_grad()
+
+    if async_evaluator is not None:
+        logger.progress("Waiting for background evals to finish")
+        async_evaluator.close()
 
     # save the final model
     # ==============================
     final_model_path: Path = output_dir / TRAIN_SAVE_FILES.model_final_zanj
-    logger.progress(f"Saving final model to {final_model_path.as_posix()}")
-    zanj.save(model, final_model_path)
-    logger.upload_model(final_model_path, aliases=["latest", "final"])
+    if not is_main_process():
+        pass
+    elif checkpoint_writer is not None:
+        logger.progress(f"Saving final model to {final_model_path.as_posix()}")
+        checkpoint_writer.save(model, final_model_path, aliases=["latest", "final"])
+        logger.progress("Waiting for checkpoints to be written")
+        checkpoint_writer.close()
+    else:
+        logger.progress(f"Saving final model to {final_model_path.as_posix()}")
+        zanj.save(model, final_model_path)
+        logger.upload_model(final_model_path, aliases=["latest", "final"])
 
     logger.progress("Done training!")
 
@@ -1,7 +1,5 @@
 from __future__ import annotations
 
-import logging
-import sys
 from enum import Enum
 from pathlib import Path
 from typing import Any, Dict, Union
@@ -10,6 +8,8 @@ import wandb
 from muutils.statcounter import StatCounter
 from wandb.sdk.wandb_run import Artifact, Run
 
+from maze_transformer.training.base_logger import BaseLogger, setup_logging
+
 
 class WandbProject(Enum):
     UNDERSTANDING_SEARCH = "understanding-search"
@@ -22,20 +22,17 @@ class WandbJobType(Enum):
     TRAIN_MODEL = "train-model"
 
 
-class WandbLogger:
+class WandbLogger(BaseLogger):
     def __init__(self, run: Run):
         self._run: Run = run
+        # metrics plotted against the "iteration" they were logged with, see `log_metric_hist`
+        self._iteration_metrics: set[str] = set()
 
     @classmethod
     def create(
         cls, config: Dict, project: Union[WandbProject, str], job_type: WandbJobType
     ) -> WandbLogger:
-        logging.basicConfig(
-            stream=sys.stdout,
-            level=logging.INFO,
-            format="%(asctime)s %(levelname)s %(message)s",
-            datefmt="%Y-%m-%d %H:%M:%S",
-        )
+        setup_logging()
 
         run: Run = wandb.init(
             config=config,
@@ -71,6 +68,14 @@ class WandbLogger:
                 # data_processed[key + "-std"] = value.std()
             else:
                 data_processed[key] = value
+        if "iteration" in data_processed:
+            # results logged after the fact (i.e. by `AsyncEvaluator`) land on a later wandb
+            # step, so they are plotted against the iteration they belong to instead
+            if not self._iteration_metrics:
+                self._run.define_metric("iteration")
+            for key in data_processed.keys() - self._iteration_metrics - {"iteration"}:
+                self._run.define_metric(key, step_metric="iteration")
+                self._iteration_metrics.add(key)
         self._run.log(data_processed)
 
     def summary(self, data: Dict[str, Any]) -> None:
@@ -79,7 +84,3 @@ class WandbLogger:
     @property
     def url(self) -> str:
         return self._run.get_url()
-
-    @staticmethod
-    def progress(message: str) -> None:
-        logging.info(message)
@@ -0,0 +1,182 @@
+import functools
+import typing
+import weakref
+
+import fancy_einsum
+import torch
+from jaxtyping import Bool, Float, Int
+from transformer_lens import HookedTransformer
+from transformer_lens import utils as tl_utils
+
+# value `HookedTransformer` fills masked attention scores with
+ATTN_SCORES_IGNORE: float = -1e5
+
+_convert_equation_uncached: typing.Callable[[str], str] = fancy_einsum.convert_equation
+
+
+@torch._dynamo.assume_constant_result
+def _convert_equation_constant(equation: str) -> str:
+    """`fancy_einsum.convert_equation`, which dynamo evaluates while tracing instead of tracing into"""
+    return _convert_equation_uncached(equation)
+
+
+def cache_einsum_equations() -> None:
+    """make the einsums in TransformerLens traceable by `torch.compile`
+
+    `fancy_einsum` parses the equation of every einsum with regexes, which dynamo can't
+    trace, so each einsum causes a graph break (and there are several per layer). The
+    parsed equation only depends on the equation string, so dynamo can instead treat it
+    as a constant. Only called when compiling, calling it more than once does nothing
+
+    the torch backend of `fancy_einsum` is also registered up front, since it is otherwise
+    registered on the first einsum, which would trigger a recompile
+    """
+    fancy_einsum.convert_equation = _convert_equation_constant
+    fancy_einsum.get_backend(torch.zeros(()))
+
+
+class AttentionMaskHook:
+    """`hook_attn_scores` hook which fills the attention scores outside `mask` like the causal mask does
+
+    the same instance is used for every forward pass of a model (see `get_attention_mask_hook`),
+    since `torch.compile` guards on the identity of the hooks it traces through
+    """
+
+    def __init__(self) -> None:
+        self.mask: Bool[torch.Tensor, "batch 1 pos_query pos_key"] | None = None
+
+    def __call__(
+        self,
+        attn_scores: Float[torch.Tensor, "batch head_index pos_query pos_key"],
+        hook,
+    ) -> Float[torch.Tensor, "batch head_index pos_query pos_key"]:
+        return attn_scores.masked_fill(~self.mask, ATTN_SCORES_IGNORE)
+
+
+_ATTENTION_MASK_HOOKS: "weakref.WeakKeyDictionary[HookedTransformer, AttentionMaskHook]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_attention_mask_hook(model: HookedTransformer) -> AttentionMaskHook:
+    """the `AttentionMaskHook` for `model`, created on first use"""
+    if model not in _ATTENTION_MASK_HOOKS:
+        _ATTENTION_MASK_HOOKS[model] = AttentionMaskHook()
+    return _ATTENTION_MASK_HOOKS[model]
+
+
+def get_left_padding_causal_mask(
+    left_attention_mask: Int[torch.Tensor, "batch pos"],
+) -> Bool[torch.Tensor, "batch 1 pos pos"]:
+    """causal mask for left-padded sequences, with tensor ops only
+
+    same as `transformer_lens.utils.get_causal_mask_for_left_padding`, which builds the mask
+    row by row from python ints and so can't be compiled: padding neither attends nor is attended to
+    """
+    attended: Bool[torch.Tensor, "batch pos"] = left_attention_mask.bool()
+    n_pos: int = attended.shape[1]
+    causal: Bool[torch.Tensor, "pos pos"] = torch.ones(
+        (n_pos, n_pos), dtype=torch.bool, device=attended.device
+    ).tril()
+    return (causal[None] & attended[:, :, None] & attended[:, None, :])[:, None]
+
+
+class LeftPaddedForward(torch.nn.Module):
+    """the forward pass of a `HookedTransformer` on left-padded tokens, which can be compiled
+
+    `HookedTransformer.forward` builds the causal mask for left padding in a python loop over
+    the batch, which `torch.compile` can't trace. Here the same mask is built with tensor ops
+    (see `get_left_padding_causal_mask`) and applied via `hook_attn_scores`, so the outputs are
+    the same as those of `model(tokens, return_type=...)`. With `backend`, everything but
+    setting up the mask is compiled, with static shapes -- pad the tokens to a few fixed
+    lengths (see `pad_to_bucket`) to avoid recompiling for every batch
+
+    gradients flow to the parameters of `model`, so this can be trained (and wrapped in DDP)
+    in place of the model itself
+    """
+
+    def __init__(self, model: HookedTransformer, backend: str | None = None) -> None:
+        super().__init__()
+        assert (
+            model.cfg.positional_embedding_type == "standard"
+        ), f"only standard positional embeddings are supported, got {model.cfg.positional_embedding_type = }"
+        self.model: HookedTransformer = model
+        self.backend: str | None = backend
+        self.mask_hook: AttentionMaskHook = get_attention_mask_hook(model)
+        self._forward_masked: typing.Callable = self._forward_masked_eager
+        if backend is not None:
+            cache_einsum_equations()
+            self._forward_masked = torch.compile(
+                self._forward_masked_eager, backend=backend, dynamic=False
+            )
+
+    def forward(
+        self,
+        tokens: Int[torch.Tensor, "batch pos"],
+        return_type: typing.Literal["logits", "loss", "both"] = "logits",
+    ) -> (
+        Float[torch.Tensor, "batch pos d_vocab"]
+        | Float[torch.Tensor, ""]
+        | tuple[Float[torch.Tensor, "batch pos d_vocab"], Float[torch.Tensor, ""]]
+    ):
+        model: HookedTransformer = self.model
+        tokens = tokens.to(model.cfg.device)
+        left_attention_mask: Int[torch.Tensor, "batch pos"] | None = None
+        if model.tokenizer is not None and model.tokenizer.padding_side == "left":
+            left_attention_mask = tl_utils.get_attention_mask(
+                model.tokenizer, tokens, model.cfg.default_prepend_bos
+            )
+
+        logits: Float[torch.Tensor, "batch pos d_vocab"]
+        loss: Float[torch.Tensor, ""]
+        if left_attention_mask is None:
+            logits, loss = self._forward_masked(tokens, left_attention_mask)
+        else:
+            with model.hooks(
+                fwd_hooks=[
+                    (f"blocks.{i}.attn.hook_attn_scores", self.mask_hook)
+                    for i in range(model.cfg.n_layers)
+                ]
+            ):
+                logits, loss = self._forward_masked(tokens, left_attention_mask)
+            self.mask_hook.mask = None
+
+        if return_type == "logits":
+            return logits
+        elif return_type == "loss":
+            return loss
+        elif return_type == "both":
+            return logits, loss
+        else:
+            raise ValueError(f"Invalid {return_type = }")
+
+    def _forward_masked_eager(
+        self,
+        tokens: Int[torch.Tensor, "batch pos"],
+        left_attention_mask: Int[torch.Tensor, "batch pos"] | None,
+    ) -> tuple[Float[torch.Tensor, "batch pos d_vocab"], Float[torch.Tensor, ""]]:
+        model: HookedTransformer = self.model
+        if left_attention_mask is not None:
+            # set here, so the mask is part of the compiled graph
+            self.mask_hook.mask = get_left_padding_causal_mask(left_attention_mask)
+        if model.cfg.use_hook_tokens:
+            tokens = model.hook_tokens(tokens)
+        residual: Float[torch.Tensor, "batch pos d_model"] = model.hook_embed(
+            model.embed(tokens)
+        ) + model.hook_pos_embed(model.pos_embed(tokens, 0, left_attention_mask))
+        for block in model.blocks:
+            residual = block(residual)
+        if model.cfg.normalization_type is not None:
+            residual = model.ln_final(residual)
+        logits: Float[torch.Tensor, "batch pos d_vocab"] = model.unembed(residual)
+        return logits, model.loss_fn(logits, tokens)
+
+
+@functools.lru_cache(maxsize=None)
+def compile_dynamic(
+    fn: typing.Callable,
+    backend: str,
+) -> typing.Callable:
+    """`torch.compile(fn, backend=backend, dynamic=True)`, compiled once per `fn` and `backend`"""
+    cache_einsum_equations()
+    return torch.compile(fn, backend=backend, dynamic=True)
@@ -1,3 +1,4 @@
+import typing
 from typing import Literal
 
 import torch
@@ -5,6 +6,13 @@ import torch.nn.functional as F
 from jaxtyping import Int
 from muutils.mlutils import chunks
 
+# how batches are padded during training, see `TrainConfig.padding_mode`
+PaddingMode = Literal["longest", "bucket", "length_class"]
+PADDING_MODES: tuple[PaddingMode, ...] = typing.get_args(PaddingMode)
+
+# bucketed batches are padded to a multiple of this many tokens, see `pad_to_bucket`
+PADDING_BUCKET_SIZE: int = 32
+
 
 def pad_and_batch_tensors(
     contexts_tokens: list[list[int]],
@@ -13,8 +21,15 @@ def pad_and_batch_tensors(
     padding_dir: Literal["left", "right"],
     min_len: int = 0,
     max_len: int | None = None,
+    bucket_by_length: bool = False,
 ) -> list[Int[torch.Tensor, "batch pos"]]:
-    """Pad and stack the tensors"""
+    """Pad and stack the tensors
+
+    if `bucket_by_length` is set, contexts are sorted by length before chunking, so that each
+    batch holds contexts of similar length and needs less padding. The batches are then in
+    the order given by `get_length_bucket_order(contexts_tokens)`, use `restore_order` to
+    map anything computed from them back to the original order
+    """
 
     assert padding_dir in [
         "left",
@@ -29,6 +44,11 @@ def pad_and_batch_tensors(
             f"Sequence length exceeds the maximum allowed length: {max_len}"
         )
 
+    if bucket_by_length:
+        contexts_tokens = [
+            contexts_tokens[i] for i in get_length_bucket_order(contexts_tokens)
+        ]
+
     contexts_tensored: list[Int[torch.Tensor, "batch pos"]] = []
     batch: list[list[int]]
     for batch in chunks(contexts_tokens, batch_size):
@@ -51,3 +71,65 @@ def pad_and_batch_tensors(
         contexts_tensored.append(batch_tensor)
 
     return contexts_tensored
+
+
+def get_length_bucket_order(contexts_tokens: list[list[int]]) -> list[int]:
+    """indices which (stably) sort the contexts by length"""
+    return sorted(range(len(contexts_tokens)), key=lambda i: len(contexts_tokens[i]))
+
+
+def restore_order(items: list, order: list[int]) -> list:
+    """inverse of `[items[i] for i in order]`"""
+    assert len(items) == len(
+        order
+    ), f"items and order must be the same length, got {len(items) = } and {len(order) = }"
+    output: list = [None] * len(items)
+    for item, i in zip(items, order):
+        output[i] = item
+    return output
+
+
+def update_padding_stats(
+    padding_stats: dict[str, int],
+    contexts_tensored: list[Int[torch.Tensor, "batch pos"]],
+    contexts_tokens: list[list[int]],
+) -> None:
+    """add the total number of tokens in the batches and how many are padding to `padding_stats`"""
+    n_tokens: int = sum(batch.numel() for batch in contexts_tensored)
+    n_padding: int = n_tokens - sum(len(x) for x in contexts_tokens)
+    padding_stats["n_tokens"] = padding_stats.get("n_tokens", 0) + n_tokens
+    padding_stats["n_padding"] = padding_stats.get("n_padding", 0) + n_padding
+
+
+def get_padded_fraction(padding_stats: dict[str, int]) -> float:
+    """fraction of the tokens counted in `padding_stats` which were padding"""
+    n_tokens: int = padding_stats.get("n_tokens", 0)
+    return padding_stats.get("n_padding", 0) / n_tokens if n_tokens > 0 else 0.0
+
+
+def pad_to_bucket(
+    tokens: Int[torch.Tensor, "batch pos"],
+    padding_idx: int,
+    bucket_size: int,
+    max_len: int | None = None,
+) -> Int[torch.Tensor, "batch pos_padded"]:
+    """left-pad `tokens` to the next multiple of `bucket_size` (but at most `max_len`)
+
+    so that batches only ever have a few fixed sequence lengths, which a compiled model needs
+    """
+    length: int = tokens.shape[1]
+    length_padded: int = -(-length // bucket_size) * bucket_size
+    if max_len is not None:
+        length_padded = max(min(length_padded, max_len), length)
+    return F.pad(tokens, (length_padded - length, 0), value=padding_idx)
+
+
+def get_padding_stats(
+    tokens: Int[torch.Tensor, "batch pos"],
+    padding_idx: int,
+) -> dict[str, int]:
+    """total number of tokens in a padded batch, and how many are padding, as in `update_padding_stats`"""
+    return dict(
+        n_tokens=tokens.numel(),
+        n_padding=int((tokens == padding_idx).sum()),
+    )
@@ -0,0 +1,55 @@
+import contextlib
+from typing import Literal
+
+import torch
+
+Precision = Literal["fp32", "bf16", "fp16"]
+
+PRECISION_DTYPES: dict[str, torch.dtype] = {
+    "fp32": torch.float32,
+    "bf16": torch.bfloat16,
+    "fp16": torch.float16,
+}
+
+
+def check_precision(precision: str, device: torch.device | str | None = None) -> None:
+    """raise a `ValueError` if `precision` is unknown, or not supported on `device`"""
+    if precision not in PRECISION_DTYPES:
+        raise ValueError(
+            f"unknown precision {precision = }, expected one of {list(PRECISION_DTYPES)}"
+        )
+    if (
+        precision == "fp16"
+        and device is not None
+        and torch.device(device).type != "cuda"
+    ):
+        raise ValueError(
+            f"fp16 autocast is only supported on CUDA, use 'bf16' on {device = }"
+        )
+
+
+def autocast_context(
+    precision: Precision,
+    device: torch.device | str,
+) -> contextlib.AbstractContextManager:
+    """`torch.autocast` to the dtype for `precision` on `device`, or a no-op for fp32"""
+    check_precision(precision, device)
+    if precision == "fp32":
+        return contextlib.nullcontext()
+    return torch.autocast(
+        device_type=torch.device(device).type,
+        dtype=PRECISION_DTYPES[precision],
+    )
+
+
+def get_grad_scaler(
+    precision: Precision,
+    device: torch.device | str,
+) -> torch.cuda.amp.GradScaler:
+    """a `GradScaler`, which is only enabled for fp16 (bf16 has the range of fp32)
+
+    when disabled, `scaler.scale(loss)` and `scaler.step(optimizer)` are plain
+    `loss` and `optimizer.step()`, so the training loop can always go through it
+    """
+    check_precision(precision, device)
+    return torch.cuda.amp.GradScaler(enabled=precision == "fp16")
@@ -0,0 +1 @@
+"""benchmarks of the data pipeline and the model, run via `python -m scripts.benchmarks <name>`"""
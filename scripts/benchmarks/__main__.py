@@ -0,0 +1,25 @@
+import fire
+
+from scripts.benchmarks.data_pipeline import benchmark_data_pipeline
+from scripts.benchmarks.model import benchmark_model
+from scripts.benchmarks.torch_compile import benchmark_compile
+
+BENCHMARKS: dict = dict(
+    data=benchmark_data_pipeline,
+    model=benchmark_model,
+    compile=benchmark_compile,
+)
+
+
+def main(command: list[str] | None = None) -> None:
+    """run a benchmark from the command line (or `command`), as `<name> --<param> <value> ...`"""
+    fire.Fire(
+        BENCHMARKS,
+        command=command,
+        # the results are already printed (and saved) by `report`
+        serialize=lambda results: None,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import datetime
+import json
+import platform
+import sys
+import time
+import typing
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from maze_transformer.training.step_timer import get_peak_memory_mb
+
+# a benchmark is a regression if its median time grew by more than this fraction of the baseline
+DEFAULT_TOLERANCE: float = 0.2
+
+
+def as_tuple(value: typing.Any, item_type: type) -> tuple:
+    """a sequence argument from the command line as a tuple of `item_type`
+
+    fire passes a single value (`--num_workers 0`) as is, and leaves a list it can't parse
+    as a literal (`--model_cfgs [nano-v1,tiny-v1]`, with unquoted strings) as a string,
+    which is split on commas here
+    """
+    if isinstance(value, str):
+        value = [
+            item.strip().strip("'\"")
+            for item in value.strip().strip("[]()").split(",")
+            if item.strip()
+        ]
+    elif not isinstance(value, typing.Iterable):
+        value = [value]
+    return tuple(item_type(item) for item in value)
+
+
+def summarize_times(times: typing.Sequence[float], n_items: int) -> dict[str, float]:
+    """latency percentiles in seconds per call from the `times` of calls processing `n_items` items each, and the throughput in items/sec at the median"""
+    times_arr: np.ndarray = np.array(times)
+    median: float = float(np.median(times_arr))
+    return dict(
+        n_items=n_items,
+        n_repeats=len(times_arr),
+        mean_sec=float(times_arr.mean()),
+        min_sec=float(times_arr.min()),
+        median_sec=median,
+        p90_sec=float(np.percentile(times_arr, 90)),
+        p99_sec=float(np.percentile(times_arr, 99)),
+        items_per_sec=n_items / median,
+    )
+
+
+def time_fn(
+    fn: typing.Callable[[], typing.Any],
+    n_items: int = 1,
+    n_repeats: int = 5,
+    n_warmup: int = 1,
+    device: torch.device | None = None,
+) -> dict[str, float]:
+    """time `n_repeats` calls of `fn` (after `n_warmup` untimed ones), each processing `n_items` items, see `summarize_times`
+
+    with a `device`, CUDA is synchronized after every call, and the peak memory over the
+    timed calls is added as `peak_memory_mb` (see `get_peak_memory_mb`)
+    """
+    if n_repeats < 1:
+        raise ValueError(f"need at least one timed call, got {n_repeats = }")
+    for _ in range(n_warmup):
+        fn()
+    if device is not None:
+        get_peak_memory_mb(device)
+    times: list[float] = list()
+    for _ in range(n_repeats):
+        start: float = time.perf_counter()
+        fn()
+        if device is not None and device.type == "cuda":
+            torch.cuda.synchronize(device)
+        times.append(time.perf_counter() - start)
+    output: dict[str, float] = summarize_times(times, n_items)
+    if device is not None:
+        peak_memory_mb: float | None = get_peak_memory_mb(device)
+        output["peak_memory_mb"] = (
+            peak_memory_mb if peak_memory_mb is not None else float("nan")
+        )
+    return output
+
+
+def get_environment() -> dict[str, str]:
+    """what the results depend on besides the code, saved with them"""
+    return dict(
+        timestamp=datetime.datetime.now().isoformat(),
+        python=sys.version.split()[0],
+        torch=torch.__version__,
+        platform=platform.platform(),
+        processor=platform.processor(),
+        num_threads=str(torch.get_num_threads()),
+    )
+
+
+def compare_to_baseline(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]],
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> list[str]:
+    """the benchmarks in both `results` and `baseline` whose median time grew by more than `tolerance`, as messages"""
+    regressions: list[str] = list()
+    for name, metrics in results.items():
+        if name not in baseline:
+            continue
+        ratio: float = metrics["median_sec"] / baseline[name]["median_sec"]
+        if ratio > 1 + tolerance:
+            regressions.append(
+                f"{name}: median {metrics['median_sec']:.4g}s vs baseline {baseline[name]['median_sec']:.4g}s ({ratio:.2f}x)"
+            )
+    return regressions
+
+
+def report(
+    results: dict[str, dict[str, float]],
+    params: dict[str, typing.Any],
+    output: str | Path | None = None,
+    baseline: str | Path | None = None,
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> dict[str, dict[str, float]]:
+    """print `results`, save them with `params` as json to `output`, and flag regressions against the `baseline` json
+
+    exits with status 1 if there are any regressions, so this can gate CI
+    """
+    for name, metrics in results.items():
+        print(
+            f"{name:<48} median {metrics['median_sec']:.4g}s  p90 {metrics['p90_sec']:.4g}s  {metrics['items_per_sec']:.1f} items/s"
+            + (
+                f"  peak {metrics['peak_memory_mb']:.0f} MB"
+                if "peak_memory_mb" in metrics
+                else ""
+            )
+        )
+
+    if output is not None:
+        output = Path(output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(
+                dict(environment=get_environment(), params=params, results=results),
+                f,
+                indent="\t",
+            )
+        print(f"saved results to {output.as_posix()}")
+
+    if baseline is not None:
+        with open(baseline) as f:
+            baseline_data: dict = json.load(f)
+        if baseline_data["params"] != params:
+            print(
+                f"warning: params differ from the baseline's, comparison may be meaningless: {baseline_data['params'] = }"
+            )
+        regressions: list[str] = compare_to_baseline(
+            results, baseline_data["results"], tolerance
+        )
+        if regressions:
+            print(f"{len(regressions)} regressions (tolerance {tolerance:.0%}):")
+            for message in regressions:
+                print(f"  REGRESSION {message}")
+            sys.exit(1)
+        print(f"no regressions against {Path(baseline).as_posix()}")
+
+    return results
@@ -0,0 +1,154 @@
+import tempfile
+import typing
+from copy import deepcopy
+from pathlib import Path
+
+from maze_dataset import MazeDataset, MazeDatasetConfig, SolvedMaze
+from maze_dataset.tokenization import MazeTokenizer, TokenizationMode
+from muutils.mlutils import chunks
+from torch.utils.data import DataLoader
+
+from maze_transformer.test_helpers.stub_logger import StubLogger
+from maze_transformer.tokenizer import HuggingMazeTokenizer
+from maze_transformer.training.config import GPT_CONFIGS, TRAINING_CONFIGS, ConfigHolder
+from maze_transformer.training.dataset_generation import generate_datasets
+from maze_transformer.training.training import collate_batch, get_dataloader
+from maze_transformer.utils.padding import pad_and_batch_tensors
+from scripts.benchmarks.common import DEFAULT_TOLERANCE, as_tuple, report, time_fn
+
+
+def benchmark_data_pipeline(
+    grid_n: int = 6,
+    n_mazes: int = 1000,
+    batch_size: int = 32,
+    num_workers: int | typing.Sequence[int] = (0, 2, 4),
+    n_repeats: int = 5,
+    tokenization_mode: str = "AOTP_UT_uniform",
+    output: str | None = None,
+    baseline: str | None = None,
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> dict[str, dict[str, float]]:
+    """time each stage of the data pipeline, from generating mazes to batches out of a `DataLoader`
+
+    every benchmark processes all `n_mazes` mazes (in batches of `batch_size` where that
+    applies), so `items_per_sec` is in mazes/sec. Results are saved as json to `output`,
+    and compared against an earlier `output` passed as `baseline` (see `report`)
+    """
+    num_workers = as_tuple(num_workers, int)
+    params: dict = dict(
+        grid_n=grid_n,
+        n_mazes=n_mazes,
+        batch_size=batch_size,
+        num_workers=list(num_workers),
+        n_repeats=n_repeats,
+        tokenization_mode=tokenization_mode,
+    )
+    cfg: ConfigHolder = ConfigHolder(
+        train_cfg=deepcopy(TRAINING_CONFIGS["test-v1"]),
+        model_cfg=GPT_CONFIGS["tiny-v1"],
+        dataset_cfg=MazeDatasetConfig(name="benchmark", grid_n=grid_n, n_mazes=n_mazes),
+        maze_tokenizer=MazeTokenizer(
+            tokenization_mode=TokenizationMode[tokenization_mode]
+        ),
+    )
+    cfg.train_cfg.batch_size = batch_size
+    maze_tokenizer: MazeTokenizer = cfg.maze_tokenizer
+    results: dict[str, dict[str, float]] = dict()
+
+    # generation
+    results["generate/MazeDataset.generate"] = time_fn(
+        lambda: MazeDataset.generate(cfg.dataset_cfg),
+        n_items=n_mazes,
+        n_repeats=n_repeats,
+        n_warmup=0,
+    )
+
+    def _generate_datasets() -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            generate_datasets([cfg.dataset_cfg], local_base_path=Path(temp_dir))
+
+    results["generate/generate_datasets"] = time_fn(
+        _generate_datasets, n_items=n_mazes, n_repeats=n_repeats, n_warmup=0
+    )
+    dataset: MazeDataset = MazeDataset.generate(cfg.dataset_cfg)
+    mazes: list[SolvedMaze] = dataset.mazes
+
+    # tokenization
+    results["tokenize/as_tokens"] = time_fn(
+        lambda: dataset.as_tokens(maze_tokenizer, join_tokens_individual_maze=False),
+        n_items=n_mazes,
+        n_repeats=n_repeats,
+    )
+    results["tokenize/collate_batch"] = time_fn(
+        lambda: [
+            collate_batch(batch, maze_tokenizer) for batch in chunks(mazes, batch_size)
+        ],
+        n_items=n_mazes,
+        n_repeats=n_repeats,
+    )
+    batches_str: list[list[str]] = [
+        collate_batch(batch, maze_tokenizer) for batch in chunks(mazes, batch_size)
+    ]
+    tokenizer: HuggingMazeTokenizer = cfg.tokenizer
+    results["tokenize/HuggingMazeTokenizer.encode"] = time_fn(
+        lambda: [
+            tokenizer(batch, return_tensors="pt", padding=True) for batch in batches_str
+        ],
+        n_items=n_mazes,
+        n_repeats=n_repeats,
+    )
+    batches_ids: list = [
+        tokenizer(batch, return_tensors="pt", padding=True)["input_ids"]
+        for batch in batches_str
+    ]
+    results["tokenize/HuggingMazeTokenizer.batch_decode"] = time_fn(
+        lambda: [tokenizer.batch_decode(batch) for batch in batches_ids],
+        n_items=n_mazes,
+        n_repeats=n_repeats,
+    )
+    contexts_tokens: list[list[int]] = [
+        maze_tokenizer.encode(tokens)
+        for tokens in dataset.as_tokens(
+            maze_tokenizer, join_tokens_individual_maze=False
+        )
+    ]
+    results["tokenize/pad_and_batch_tensors"] = time_fn(
+        lambda: pad_and_batch_tensors(
+            contexts_tokens,
+            batch_size=batch_size,
+            padding_idx=maze_tokenizer.padding_token_index,
+            padding_dir="left",
+        ),
+        n_items=n_mazes,
+        n_repeats=n_repeats,
+    )
+
+    # a full pass over the dataloader, as in training
+    for n in num_workers:
+        for pretokenize in (False, True):
+            cfg.train_cfg.dataloader_cfg = dict(
+                shuffle=True, num_workers=n, drop_last=False
+            )
+            dataloader: DataLoader = get_dataloader(
+                dataset, cfg, StubLogger(), pretokenize=pretokenize
+            )
+            key: str = "pretokenized" if pretokenize else "strings"
+            results[f"dataloader/{key}/num_workers_{n}"] = time_fn(
+                lambda: list(dataloader), n_items=n_mazes, n_repeats=n_repeats
+            )
+
+    # deduplication
+    results["dedup/remove_duplicates"] = time_fn(
+        lambda: dataset.filter_by.remove_duplicates(),
+        n_items=n_mazes,
+        n_repeats=n_repeats,
+        n_warmup=0,
+    )
+    results["dedup/remove_duplicates_fast"] = time_fn(
+        lambda: dataset.filter_by.remove_duplicates_fast(),
+        n_items=n_mazes,
+        n_repeats=n_repeats,
+        n_warmup=0,
+    )
+
+    return report(results, params, output, baseline, tolerance)
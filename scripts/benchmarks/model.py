@@ -0,0 +1,222 @@
+import tempfile
+import typing
+from copy import deepcopy
+from pathlib import Path
+
+import torch
+from maze_dataset import MazeDataset, MazeDatasetConfig
+
+from maze_transformer.evaluation.baseline_models import RandomBaseline
+from maze_transformer.evaluation.eval_model import predict_maze_paths
+from maze_transformer.test_helpers.stub_logger import StubLogger
+from maze_transformer.training.config import (
+    GPT_CONFIGS,
+    TRAINING_CONFIGS,
+    ConfigHolder,
+    ZanjHookedTransformer,
+)
+from maze_transformer.training.train_save_files import TRAIN_SAVE_FILES
+from maze_transformer.training.training import get_dataloader, train
+from scripts.benchmarks.common import (
+    DEFAULT_TOLERANCE,
+    as_tuple,
+    report,
+    summarize_times,
+    time_fn,
+)
+
+
+class _MetricsLogger(StubLogger):
+    """keeps the metrics `train` logs at each step, and drops its progress messages"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.metrics: list[dict] = list()
+
+    def log_metric_hist(self, data: dict, *args, **kwargs) -> None:
+        self.metrics.append(data)
+
+    def progress(self, message: str) -> None:
+        pass
+
+
+def _benchmark_train_step(
+    cfg: ConfigHolder,
+    dataset: MazeDataset,
+    device: torch.device,
+    n_repeats: int,
+    n_warmup: int,
+) -> dict[str, float]:
+    """per-step timings of `train`, from the `timing/step` it logs at every step
+
+    the first `n_warmup` steps are dropped, and so is the one after them: the checkpoint
+    `train` saves at step 0 is timed as part of the following step
+    """
+    cfg = deepcopy(cfg)
+    cfg.train_cfg.validation_dataset_cfg = None
+    cfg.train_cfg.intervals_count = None
+    cfg.train_cfg.intervals = dict(print_loss=1, checkpoint=0, eval_fast=0, eval_slow=0)
+    logger: _MetricsLogger = _MetricsLogger()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_dir: Path = Path(temp_dir)
+        (output_dir / TRAIN_SAVE_FILES.checkpoints).mkdir()
+        train(
+            cfg=cfg,
+            dataloader=get_dataloader(dataset, cfg, logger),
+            logger=logger,
+            output_dir=output_dir,
+            device=device,
+        )
+    metrics: list[dict] = logger.metrics[n_warmup + 1 :][:n_repeats]
+    output: dict[str, float] = summarize_times(
+        [m["timing/step"] for m in metrics], cfg.train_cfg.batch_size
+    )
+    output["peak_memory_mb"] = max(m["memory/peak_mb"] for m in metrics)
+    return output
+
+
+def benchmark_model(
+    model_cfgs: str | typing.Sequence[str] = tuple(GPT_CONFIGS.keys()),
+    seq_lens: int | typing.Sequence[int] = (128, 512),
+    grid_n: int = 5,
+    batch_size: int = 16,
+    n_mazes: int = 32,
+    max_new_tokens: int = 16,
+    n_repeats: int = 10,
+    n_warmup: int = 2,
+    n_threads: int | None = None,
+    seed: int = 0,
+    device: str = "cpu",
+    output: str | None = None,
+    baseline: str | None = None,
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> dict[str, dict[str, float]]:
+    """time the model on its own, in training, and generating paths, for each of `model_cfgs`
+
+    - `forward` and `forward_backward`: a batch of `batch_size` random token sequences of
+      each of `seq_lens`, in tokens/sec
+    - `train_step`: a step of `train` on batches of mazes of size `grid_n`, in samples/sec
+    - `predict_maze_paths/per_sample` and `/batched`: predicting the paths of `n_mazes`
+      mazes one at a time, or in batches of `batch_size`, in mazes/sec
+    - `RandomBaseline.generate`: the same mazes solved by `RandomBaseline`, in mazes/sec
+
+    every result has latency percentiles and the peak memory: allocated by torch on CUDA,
+    otherwise the peak RSS of the process, which never goes down. Models are freshly
+    initialized from `seed`, and runs on the CPU are more comparable with a fixed
+    `n_threads`. Results are saved as json to `output`, and compared against an earlier
+    `output` passed as `baseline` (see `report`)
+    """
+    model_cfgs = as_tuple(model_cfgs, str)
+    seq_lens = as_tuple(seq_lens, int)
+    params: dict = dict(
+        model_cfgs=list(model_cfgs),
+        seq_lens=list(seq_lens),
+        grid_n=grid_n,
+        batch_size=batch_size,
+        n_mazes=n_mazes,
+        max_new_tokens=max_new_tokens,
+        n_repeats=n_repeats,
+        n_warmup=n_warmup,
+        n_threads=n_threads,
+        seed=seed,
+        device=device,
+    )
+    device_: torch.device = torch.device(device)
+    if n_threads is not None:
+        torch.set_num_threads(n_threads)
+    dataset_cfg: MazeDatasetConfig = MazeDatasetConfig(
+        name="benchmark",
+        grid_n=grid_n,
+        n_mazes=max(n_mazes, batch_size * (n_warmup + 1 + n_repeats)),
+    )
+    dataset: MazeDataset = MazeDataset.generate(dataset_cfg)
+    results: dict[str, dict[str, float]] = dict()
+
+    # `RandomBaseline` doesn't use its weights, so the smallest model will do
+    baseline_cfg: ConfigHolder = ConfigHolder(
+        train_cfg=TRAINING_CONFIGS["test-v1"],
+        model_cfg=GPT_CONFIGS["nano-v1"],
+        dataset_cfg=dataset_cfg,
+    )
+    dataset_tokens: list[list[str]] = dataset.as_tokens(
+        baseline_cfg.maze_tokenizer, join_tokens_individual_maze=False
+    )[:n_mazes]
+    baseline_model: RandomBaseline = RandomBaseline(baseline_cfg)
+    torch.manual_seed(seed)
+    results["RandomBaseline.generate"] = time_fn(
+        lambda: predict_maze_paths(
+            tokens_batch=dataset_tokens,
+            data_cfg=dataset_cfg,
+            model=baseline_model,
+            max_new_tokens=max_new_tokens,
+        ),
+        n_items=n_mazes,
+        n_repeats=n_repeats,
+        n_warmup=n_warmup,
+        device=torch.device("cpu"),
+    )
+
+    for model_cfg_name in model_cfgs:
+        cfg: ConfigHolder = ConfigHolder(
+            train_cfg=deepcopy(TRAINING_CONFIGS["test-v1"]),
+            model_cfg=GPT_CONFIGS[model_cfg_name],
+            dataset_cfg=dataset_cfg,
+        )
+        cfg.train_cfg.batch_size = batch_size
+        cfg.train_cfg.dataloader_cfg = dict(shuffle=True, num_workers=0, drop_last=True)
+        torch.manual_seed(seed)
+        model: ZanjHookedTransformer = cfg.create_model_zanj()
+        model.to(device_)
+
+        for seq_len in seq_lens:
+            tokens: torch.Tensor = torch.randint(
+                0,
+                model.cfg.d_vocab,
+                (batch_size, seq_len),
+                generator=torch.Generator().manual_seed(seed),
+            ).to(device_)
+
+            def _forward() -> None:
+                with torch.no_grad():
+                    model(tokens)
+
+            def _forward_backward() -> None:
+                model(tokens, return_type="loss").backward()
+                model.zero_grad(set_to_none=True)
+
+            for name, fn in (
+                ("forward", _forward),
+                ("forward_backward", _forward_backward),
+            ):
+                results[f"{name}/{model_cfg_name}/seq_{seq_len}"] = time_fn(
+                    fn,
+                    n_items=batch_size * seq_len,
+                    n_repeats=n_repeats,
+                    n_warmup=n_warmup,
+                    device=device_,
+                )
+
+        results[f"train_step/{model_cfg_name}"] = _benchmark_train_step(
+            cfg, dataset, device_, n_repeats=n_repeats, n_warmup=n_warmup
+        )
+
+        model.eval()
+        for mode, predict_batch_size in (
+            ("per_sample", None),
+            ("batched", batch_size),
+        ):
+            results[f"predict_maze_paths/{mode}/{model_cfg_name}"] = time_fn(
+                lambda: predict_maze_paths(
+                    tokens_batch=dataset_tokens,
+                    data_cfg=dataset_cfg,
+                    model=model,
+                    max_new_tokens=max_new_tokens,
+                    batch_size=predict_batch_size,
+                ),
+                n_items=n_mazes,
+                n_repeats=n_repeats,
+                n_warmup=n_warmup,
+                device=device_,
+            )
+
+    return report(results, params, output, baseline, tolerance)
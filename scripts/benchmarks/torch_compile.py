@@ -0,0 +1,160 @@
+import itertools
+import time
+import typing
+
+import torch
+from maze_dataset import MazeDataset, MazeDatasetConfig
+
+from maze_transformer.evaluation.eval_model import predict_maze_paths
+from maze_transformer.training.config import (
+    GPT_CONFIGS,
+    TRAINING_CONFIGS,
+    ConfigHolder,
+    ZanjHookedTransformer,
+)
+from maze_transformer.utils.compile import LeftPaddedForward
+from maze_transformer.utils.padding import PADDING_BUCKET_SIZE, pad_to_bucket
+from scripts.benchmarks.common import (
+    DEFAULT_TOLERANCE,
+    report,
+    summarize_times,
+    time_fn,
+)
+
+
+def _time_first_call(fn: typing.Callable[[], typing.Any], n_items: int) -> dict:
+    """the first call of `fn` on its own, which includes compiling, see `summarize_times`"""
+    start: float = time.perf_counter()
+    fn()
+    return summarize_times([time.perf_counter() - start], n_items)
+
+
+def benchmark_compile(
+    model_cfg: str = "tiny-v1",
+    grid_n: int = 5,
+    n_mazes: int = 256,
+    batch_size: int = 32,
+    max_new_tokens: int = 16,
+    n_repeats: int = 20,
+    n_warmup: int = 2,
+    backend: str = "inductor",
+    n_threads: int | None = None,
+    seed: int = 0,
+    device: str = "cpu",
+    output: str | None = None,
+    baseline: str | None = None,
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> dict[str, dict[str, float]]:
+    """compare training steps and path generation with and without `torch.compile` (with `backend`)
+
+    - `train_step/eager` and `/compiled`: a forward and backward pass and an SGD step on
+      batches of `batch_size` mazes, in samples/sec. For the compiled step, batches are
+      padded to multiples of `PADDING_BUCKET_SIZE` and run through `LeftPaddedForward`, as in `train`
+    - `predict_maze_paths/eager` and `/compiled`: predicting the paths of `n_mazes` mazes in
+      batches of `batch_size`, with the decoding step compiled for the latter, in mazes/sec
+
+    the first call of each is also timed on its own as `.../first_call`, since for the
+    compiled ones it includes compiling, before the `n_warmup` untimed calls. Speedups are
+    printed. Results are saved as json to `output`, and compared against an earlier
+    `output` passed as `baseline` (see `report`)
+    """
+    params: dict = dict(
+        model_cfg=model_cfg,
+        grid_n=grid_n,
+        n_mazes=n_mazes,
+        batch_size=batch_size,
+        max_new_tokens=max_new_tokens,
+        n_repeats=n_repeats,
+        n_warmup=n_warmup,
+        backend=backend,
+        n_threads=n_threads,
+        seed=seed,
+        device=device,
+    )
+    device_: torch.device = torch.device(device)
+    if n_threads is not None:
+        torch.set_num_threads(n_threads)
+    cfg: ConfigHolder = ConfigHolder(
+        train_cfg=TRAINING_CONFIGS["test-v1"],
+        model_cfg=GPT_CONFIGS[model_cfg],
+        dataset_cfg=MazeDatasetConfig(name="benchmark", grid_n=grid_n, n_mazes=n_mazes),
+    )
+    dataset: MazeDataset = MazeDataset.generate(cfg.dataset_cfg)
+    dataset_tokens: list[list[str]] = dataset.as_tokens(
+        cfg.maze_tokenizer, join_tokens_individual_maze=False
+    )
+
+    results: dict[str, dict[str, float]] = dict()
+    for compiled in (False, True):
+        key: str = "compiled" if compiled else "eager"
+        torch.manual_seed(seed)
+        model: ZanjHookedTransformer = cfg.create_model_zanj()
+        model.to(device_)
+        optimizer: torch.optim.Optimizer = torch.optim.SGD(model.parameters(), lr=1e-4)
+
+        batches: list[torch.Tensor] = list()
+        for start in range(0, len(dataset_tokens), batch_size):
+            batch: torch.Tensor = model.to_tokens(
+                [" ".join(x) for x in dataset_tokens[start : start + batch_size]]
+            )
+            if compiled:
+                batch = pad_to_bucket(
+                    batch,
+                    padding_idx=cfg.maze_tokenizer.padding_token_index,
+                    bucket_size=PADDING_BUCKET_SIZE,
+                    max_len=model.cfg.n_ctx,
+                )
+            batches.append(batch)
+        forward: torch.nn.Module = (
+            LeftPaddedForward(model, backend=backend) if compiled else model
+        )
+        batches_cycle: typing.Iterator[torch.Tensor] = itertools.cycle(batches)
+
+        def _train_step() -> None:
+            _, loss = forward(next(batches_cycle), return_type="both")
+            loss.backward()
+            optimizer.step()
+            optimizer.zero_grad()
+
+        results[f"train_step/{key}/first_call"] = _time_first_call(
+            _train_step, n_items=batch_size
+        )
+        results[f"train_step/{key}"] = time_fn(
+            _train_step,
+            n_items=batch_size,
+            n_repeats=n_repeats,
+            n_warmup=n_warmup,
+            device=device_,
+        )
+
+        model.eval()
+
+        def _predict() -> None:
+            predict_maze_paths(
+                tokens_batch=dataset_tokens,
+                data_cfg=cfg.dataset_cfg,
+                model=model,
+                max_new_tokens=max_new_tokens,
+                batch_size=batch_size,
+                compile_backend=backend if compiled else None,
+            )
+
+        results[f"predict_maze_paths/{key}/first_call"] = _time_first_call(
+            _predict, n_items=n_mazes
+        )
+        results[f"predict_maze_paths/{key}"] = time_fn(
+            _predict,
+            n_items=n_mazes,
+            n_repeats=n_repeats,
+            n_warmup=n_warmup,
+            device=device_,
+        )
+
+    for name in ("train_step", "predict_maze_paths"):
+        speedup: float = (
+            results[f"{name}/eager"]["median_sec"]
+            / results[f"{name}/compiled"]["median_sec"]
+        )
+        print(f"{name} speedup from compiling: {speedup:.2f}x")
+
+    return report(results, params, output, baseline, tolerance)
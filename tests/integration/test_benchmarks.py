@@ -0,0 +1,104 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from scripts.benchmarks.__main__ import main
+
+
+def _check_output_and_baseline(command: list[str], output: Path) -> None:
+    """run `command` saving to `output`, then again against it as a baseline"""
+    main([*command, "--output", output.as_posix()])
+    with open(output) as f:
+        saved: dict = json.load(f)
+    assert set(saved.keys()) == {"environment", "params", "results"}
+    assert saved["results"]
+    for metrics in saved["results"].values():
+        assert metrics["median_sec"] > 0
+        assert metrics["items_per_sec"] > 0
+
+    # no regressions against itself, with a tolerance no timing noise can exceed
+    main([*command, "--baseline", output.as_posix(), "--tolerance", "1000"])
+
+    # and every benchmark regressed against a baseline which was far faster
+    for metrics in saved["results"].values():
+        metrics["median_sec"] /= 10**6
+    fast_baseline: Path = output.with_name(f"fast_{output.name}")
+    with open(fast_baseline, "w") as f:
+        json.dump(saved, f)
+    with pytest.raises(SystemExit) as exc_info:
+        main([*command, "--baseline", fast_baseline.as_posix()])
+    assert exc_info.value.code == 1
+
+
+def test_benchmark_data_pipeline(temp_dir: Path):
+    _check_output_and_baseline(
+        [
+            "data",
+            "--grid_n",
+            "3",
+            "--n_mazes",
+            "8",
+            "--batch_size",
+            "4",
+            # a single value rather than a list
+            "--num_workers",
+            "0",
+            "--n_repeats",
+            "1",
+        ],
+        temp_dir / "data.json",
+    )
+
+
+def test_benchmark_model(temp_dir: Path):
+    _check_output_and_baseline(
+        [
+            "model",
+            # unquoted, as typed in a shell
+            "--model_cfgs",
+            "[nano-v1]",
+            "--seq_lens",
+            "16",
+            "--grid_n",
+            "3",
+            "--batch_size",
+            "2",
+            "--n_mazes",
+            "2",
+            "--max_new_tokens",
+            "2",
+            "--n_repeats",
+            "1",
+            "--n_warmup",
+            "0",
+        ],
+        temp_dir / "model.json",
+    )
+
+
+def test_benchmark_compile(temp_dir: Path):
+    _check_output_and_baseline(
+        [
+            "compile",
+            "--model_cfg",
+            "nano-v1",
+            # no C++ toolchain needed, but still traced by dynamo
+            "--backend",
+            "aot_eager",
+            "--grid_n",
+            "3",
+            "--n_mazes",
+            "4",
+            "--batch_size",
+            "2",
+            "--max_new_tokens",
+            "2",
+            "--n_repeats",
+            "1",
+            # the first calls are timed on their own regardless
+            "--n_warmup",
+            "0",
+        ],
+        temp_dir / "compile.json",
+    )
@@ -11,6 +11,7 @@ from pathlib import Path
 import numpy as np
 import pytest
 from maze_dataset import CoordTup, MazeDataset
+from muutils.statcounter import StatCounter
 from zanj import ZANJ
 from zanj.torchutil import assert_model_cfg_equality
 
@@ -109,7 +110,62 @@ def test_evaluate_model(temp_dir):
 
     path_evals = PathEvals.fast
     eval_names = [name for name in path_evals.keys()]
-    scores = evaluate_model(dataset=dataset, model=model)
+    padding_stats: dict[str, int] = dict()
+    scores = evaluate_model(dataset=dataset, model=model, padding_stats=padding_stats)
 
     assert path_evals.keys() == scores.keys()
     assert scores[eval_names[0]].summary()["total_items"] == cfg.dataset_cfg.n_mazes
+    assert 0 <= padding_stats["n_padding"] < padding_stats["n_tokens"]
+
+
+def test_evaluate_model_batched_matches_per_sample():
+    model: ZanjHookedTransformer = ZanjHookedTransformer.read(
+        "examples/multsrc_demo-g6-n10K-a_dfs-h92077_tiny-v1_sweep-v1_2023-05-20-21-30-02/model.final.zanj"
+    )
+    cfg: ConfigHolder = model.zanj_model_config
+    cfg.dataset_cfg.n_mazes = 20
+
+    dataset: MazeDataset = MazeDataset.from_config(cfg=cfg.dataset_cfg)
+    dataset_tokens: list[list[str]] = dataset.as_tokens(
+        cfg.maze_tokenizer, join_tokens_individual_maze=False
+    )
+
+    # "skip" last, since those paths are used for the evals below
+    for when_noncoord in ("include", "skip"):
+        paths_per_sample = predict_maze_paths(
+            tokens_batch=dataset_tokens,
+            data_cfg=cfg.dataset_cfg,
+            model=model,
+            max_new_tokens=12,
+            when_noncoord=when_noncoord,
+        )
+        paths_batched = predict_maze_paths(
+            tokens_batch=dataset_tokens,
+            data_cfg=cfg.dataset_cfg,
+            model=model,
+            max_new_tokens=12,
+            when_noncoord=when_noncoord,
+            batch_size=6,
+            bucket_by_length=True,
+        )
+        assert paths_batched == paths_per_sample
+
+    scores = evaluate_model(
+        model=model,
+        dataset=dataset,
+        dataset_tokens=dataset_tokens,
+        eval_functions=PathEvals.fast,
+        max_new_tokens=12,
+        batch_size=6,
+    )
+    for name, func in PathEvals.fast.items():
+        expected = [
+            func(
+                maze=maze,
+                solution=np.array(maze.solution),
+                prediction=np.array(prediction),
+                model=model,
+            )
+            for maze, prediction in zip(dataset, paths_per_sample)
+        ]
+        assert scores[name].summary() == StatCounter(expected).summary()
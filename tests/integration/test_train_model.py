@@ -1,5 +1,19 @@
+import json
+import os
+import shutil
+import socket
+from copy import deepcopy
+from pathlib import Path
+
+import torch
+import torch.multiprocessing as mp
+from maze_dataset import MazeDatasetConfig
+
+from maze_transformer.test_helpers.distributed import run_without_teardown
 from maze_transformer.training.config import ConfigHolder, ZanjHookedTransformer
+from maze_transformer.training.dataset_generation import generated_dataset_fname
 from maze_transformer.training.train_model import TrainingResult, train_model
+from maze_transformer.training.train_save_files import TRAIN_SAVE_FILES
 from maze_transformer.training.wandb_logger import WandbProject
 
 
@@ -17,3 +31,180 @@ def test_train_model():
 
     assert isinstance(result.model, ZanjHookedTransformer)
     assert result.model.zanj_model_config == cfg
+
+
+def test_train_model_resume():
+    cfg: ConfigHolder = ConfigHolder.get_config_multisource(
+        cfg_names=("test-g3-n5-a_dfs-h75556", "nano-v1", "test-v1"),
+    )
+    cfg.dataset_cfg.n_mazes = 11
+    cfg.train_cfg = deepcopy(cfg.train_cfg)
+    cfg.train_cfg.batch_size = 5
+    cfg.train_cfg.dataloader_cfg["shuffle"] = True
+    # checkpoint after every batch
+    cfg.train_cfg.intervals_count = dict(
+        print_loss=2, checkpoint=2, eval_fast=2, eval_slow=2
+    )
+
+    result: TrainingResult = train_model(
+        base_path="tests/_temp/test_train_model_resume",
+        wandb_project=WandbProject.INTEGRATION_TESTS,
+        cfg=cfg,
+        do_generate_dataset=True,
+    )
+    checkpoints_path: Path = result.output_path / TRAIN_SAVE_FILES.checkpoints
+    assert (checkpoints_path / TRAIN_SAVE_FILES.train_state_checkpt(1)).exists()
+
+    # continue from the first checkpoint, the config is read from the run directory
+    result_resumed: TrainingResult = train_model(
+        base_path="tests/_temp/test_train_model_resume",
+        wandb_project=WandbProject.INTEGRATION_TESTS,
+        resume_from=checkpoints_path / TRAIN_SAVE_FILES.train_state_checkpt(0),
+    )
+
+    assert result_resumed.output_path == result.output_path
+    state_dict: dict[str, torch.Tensor] = result.model.state_dict()
+    for key, value in result_resumed.model.state_dict().items():
+        assert torch.equal(value, state_dict[key])
+
+
+def test_train_model_generates_datasets():
+    cfg: ConfigHolder = ConfigHolder.get_config_multisource(
+        cfg_names=("test-g3-n5-a_dfs-h75556", "nano-v1", "test-v1"),
+    )
+    cfg.dataset_cfg.n_mazes = 12
+    cfg.train_cfg = deepcopy(cfg.train_cfg)
+    cfg.train_cfg.batch_size = 5
+    val_cfg: MazeDatasetConfig = MazeDatasetConfig(name="val", grid_n=3, n_mazes=4)
+    base_path: Path = Path("tests/_temp/test_train_model_generates_datasets")
+    shutil.rmtree(base_path, ignore_errors=True)
+
+    for i, validation_dataset_cfg in enumerate((4, val_cfg)):
+        cfg.train_cfg.validation_dataset_cfg = validation_dataset_cfg
+        # run directories are only timestamped to the second
+        cfg.name = f"test_train_model_generates_datasets_{i}"
+        train_model(
+            base_path=base_path,
+            wandb_project=WandbProject.INTEGRATION_TESTS,
+            cfg=cfg,
+            do_generate_dataset=True,
+            dataset_n_workers=2,
+        )
+        # splitting off the validation dataset leaves the config alone
+        assert cfg.dataset_cfg.n_mazes == 12
+
+    assert (base_path / f"{generated_dataset_fname(cfg.dataset_cfg)}.zanj").exists()
+    assert (base_path / f"{generated_dataset_fname(val_cfg)}.zanj").exists()
+
+
+def test_train_model_streaming():
+    cfg: ConfigHolder = ConfigHolder.get_config_multisource(
+        cfg_names=("test-g3-n5-a_dfs-h75556", "nano-v1", "test-v1"),
+    )
+    cfg.dataset_cfg.n_mazes = 10
+    cfg.train_cfg = deepcopy(cfg.train_cfg)
+    cfg.train_cfg.batch_size = 5
+    cfg.train_cfg.validation_dataset_cfg = 4
+    result: TrainingResult = train_model(
+        base_path="tests/_temp/test_train_model_streaming",
+        wandb_project=WandbProject.INTEGRATION_TESTS,
+        cfg=cfg,
+        streaming=True,
+        streaming_false_positive_rate=1e-2,
+        pretokenize=True,
+    )
+
+    assert isinstance(result.model, ZanjHookedTransformer)
+    # nothing is generated up front
+    assert not list(Path("tests/_temp/test_train_model_streaming").glob("*.zanj"))
+
+
+def _train_model_process(rank: int, port: int, cfg: ConfigHolder, base_path: str):
+    # the environment `torchrun` sets up for each process
+    os.environ.update(
+        RANK=str(rank),
+        LOCAL_RANK=str(rank),
+        WORLD_SIZE="2",
+        MASTER_ADDR="127.0.0.1",
+        MASTER_PORT=str(port),
+    )
+    result: TrainingResult = train_model(
+        base_path=base_path,
+        wandb_project=WandbProject.INTEGRATION_TESTS,
+        cfg=cfg,
+        do_generate_dataset=True,
+        distributed_backend="gloo",
+    )
+    torch.save(
+        result.model.state_dict(), Path(base_path) / f"state_dict_rank_{rank}.pt"
+    )
+
+
+def test_train_model_distributed():
+    cfg: ConfigHolder = ConfigHolder.get_config_multisource(
+        cfg_names=("test-g3-n5-a_dfs-h75556", "nano-v1", "test-v1"),
+    )
+    cfg.dataset_cfg.n_mazes = 20
+    cfg.train_cfg = deepcopy(cfg.train_cfg)
+    cfg.train_cfg.batch_size = 5
+    cfg.train_cfg.validation_dataset_cfg = 4
+    cfg.train_cfg.intervals_count = dict(
+        print_loss=2, checkpoint=2, eval_fast=2, eval_slow=2
+    )
+    base_path: Path = Path("tests/_temp/test_train_model_distributed")
+    shutil.rmtree(base_path, ignore_errors=True)
+    base_path.mkdir(parents=True)
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port: int = s.getsockname()[1]
+    mp.spawn(
+        run_without_teardown,
+        args=(_train_model_process, port, cfg, base_path.as_posix()),
+        nprocs=2,
+    )
+
+    # DDP keeps the weights in sync across processes
+    state_dicts: list[dict[str, torch.Tensor]] = [
+        torch.load(base_path / f"state_dict_rank_{rank}.pt") for rank in range(2)
+    ]
+    for key, value in state_dicts[0].items():
+        assert torch.equal(value, state_dicts[1][key])
+
+    # only the main process writes the run directory and checkpoints
+    run_paths: list[Path] = [path for path in base_path.iterdir() if path.is_dir()]
+    assert len(run_paths) == 1
+    assert (run_paths[0] / TRAIN_SAVE_FILES.config_holder).exists()
+    assert (run_paths[0] / TRAIN_SAVE_FILES.model_final_zanj).exists()
+    assert (
+        run_paths[0]
+        / TRAIN_SAVE_FILES.checkpoints
+        / TRAIN_SAVE_FILES.train_state_checkpt(0)
+    ).exists()
+
+
+def test_train_model_jsonl_logger():
+    cfg: ConfigHolder = ConfigHolder.get_config_multisource(
+        cfg_names=("test-g3-n5-a_dfs-h75556", "nano-v1", "test-v1"),
+    )
+    cfg.dataset_cfg.n_mazes = 10
+    result: TrainingResult = train_model(
+        base_path="tests/_temp/test_train_model_jsonl_logger",
+        wandb_project=WandbProject.INTEGRATION_TESTS,
+        cfg=cfg,
+        do_generate_dataset=True,
+        logger_backend="jsonl",
+    )
+
+    with open(result.output_path / TRAIN_SAVE_FILES.log) as f:
+        records: list[dict] = [json.loads(line) for line in f]
+    assert records[0]["type"] == "config"
+    assert ConfigHolder.load(records[0]["config"]) == cfg
+    metrics: list[dict] = [r["data"] for r in records if r["type"] == "metric"]
+    assert metrics and all("loss" in m for m in metrics)
+    # eval scores are kept whole
+    assert "StatCounter" in metrics[0]["node_overlap"]
+    assert any(r["type"] == "model" for r in records)
+    assert result.model.training_records["wandb_url"] == (
+        (result.output_path / TRAIN_SAVE_FILES.log).absolute().as_posix()
+    )
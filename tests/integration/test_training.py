@@ -1,17 +1,39 @@
+import math
 import re
 from copy import deepcopy
 from pathlib import Path
 
+import numpy as np
 import pytest
+import torch
 from maze_dataset import MazeDataset, MazeDatasetConfig
 from muutils.mlutils import get_device
 
 from maze_transformer.evaluation.path_evals import PathEvals
 from maze_transformer.test_helpers.stub_logger import StubLogger
-from maze_transformer.training.config import GPT_CONFIGS, TRAINING_CONFIGS, ConfigHolder
+from maze_transformer.training import training
+from maze_transformer.training.config import (
+    GPT_CONFIGS,
+    TRAINING_CONFIGS,
+    ConfigHolder,
+    ZanjHookedTransformer,
+)
+from maze_transformer.training.step_timer import STEP_SECTIONS
 from maze_transformer.training.train_save_files import TRAIN_SAVE_FILES
 from maze_transformer.training.training import get_dataloader, train
 from maze_transformer.training.wandb_logger import WandbJobType, WandbProject
+from maze_transformer.utils.padding import PADDING_BUCKET_SIZE
+
+# logged at every optimizer step, the timings every `print_loss` steps (which is every step here)
+TRAIN_STEP_METRICS: list[str] = [
+    "loss",
+    "tokens_per_batch",
+    "pad_fraction",
+    *(f"timing/{name}" for name in (*STEP_SECTIONS, "step")),
+    "throughput/samples_per_sec",
+    "throughput/tokens_per_sec",
+    "memory/peak_mb",
+]
 
 
 @pytest.mark.usefixtures("temp_dir")
@@ -35,7 +57,31 @@ def test_train_model_without_evals(temp_dir: Path):
 
     metrics = _get_metrics(logger.logs)
     assert len(metrics) == 2
-    assert list(metrics[0].keys()) == ["loss"]
+    assert list(metrics[0].keys()) == TRAIN_STEP_METRICS
+
+
+@pytest.mark.usefixtures("temp_dir")
+def test_train_model_pretokenized(temp_dir: Path):
+    dataset = _create_dataset()
+    cfg = _create_tokenizer_config(dataset.cfg, batch_size=5)
+
+    output_path = _create_output_path(cfg, temp_dir)
+    logger = _create_logger(cfg)
+    dataloader = get_dataloader(dataset, cfg, logger, pretokenize=True)
+    device = get_device()
+    cfg.train_cfg.validation_dataset_cfg = None
+
+    train(
+        dataloader=dataloader,
+        cfg=cfg,
+        logger=logger,
+        output_dir=output_path,
+        device=device,
+    )
+
+    metrics = _get_metrics(logger.logs)
+    assert len(metrics) == 2
+    assert list(metrics[0].keys()) == TRAIN_STEP_METRICS
 
 
 @pytest.mark.usefixtures("temp_dir")
@@ -74,14 +120,381 @@ def test_train_model_with_evals(temp_dir: Path):
 
     # we should have 1 loop with fast evals and 1 loop with fast and slow
     assert len(metrics) == 2
-    assert set(metrics[0].keys()) == {"loss", *PathEvals.fast.keys()}
     assert set(metrics[0].keys()) == {
-        "loss",
+        *TRAIN_STEP_METRICS,
+        *PathEvals.fast.keys(),
+        *PathEvals.slow.keys(),
+        "eval_pad_fraction",
+    }
+    assert set(metrics[1].keys()) == {
+        *TRAIN_STEP_METRICS,
+        *PathEvals.fast.keys(),
+        "eval_pad_fraction",
+    }
+    assert all(0 <= m["eval_pad_fraction"] < 1 for m in metrics)
+
+
+@pytest.mark.usefixtures("temp_dir")
+def test_train_model_with_async_evals(temp_dir: Path):
+    dataset = _create_dataset()
+    cfg = _create_tokenizer_config(dataset.cfg, batch_size=5)
+    cfg.train_cfg = deepcopy(cfg.train_cfg)
+
+    output_path = _create_output_path(cfg, temp_dir)
+    logger = _create_logger(cfg)
+    dataloader = get_dataloader(dataset, cfg, logger)
+    device = get_device()
+
+    cfg.train_cfg.intervals = dict(
+        print_loss=1,
+        checkpoint=10,
+        eval_fast=5,
+        eval_slow=10,
+    )
+    cfg.train_cfg.intervals_count = None
+    cfg.train_cfg.async_evals = True
+    cfg.train_cfg.validation_dataset_cfg = deepcopy(cfg.dataset_cfg)
+    val_dataset: MazeDataset = MazeDataset.from_config(
+        cfg.train_cfg.validation_dataset_cfg,
+    )
+
+    train(
+        dataloader=dataloader,
+        cfg=cfg,
+        logger=logger,
+        output_dir=output_path,
+        device=device,
+        val_dataset=val_dataset,
+    )
+
+    metrics = _get_metrics(logger.logs)
+
+    # the training loop only logs the loss, evals are logged separately, tagged with the iteration
+    train_metrics = [m for m in metrics if "iteration" not in m]
+    eval_metrics = sorted(
+        (m for m in metrics if "iteration" in m), key=lambda m: m["iteration"]
+    )
+    assert len(train_metrics) == 2
+    assert all(list(m.keys()) == TRAIN_STEP_METRICS for m in train_metrics)
+    assert [m["iteration"] for m in eval_metrics] == [0, 1]
+    assert set(eval_metrics[0].keys()) == {
+        "iteration",
         *PathEvals.fast.keys(),
         *PathEvals.slow.keys(),
+        "eval_pad_fraction",
+    }
+    assert set(eval_metrics[1].keys()) == {
+        "iteration",
+        *PathEvals.fast.keys(),
+        "eval_pad_fraction",
     }
 
 
+@pytest.mark.usefixtures("temp_dir")
+def test_train_model_async_checkpoints(temp_dir: Path):
+    dataset = _create_dataset()
+    cfg = _create_tokenizer_config(dataset.cfg, batch_size=5)
+    cfg.train_cfg = deepcopy(cfg.train_cfg)
+    cfg.train_cfg.validation_dataset_cfg = None
+    cfg.train_cfg.async_checkpoints = True
+    cfg.train_cfg.intervals = dict(
+        print_loss=1,
+        checkpoint=5,
+        eval_fast=5,
+        eval_slow=5,
+    )
+    cfg.train_cfg.intervals_count = None
+
+    output_path = _create_output_path(cfg, temp_dir)
+    logger = _create_logger(cfg)
+    dataloader = get_dataloader(dataset, cfg, logger)
+    device = get_device()
+
+    train(
+        dataloader=dataloader,
+        cfg=cfg,
+        logger=logger,
+        output_dir=output_path,
+        device=device,
+    )
+
+    # every checkpoint and the final model are written by the time `train` returns
+    assert sorted(
+        p.name for p in (output_path / TRAIN_SAVE_FILES.checkpoints).iterdir()
+    ) == [
+        TRAIN_SAVE_FILES.model_checkpt_zanj(0),
+        TRAIN_SAVE_FILES.model_checkpt_zanj(1),
+        TRAIN_SAVE_FILES.train_state_checkpt(0),
+        TRAIN_SAVE_FILES.train_state_checkpt(1),
+    ]
+    assert (output_path / TRAIN_SAVE_FILES.model_final_zanj).exists()
+
+
+@pytest.mark.usefixtures("temp_dir")
+def test_train_model_bf16(temp_dir: Path):
+    dataset = _create_dataset()
+    cfg = _create_tokenizer_config(dataset.cfg, batch_size=5)
+    cfg.train_cfg = deepcopy(cfg.train_cfg)
+    cfg.train_cfg.precision = "bf16"
+    cfg.train_cfg.intervals = dict(
+        print_loss=1,
+        checkpoint=10,
+        eval_fast=5,
+        eval_slow=10,
+    )
+    cfg.train_cfg.intervals_count = None
+    cfg.train_cfg.validation_dataset_cfg = deepcopy(cfg.dataset_cfg)
+    val_dataset: MazeDataset = MazeDataset.from_config(
+        cfg.train_cfg.validation_dataset_cfg,
+    )
+
+    output_path = _create_output_path(cfg, temp_dir)
+    logger = _create_logger(cfg)
+    dataloader = get_dataloader(dataset, cfg, logger)
+    device = torch.device("cpu")
+
+    model = train(
+        dataloader=dataloader,
+        cfg=cfg,
+        logger=logger,
+        output_dir=output_path,
+        device=device,
+        val_dataset=val_dataset,
+    )
+
+    # autocast leaves the weights in fp32
+    assert all(p.dtype == torch.float32 for p in model.parameters())
+    metrics = _get_metrics(logger.logs)
+    assert len(metrics) == 2
+    assert all(math.isfinite(m["loss"]) for m in metrics)
+    assert set(PathEvals.fast.keys()) <= set(metrics[0].keys())
+
+
+@pytest.mark.usefixtures("temp_dir")
+def test_train_model_resume_grad_scaler(temp_dir: Path, monkeypatch):
+    dataset = _create_dataset()
+    cfg = _create_tokenizer_config(dataset.cfg, batch_size=5)
+    cfg.train_cfg.validation_dataset_cfg = None
+    device = torch.device("cpu")
+
+    output_path = _create_output_path(cfg, temp_dir)
+    logger = _create_logger(cfg)
+    train(
+        dataloader=get_dataloader(dataset, cfg, logger),
+        cfg=cfg,
+        logger=logger,
+        output_dir=output_path,
+        device=device,
+    )
+
+    # fp16 needs CUDA, so record what the (disabled) scaler is given instead
+    loaded_states: list[dict] = list()
+
+    class _RecordingGradScaler(torch.cuda.amp.GradScaler):
+        def load_state_dict(self, state_dict: dict) -> None:
+            loaded_states.append(state_dict)
+            super().load_state_dict(state_dict)
+
+    monkeypatch.setattr(
+        training,
+        "get_grad_scaler",
+        lambda precision, device: _RecordingGradScaler(enabled=False),
+    )
+    resume_state = torch.load(
+        output_path
+        / TRAIN_SAVE_FILES.checkpoints
+        / TRAIN_SAVE_FILES.train_state_checkpt(0)
+    )
+    scaler_state = dict(
+        scale=1024.0,
+        growth_factor=2.0,
+        backoff_factor=0.5,
+        growth_interval=2000,
+        _growth_tracker=3,
+    )
+    resume_state["scaler"] = scaler_state
+    train(
+        dataloader=get_dataloader(dataset, cfg, logger),
+        cfg=cfg,
+        logger=logger,
+        output_dir=output_path,
+        device=device,
+        resume_state=resume_state,
+    )
+
+    assert loaded_states == [scaler_state]
+
+
+@pytest.mark.usefixtures("temp_dir")
+def test_train_grad_accumulation(temp_dir: Path):
+    """one step over 2 micro-batches of 5 gives the same result as one step over a batch of 10"""
+    # mazes with the same number of tokens, so no micro-batch is padded differently
+    dataset = _create_dataset(n_mazes=100)
+    maze_tokenizer = _create_tokenizer_config(dataset.cfg).maze_tokenizer
+    lengths: list[int] = [len(maze.as_tokens(maze_tokenizer)) for maze in dataset]
+    most_common_length: int = max(set(lengths), key=lengths.count)
+    dataset = MazeDataset(
+        dataset.cfg,
+        mazes=[maze for maze, n in zip(dataset, lengths) if n == most_common_length][
+            :10
+        ],
+    )
+    assert len(dataset) == 10
+    trained: list[dict[str, torch.Tensor]] = []
+    for batch_size, grad_accumulation_steps in [(10, 1), (5, 2)]:
+        cfg = _create_tokenizer_config(dataset.cfg, batch_size=batch_size)
+        cfg.train_cfg = deepcopy(cfg.train_cfg)
+        cfg.train_cfg.grad_accumulation_steps = grad_accumulation_steps
+        cfg.train_cfg.validation_dataset_cfg = None
+        cfg.train_cfg.optimizer = torch.optim.SGD
+        cfg.train_cfg.optimizer_kwargs = dict(lr=0.1)
+
+        output_path = _create_output_path(cfg, temp_dir / str(batch_size))
+        logger = _create_logger(cfg)
+        # same adjacency list shuffles and initial weights for both runs
+        np.random.seed(0)
+        torch.manual_seed(0)
+        dataloader = get_dataloader(dataset, cfg, logger, pretokenize=True)
+        model = train(
+            dataloader=dataloader,
+            cfg=cfg,
+            logger=logger,
+            output_dir=output_path,
+            device=torch.device("cpu"),
+        )
+        assert len(_get_metrics(logger.logs)) == 1
+        trained.append(model.state_dict())
+
+    for key, value in trained[0].items():
+        assert torch.allclose(value, trained[1][key], atol=1e-5), key
+
+
+@pytest.mark.usefixtures("temp_dir")
+def test_train_model_teacher_forced_evals(temp_dir: Path):
+    dataset = _create_dataset()
+    cfg = _create_tokenizer_config(dataset.cfg, batch_size=5)
+    cfg.train_cfg = deepcopy(cfg.train_cfg)
+    cfg.train_cfg.validation_dataset_cfg = None
+    cfg.train_cfg.teacher_forced_evals = True
+
+    output_path = _create_output_path(cfg, temp_dir)
+    logger = _create_logger(cfg)
+    dataloader = get_dataloader(dataset, cfg, logger)
+    device = get_device()
+
+    train(
+        dataloader=dataloader,
+        cfg=cfg,
+        logger=logger,
+        output_dir=output_path,
+        device=device,
+    )
+
+    metrics = _get_metrics(logger.logs)
+    # teacher-forced metrics are computed at every step, without a validation dataset
+    assert len(metrics) == 2
+    for step_metrics in metrics:
+        assert set(step_metrics.keys()) == {
+            *TRAIN_STEP_METRICS,
+            "teacher_forced/token_accuracy",
+            "teacher_forced/token_loss",
+            "teacher_forced/first_choice_accuracy",
+            "teacher_forced/exact_path",
+        }
+        assert step_metrics["teacher_forced/exact_path"].total() > 0
+
+
+@pytest.mark.usefixtures("temp_dir")
+def test_train_model_compiled(temp_dir: Path):
+    dataset = _create_dataset()
+    cfg = _create_tokenizer_config(dataset.cfg, batch_size=5)
+    cfg.train_cfg = deepcopy(cfg.train_cfg)
+    cfg.train_cfg.validation_dataset_cfg = None
+    cfg.train_cfg.teacher_forced_evals = True
+    # "aot_eager" traces and compiles the graph like "inductor" does, without generating code
+    cfg.train_cfg.compile_backend = "aot_eager"
+    # fewer layers to trace
+    cfg.model_cfg = GPT_CONFIGS["nano-v1"]
+
+    output_path = _create_output_path(cfg, temp_dir)
+    logger = _create_logger(cfg)
+    dataloader = get_dataloader(dataset, cfg, logger)
+
+    model = train(
+        dataloader=dataloader,
+        cfg=cfg,
+        logger=logger,
+        output_dir=output_path,
+        device=torch.device("cpu"),
+    )
+
+    # the trained model itself is not compiled, and can be saved and used as usual
+    assert isinstance(model, ZanjHookedTransformer)
+    metrics = _get_metrics(logger.logs)
+    assert len(metrics) == 2
+    assert all(math.isfinite(m["loss"]) for m in metrics)
+    assert all(m["teacher_forced/exact_path"].total() == 5 for m in metrics)
+
+
+@pytest.mark.usefixtures("temp_dir")
+@pytest.mark.parametrize("padding_mode", ["bucket", "length_class"])
+def test_train_model_padding_mode(temp_dir: Path, padding_mode: str):
+    dataset = _create_dataset()
+    cfg = _create_tokenizer_config(dataset.cfg, batch_size=5)
+    cfg.train_cfg = deepcopy(cfg.train_cfg)
+    cfg.train_cfg.validation_dataset_cfg = None
+    cfg.train_cfg.padding_mode = padding_mode
+
+    output_path = _create_output_path(cfg, temp_dir)
+    logger = _create_logger(cfg)
+    dataloader = get_dataloader(dataset, cfg, logger)
+
+    train(
+        dataloader=dataloader,
+        cfg=cfg,
+        logger=logger,
+        output_dir=output_path,
+        device=torch.device("cpu"),
+    )
+
+    metrics = _get_metrics(logger.logs)
+    assert len(metrics) == 2
+    assert all(math.isfinite(m["loss"]) for m in metrics)
+    # batches are padded to a multiple of `PADDING_BUCKET_SIZE` tokens
+    assert all(m["tokens_per_batch"] % (5 * PADDING_BUCKET_SIZE) == 0 for m in metrics)
+    assert all(0 < m["pad_fraction"] < 1 for m in metrics)
+
+
+@pytest.mark.usefixtures("temp_dir")
+def test_train_model_path_only_loss(temp_dir: Path):
+    dataset = _create_dataset()
+    cfg = _create_tokenizer_config(dataset.cfg, batch_size=5)
+    cfg.train_cfg = deepcopy(cfg.train_cfg)
+    cfg.train_cfg.validation_dataset_cfg = None
+    cfg.train_cfg.teacher_forced_evals = True
+    cfg.train_cfg.path_only_loss = True
+
+    output_path = _create_output_path(cfg, temp_dir)
+    logger = _create_logger(cfg)
+    dataloader = get_dataloader(dataset, cfg, logger)
+
+    train(
+        dataloader=dataloader,
+        cfg=cfg,
+        logger=logger,
+        output_dir=output_path,
+        device=torch.device("cpu"),
+    )
+
+    metrics = _get_metrics(logger.logs)
+    assert len(metrics) == 2
+    # the loss is over the same tokens as the teacher-forced token losses
+    for step_metrics in metrics:
+        assert step_metrics["loss"] == pytest.approx(
+            step_metrics["teacher_forced/token_loss"].mean(), rel=1e-4
+        )
+
+
 def _create_dataset(n_mazes: int = 10, grid_n: int = 3) -> MazeDataset:
     dataset_cfg: MazeDatasetConfig = MazeDatasetConfig(
         name="test", n_mazes=n_mazes, grid_n=grid_n
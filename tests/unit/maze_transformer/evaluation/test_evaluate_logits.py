@@ -0,0 +1,84 @@
+import torch
+import torch.nn.functional as F
+from maze_dataset import SPECIAL_TOKENS, MazeDataset, MazeDatasetConfig
+
+from maze_transformer.evaluation.eval_model import evaluate_logits
+from maze_transformer.training.config import GPT_CONFIGS, TRAINING_CONFIGS, ConfigHolder
+from maze_transformer.utils.padding import pad_and_batch_tensors
+
+
+def _get_cfg_and_batch() -> tuple[ConfigHolder, torch.Tensor]:
+    cfg: ConfigHolder = ConfigHolder(
+        train_cfg=TRAINING_CONFIGS["test-v1"],
+        model_cfg=GPT_CONFIGS["tiny-v1"],
+        dataset_cfg=MazeDatasetConfig(name="test", grid_n=3, n_mazes=5),
+    )
+    dataset: MazeDataset = MazeDataset.generate(cfg.dataset_cfg)
+    batch: torch.Tensor = pad_and_batch_tensors(
+        [
+            cfg.maze_tokenizer.encode(tokens)
+            for tokens in dataset.as_tokens(
+                cfg.maze_tokenizer, join_tokens_individual_maze=False
+            )
+        ],
+        batch_size=len(dataset),
+        padding_idx=cfg.maze_tokenizer.padding_token_index,
+        padding_dir="left",
+    )[0]
+    return cfg, batch
+
+
+def _perfect_logits(cfg: ConfigHolder, batch: torch.Tensor) -> torch.Tensor:
+    """logits which predict every next token of `batch` correctly"""
+    return F.one_hot(batch[:, 1:], cfg.maze_tokenizer.vocab_size).float() * 10
+
+
+def test_evaluate_logits_perfect():
+    cfg, batch = _get_cfg_and_batch()
+    scores = evaluate_logits(_perfect_logits(cfg, batch), batch, cfg)
+
+    assert scores["teacher_forced/token_accuracy"].mean() == 1
+    assert scores["teacher_forced/first_choice_accuracy"].mean() == 1
+    assert scores["teacher_forced/exact_path"].mean() == 1
+    assert scores["teacher_forced/exact_path"].total() == len(batch)
+    assert scores["teacher_forced/token_loss"].mean() < 1e-3
+
+
+def test_evaluate_logits_masks_path():
+    cfg, batch = _get_cfg_and_batch()
+    path_start: int = cfg.maze_tokenizer.tokenizer_map[SPECIAL_TOKENS.PATH_START]
+    logits: torch.Tensor = _perfect_logits(cfg, batch)
+
+    # mistakes before the path are not counted
+    starts: list[int] = [row.tolist().index(path_start) for row in batch]
+    for i, start in enumerate(starts):
+        logits[i, : start - 1] = logits[i, : start - 1].roll(1, dims=-1)
+    scores = evaluate_logits(logits, batch, cfg)
+    assert scores["teacher_forced/token_accuracy"].mean() == 1
+    assert scores["teacher_forced/exact_path"].mean() == 1
+
+    # a wrong first step after the origin only fails that token
+    logits = _perfect_logits(cfg, batch)
+    logits[0, starts[0] + 1] = logits[0, starts[0] + 1].roll(1, dims=-1)
+    scores = evaluate_logits(logits, batch, cfg)
+    n_path_tokens: int = scores["teacher_forced/token_accuracy"].total()
+    assert scores["teacher_forced/token_accuracy"].mean() == (n_path_tokens - 1) / (
+        n_path_tokens
+    )
+    assert scores["teacher_forced/first_choice_accuracy"].mean() == 4 / 5
+    assert scores["teacher_forced/exact_path"].mean() == 4 / 5
+
+
+def test_evaluate_logits_model_output():
+    cfg, batch = _get_cfg_and_batch()
+    model = cfg.create_model_zanj()
+    with torch.no_grad():
+        logits: torch.Tensor = model(batch)
+
+    # both full logits and logits with the last position removed are accepted
+    scores_full = evaluate_logits(logits, batch, cfg)
+    scores_trimmed = evaluate_logits(logits[:, :-1, :], batch, cfg)
+    assert scores_full.keys() == scores_trimmed.keys()
+    for key in scores_full:
+        assert scores_full[key] == scores_trimmed[key]
+        assert scores_full[key].total() > 0
@@ -0,0 +1,157 @@
+import pytest
+import torch
+from maze_dataset import SPECIAL_TOKENS, MazeDataset, MazeDatasetConfig
+from maze_dataset.tokenization.token_utils import get_context_tokens
+
+from maze_transformer.evaluation.incremental_decoding import (
+    KVCacheDecoder,
+    generate_continuous_batching,
+    generate_with_kv_cache,
+)
+from maze_transformer.training.config import (
+    GPT_CONFIGS,
+    TRAINING_CONFIGS,
+    ConfigHolder,
+    ZanjHookedTransformer,
+)
+from maze_transformer.utils.padding import pad_and_batch_tensors
+
+
+def _get_model_and_contexts(
+    model_cfg_name: str = "tiny-v1",
+) -> tuple[ZanjHookedTransformer, list[list[int]]]:
+    torch.manual_seed(0)
+    cfg: ConfigHolder = ConfigHolder(
+        train_cfg=TRAINING_CONFIGS["test-v1"],
+        model_cfg=GPT_CONFIGS[model_cfg_name],
+        dataset_cfg=MazeDatasetConfig(name="test", grid_n=4, n_mazes=6),
+    )
+    model: ZanjHookedTransformer = cfg.create_model_zanj()
+    dataset: MazeDataset = MazeDataset.generate(cfg.dataset_cfg)
+    contexts: list[list[int]] = [
+        cfg.maze_tokenizer.encode(get_context_tokens(tokens))
+        for tokens in dataset.as_tokens(
+            cfg.maze_tokenizer, join_tokens_individual_maze=False
+        )
+    ]
+    # vary the context lengths, so that the batch needs padding
+    return model, [x[3 * i :] for i, x in enumerate(contexts)]
+
+
+def test_generate_with_kv_cache_matches_generate():
+    model, contexts = _get_model_and_contexts()
+    eos_token_id: int = model.tokenizer._tokenizer_map[SPECIAL_TOKENS.PATH_END]
+    batch: torch.Tensor = pad_and_batch_tensors(
+        contexts,
+        batch_size=len(contexts),
+        padding_idx=model.config.maze_tokenizer.padding_token_index,
+        padding_dir="left",
+    )[0]
+
+    generated: torch.Tensor = generate_with_kv_cache(
+        model, batch, max_new_tokens=10, eos_token_id=eos_token_id
+    )
+    # no cache, attention mask recomputed from the whole sequence every step
+    expected: torch.Tensor = model.generate(
+        batch,
+        max_new_tokens=10,
+        eos_token_id=eos_token_id,
+        top_k=1,
+        use_past_kv_cache=False,
+        verbose=False,
+    )[:, batch.shape[1] :]
+    assert torch.equal(generated, expected[:, : generated.shape[1]])
+
+    # padding does not change the predictions
+    for context, row in zip(contexts, generated):
+        generated_single: torch.Tensor = generate_with_kv_cache(
+            model,
+            torch.tensor([context]),
+            max_new_tokens=10,
+            eos_token_id=eos_token_id,
+        )
+        assert torch.equal(generated_single[0], row[: generated_single.shape[1]])
+
+
+def test_kv_cache_decoder_step():
+    model, contexts = _get_model_and_contexts()
+    tokens: torch.Tensor = torch.tensor([contexts[0]])
+
+    decoder: KVCacheDecoder = KVCacheDecoder(model)
+    decoder.prefill(tokens[:, :-1])
+    assert decoder.cache_len == tokens.shape[1] - 1
+    logits_step: torch.Tensor = decoder.step(tokens[:, -1])
+    assert decoder.cache_len == tokens.shape[1]
+    assert decoder.kv_cache[0].past_keys.shape[1] == tokens.shape[1]
+
+    logits_full: torch.Tensor = model(tokens)[:, -1, :]
+    assert torch.allclose(logits_step, logits_full, atol=1e-5)
+
+
+@pytest.mark.parametrize("bucket_by_length", [False, True])
+def test_generate_continuous_batching(bucket_by_length: bool):
+    model, contexts = _get_model_and_contexts()
+    eos_token_id: int = model.tokenizer._tokenizer_map[SPECIAL_TOKENS.PATH_END]
+    # different limits per context, so rows retire at different steps and slots are refilled
+    max_new_tokens: list[int] = [2 + 3 * i for i in range(len(contexts))][::-1]
+
+    generated: list[list[int]] = generate_continuous_batching(
+        model,
+        contexts,
+        batch_size=2,
+        max_new_tokens=max_new_tokens,
+        padding_idx=model.config.maze_tokenizer.padding_token_index,
+        eos_token_id=eos_token_id,
+        bucket_by_length=bucket_by_length,
+    )
+
+    assert len(generated) == len(contexts)
+    for context, max_new, tokens in zip(contexts, max_new_tokens, generated):
+        expected: list[int] = generate_with_kv_cache(
+            model,
+            torch.tensor([context]),
+            max_new_tokens=max_new,
+            eos_token_id=eos_token_id,
+        )[0].tolist()
+        if eos_token_id in expected:
+            expected = expected[: expected.index(eos_token_id) + 1]
+        assert tokens == expected
+
+
+def test_kv_cache_decoder_select_extend():
+    model, contexts = _get_model_and_contexts()
+    tokens_a: torch.Tensor = torch.tensor([contexts[0]])
+    tokens_b: torch.Tensor = torch.tensor([contexts[-1]])
+
+    decoder: KVCacheDecoder = KVCacheDecoder(model)
+    decoder.prefill(tokens_b)
+    decoder.extend(tokens_a)
+    assert decoder.batch_size == 2
+    assert decoder.cache_len == tokens_a.shape[1]
+
+    # retiring the longer row trims the cache down to the shorter one
+    decoder.select(torch.tensor([0]))
+    assert decoder.batch_size == 1
+    assert decoder.cache_len == tokens_b.shape[1]
+    logits_step: torch.Tensor = decoder.step(torch.tensor([contexts[1][0]]))
+
+    logits_full: torch.Tensor = model(torch.tensor([contexts[-1] + contexts[1][:1]]))[
+        :, -1, :
+    ]
+    assert torch.allclose(logits_step, logits_full, atol=1e-5)
+
+
+def test_generate_continuous_batching_compiled():
+    # fewer layers to trace
+    model, contexts = _get_model_and_contexts("nano-v1")
+    eos_token_id: int = model.tokenizer._tokenizer_map[SPECIAL_TOKENS.PATH_END]
+    kwargs: dict = dict(
+        batch_size=2,
+        max_new_tokens=8,
+        padding_idx=model.config.maze_tokenizer.padding_token_index,
+        eos_token_id=eos_token_id,
+    )
+    # "aot_eager" traces and compiles the graph like "inductor" does, without generating code
+    assert generate_continuous_batching(
+        model, contexts, compile_backend="aot_eager", **kwargs
+    ) == generate_continuous_batching(model, contexts, **kwargs)
@@ -1,8 +1,10 @@
+import warnings
+
 import numpy as np
-from maze_dataset import LatticeMaze
+from maze_dataset import LatticeMaze, MazeDataset, MazeDatasetConfig
 from maze_dataset.utils import bool_array_from_string
 
-from maze_transformer.evaluation.path_evals import PathEvals
+from maze_transformer.evaluation.path_evals import BatchedPathEvals, PathEvals
 
 
 def test_node_overlap_short_match():
@@ -97,3 +99,45 @@ def test_streak_length_until_incorrect():
     assert PathEvals.streak_length_until_incorrect(solution, bad_prediction) == 2.0
     assert PathEvals.streak_length_until_incorrect(solution, solution) == 3.0
     assert PathEvals.streak_length_until_incorrect(solution, long_prediction) == 3.0
+
+
+def test_batched_path_evals_match_path_evals():
+    dataset: MazeDataset = MazeDataset.generate(
+        MazeDatasetConfig(name="test", grid_n=4, n_mazes=20)
+    )
+    rng: np.random.Generator = np.random.default_rng(0)
+    predictions: list[np.ndarray] = list()
+    for i, maze in enumerate(dataset):
+        kind: int = i % 5
+        if kind == 0:
+            prediction = maze.solution
+        elif kind == 1:
+            prediction = maze.solution[: rng.integers(0, len(maze.solution) + 1)]
+        elif kind == 2:
+            prediction = rng.integers(0, 4, size=(rng.integers(2, 8), 2))
+        elif kind == 3:
+            prediction = np.concatenate(
+                [maze.solution, rng.integers(0, 4, size=(2, 2))]
+            )
+        else:
+            prediction = maze.solution[:1]
+        predictions.append(np.array(prediction.tolist()))
+
+    batched_scores: dict[str, np.ndarray] = BatchedPathEvals.from_paths(
+        mazes=dataset.mazes,
+        solutions=[maze.solution for maze in dataset],
+        predictions=predictions,
+    ).compute()
+
+    assert batched_scores.keys() == PathEvals.fast.keys()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        for name, func in PathEvals.fast.items():
+            expected: np.ndarray = np.array(
+                [
+                    func(maze=maze, solution=maze.solution, prediction=prediction)
+                    for maze, prediction in zip(dataset, predictions)
+                ],
+                dtype=float,
+            )
+            assert np.allclose(batched_scores[name], expected, equal_nan=True), name
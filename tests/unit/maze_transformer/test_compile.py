@@ -0,0 +1,61 @@
+import pytest
+import torch
+from maze_dataset import MazeDataset, MazeDatasetConfig
+
+from maze_transformer.training.config import (
+    GPT_CONFIGS,
+    TRAINING_CONFIGS,
+    ConfigHolder,
+    ZanjHookedTransformer,
+)
+from maze_transformer.utils.compile import LeftPaddedForward
+from maze_transformer.utils.padding import pad_to_bucket
+
+
+def _get_model_and_batch() -> tuple[ZanjHookedTransformer, torch.Tensor]:
+    torch.manual_seed(0)
+    cfg: ConfigHolder = ConfigHolder(
+        train_cfg=TRAINING_CONFIGS["test-v1"],
+        model_cfg=GPT_CONFIGS["nano-v1"],
+        dataset_cfg=MazeDatasetConfig(name="test", grid_n=3, n_mazes=6),
+    )
+    model: ZanjHookedTransformer = cfg.create_model_zanj()
+    dataset: MazeDataset = MazeDataset.generate(cfg.dataset_cfg)
+    # mazes of different lengths, left-padded by the tokenizer
+    batch: torch.Tensor = model.to_tokens(
+        [" ".join(x) for x in dataset.as_tokens(cfg.maze_tokenizer)]
+    )
+    return model, batch
+
+
+# "aot_eager" traces and compiles the graph like "inductor" does, without generating code
+@pytest.mark.parametrize("backend", [None, "aot_eager"])
+def test_left_padded_forward_matches_model(backend: str | None):
+    model, batch = _get_model_and_batch()
+    forward: LeftPaddedForward = LeftPaddedForward(model, backend=backend)
+    # extra padding does not change the logits of the tokens
+    batch_padded: torch.Tensor = pad_to_bucket(
+        batch, model.tokenizer.pad_token_id, bucket_size=32
+    )
+    assert batch_padded.shape[1] > batch.shape[1]
+
+    for tokens in (batch, batch_padded):
+        logits_expected, loss_expected = model(tokens, return_type="both")
+        logits, loss = forward(tokens, return_type="both")
+        assert torch.allclose(
+            logits[:, -batch.shape[1] :],
+            logits_expected[:, -batch.shape[1] :],
+            atol=1e-5,
+        )
+        assert torch.allclose(loss, loss_expected, atol=1e-5)
+
+        # gradients reach the parameters of the model
+        loss.backward()
+        grads: dict[str, torch.Tensor] = {
+            name: param.grad.clone() for name, param in model.named_parameters()
+        }
+        model.zero_grad()
+        loss_expected.backward()
+        for name, param in model.named_parameters():
+            assert torch.allclose(grads[name], param.grad, atol=1e-5), name
+        model.zero_grad()
@@ -1,6 +1,15 @@
 import pytest
+import torch
 
-from maze_transformer.utils.padding import pad_and_batch_tensors
+from maze_transformer.utils.padding import (
+    get_length_bucket_order,
+    get_padded_fraction,
+    get_padding_stats,
+    pad_and_batch_tensors,
+    pad_to_bucket,
+    restore_order,
+    update_padding_stats,
+)
 
 
 @pytest.mark.parametrize(
@@ -35,3 +44,54 @@ def test_pad_and_batch_tensors(batch_size, padding_idx, padding_dir, expected_sh
             else:
                 assert seq[-len(context) :].tolist() == context
                 assert (seq[: -len(context)] == padding_idx).all()
+
+
+def test_pad_and_batch_tensors_bucket_by_length():
+    contexts_tokens = [[1, 2, 3, 4], [1], [1, 2, 3], [1, 2], [1, 2, 3, 4], [1]]
+    order = get_length_bucket_order(contexts_tokens)
+    assert order == [1, 5, 3, 2, 0, 4]
+
+    padding_stats: dict[str, int] = dict()
+    update_padding_stats(
+        padding_stats,
+        pad_and_batch_tensors(contexts_tokens, 2, 0, "left"),
+        contexts_tokens,
+    )
+    assert padding_stats == {"n_tokens": 22, "n_padding": 7}
+
+    padded_batches = pad_and_batch_tensors(
+        contexts_tokens, 2, 0, "left", bucket_by_length=True
+    )
+    assert [b.shape for b in padded_batches] == [(2, 1), (2, 3), (2, 4)]
+    padding_stats_bucketed: dict[str, int] = dict()
+    update_padding_stats(padding_stats_bucketed, padded_batches, contexts_tokens)
+    assert get_padded_fraction(padding_stats_bucketed) == 1 / 16
+    assert get_padded_fraction(padding_stats_bucketed) < get_padded_fraction(
+        padding_stats
+    )
+
+    # restore the original order of anything computed per context
+    unpadded = [
+        [t for t in seq.tolist() if t != 0] for b in padded_batches for seq in b
+    ]
+    assert restore_order(unpadded, order) == contexts_tokens
+
+
+def test_pad_to_bucket():
+    tokens = torch.tensor([[1, 2, 3], [0, 4, 5]])
+    assert pad_to_bucket(tokens, 0, bucket_size=4).tolist() == [
+        [0, 1, 2, 3],
+        [0, 0, 4, 5],
+    ]
+    assert pad_to_bucket(tokens, 0, bucket_size=3).shape == (2, 3)
+    assert pad_to_bucket(tokens, 0, bucket_size=8).shape == (2, 8)
+    # never padded past `max_len`, and never truncated
+    assert pad_to_bucket(tokens, 0, bucket_size=8, max_len=5).shape == (2, 5)
+    assert pad_to_bucket(tokens, 0, bucket_size=8, max_len=2).shape == (2, 3)
+
+
+def test_get_padding_stats():
+    tokens = torch.tensor([[0, 1, 2, 3], [0, 0, 4, 5]])
+    padding_stats: dict[str, int] = get_padding_stats(tokens, 0)
+    assert padding_stats == dict(n_tokens=8, n_padding=3)
+    assert get_padded_fraction(padding_stats) == 3 / 8
@@ -0,0 +1,34 @@
+import pytest
+import torch
+
+from maze_transformer.utils.precision import (
+    autocast_context,
+    check_precision,
+    get_grad_scaler,
+)
+
+
+def test_autocast_context():
+    a: torch.Tensor = torch.randn(4, 8)
+    b: torch.Tensor = torch.randn(8, 2)
+    with autocast_context("fp32", "cpu"):
+        assert (a @ b).dtype == torch.float32
+    with autocast_context("bf16", "cpu"):
+        assert (a @ b).dtype == torch.bfloat16
+
+
+def test_check_precision():
+    check_precision("bf16", "cpu")
+    check_precision("fp16")
+    with pytest.raises(ValueError):
+        check_precision("fp8")
+    with pytest.raises(ValueError):
+        check_precision("fp16", "cpu")
+
+
+@pytest.mark.parametrize("precision", ["fp32", "bf16"])
+def test_grad_scaler_disabled(precision: str):
+    scaler: torch.cuda.amp.GradScaler = get_grad_scaler(precision, "cpu")
+    assert not scaler.is_enabled()
+    loss: torch.Tensor = torch.tensor(2.0, requires_grad=True)
+    assert scaler.scale(loss) is loss
@@ -6,13 +6,16 @@ We may want a separate set of tests for different tokenization schemes
 """
 from itertools import product
 
+import numpy as np
 import torch
-from maze_dataset import MazeDatasetConfig, SolvedMaze
+from maze_dataset import MazeDataset, MazeDatasetConfig, SolvedMaze
 from maze_dataset.generation import get_maze_with_solution
 from maze_dataset.tokenization import MazeTokenizer, TokenizationMode
-from pytest import mark, param
+from pytest import mark, param, raises
 from transformer_lens import HookedTransformer
+from transformers import PreTrainedTokenizer
 
+from maze_transformer.tokenizer import HuggingMazeTokenizer
 from maze_transformer.training.config import BaseGPTConfig, ConfigHolder
 
 
@@ -294,3 +297,75 @@ def test_manual_tokenizer():
     assert tok.bos_token == "<bos>"
     assert tok.eos_token == "<eos>"
     assert tok.pad_token == "<pad>"
+
+
+@mark.parametrize(
+    "tok_mode",
+    [param(tok_mode, id=tok_mode.name) for tok_mode in TokenizationMode],
+)
+def test_fast_paths_match_slow_paths(tok_mode: TokenizationMode):
+    """the fast encode/decode paths of `HuggingMazeTokenizer` should give identical outputs to the `PreTrainedTokenizer` ones"""
+    dataset: MazeDataset = MazeDataset.generate(
+        MazeDatasetConfig(name="testing_maze", grid_n=3, n_mazes=4)
+    )
+    maze_tok: MazeTokenizer = MazeTokenizer(tokenization_mode=tok_mode)
+    cfg_holder: ConfigHolder = ConfigHolder(
+        train_cfg=None,
+        dataset_cfg=dataset.cfg,
+        model_cfg=None,
+        maze_tokenizer=maze_tok,
+    )
+    tokenizer: HuggingMazeTokenizer = cfg_holder.tokenizer
+    texts: list[str] = dataset.as_tokens(maze_tok, join_tokens_individual_maze=True)
+    # like the inputs `HookedTransformer.to_tokens` passes, with the bos token glued on
+    texts_bos: list[str] = [tokenizer.bos_token + x for x in texts]
+
+    # encoding
+    for padding_side, text, kwargs in product(
+        ["left", "right"],
+        [texts, texts_bos, texts[0], texts[0].split(), ""],
+        [
+            dict(),
+            dict(return_tensors="pt", padding=True),
+            dict(return_tensors="np", padding=True),
+            dict(return_tensors="pt", padding=True, truncation=True, max_length=20),
+            dict(padding="max_length", truncation=True, max_length=30),
+            dict(padding="max_length", max_length=150),
+        ],
+    ):
+        if text == "" and "return_tensors" in kwargs:
+            continue
+        tokenizer.padding_side = padding_side
+        fast = tokenizer(text, **kwargs)
+        slow = PreTrainedTokenizer.__call__(tokenizer, text, **kwargs)
+        assert fast.keys() == slow.keys()
+        for key in slow.keys():
+            if isinstance(slow[key], torch.Tensor):
+                assert fast[key].dtype == slow[key].dtype, key
+                assert torch.equal(fast[key], slow[key]), key
+            elif isinstance(slow[key], np.ndarray):
+                assert fast[key].dtype == slow[key].dtype, key
+                assert np.array_equal(fast[key], slow[key]), key
+            else:
+                assert fast[key] == slow[key], key
+    tokenizer.padding_side = "left"
+
+    # decoding
+    ids: torch.Tensor = tokenizer(texts_bos, return_tensors="pt", padding=True)[
+        "input_ids"
+    ]
+    for sequences in [ids, ids[0], ids.tolist(), [x for x in ids]]:
+        for skip_special_tokens in [False, True]:
+            assert tokenizer.batch_decode(
+                sequences, skip_special_tokens=skip_special_tokens
+            ) == PreTrainedTokenizer.batch_decode(
+                tokenizer,
+                sequences.unsqueeze(-1)
+                if isinstance(sequences, torch.Tensor) and sequences.ndim == 1
+                else sequences,
+                skip_special_tokens=skip_special_tokens,
+            )
+
+    # unknown tokens should still raise
+    with raises(NotImplementedError):
+        tokenizer("<ADJLIST_START> (0,0) not_a_token")
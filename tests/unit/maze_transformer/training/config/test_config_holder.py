@@ -1,6 +1,7 @@
 import pytest
 import torch
 from maze_dataset import MazeDatasetConfig
+from maze_dataset.tokenization import MazeTokenizer, TokenizationMode
 
 from maze_transformer.training.config import GPT_CONFIGS, TRAINING_CONFIGS, ConfigHolder
 
@@ -38,6 +39,30 @@ def test_serialize_and_load():
     assert loaded == cfg
 
 
+def test_tokenizer_is_cached():
+    cfg = _create_top_level_config()
+    tokenizer = cfg.tokenizer
+    assert cfg.tokenizer is tokenizer
+
+    # building models from the config does not change the shared tokenizer
+    cfg.create_model_zanj()
+    cfg.create_model()
+    assert cfg.tokenizer is tokenizer
+    assert tokenizer.padding_side == "left"
+
+    # changing what the tokenizer is built from invalidates the cache
+    cfg.update_from_nested_dict({"dataset_cfg": {"seq_len_max": 256}})
+    assert cfg.tokenizer is not tokenizer
+    assert cfg.tokenizer.model_max_length == 256
+
+    tokenizer = cfg.tokenizer
+    cfg.maze_tokenizer = MazeTokenizer(
+        tokenization_mode=TokenizationMode.AOTP_UT_rasterized, max_grid_size=4
+    )
+    assert cfg.tokenizer is not tokenizer
+    assert cfg.tokenizer._maze_tokenizer == cfg.maze_tokenizer
+
+
 @pytest.mark.skip("This is not yet supported")
 def test_serialize_and_load_missing_values():
     cfg = _create_top_level_config()
@@ -109,6 +109,34 @@ def test_get_intervals_with_custom_counts():
         assert calculated_intervals_batched == intervals_expected_batched
 
 
+def test_get_intervals_with_grad_accumulation():
+    # intervals are in optimizer steps, each covering `batch_size * grad_accumulation_steps` samples
+    intervals = {"print_loss": 5, "checkpoint": 20, "eval_fast": 10, "eval_slow": 40}
+    config = TrainConfig(
+        name="test",
+        optimizer=RMSprop,
+        optimizer_kwargs={"lr": 0.001},
+        batch_size=5,
+        grad_accumulation_steps=2,
+        intervals=intervals,
+    )
+    assert config.effective_batch_size == 10
+    assert config.get_intervals(100, mod_batch_size=False) == intervals
+    assert config.get_intervals(100, mod_batch_size=True) == {
+        "print_loss": 1,
+        "checkpoint": 2,
+        "eval_fast": 1,
+        "eval_slow": 4,
+    }
+    # with data parallelism, each step consumes the effective batch on every process
+    assert config.get_intervals(100, mod_batch_size=True, world_size=2) == {
+        "print_loss": 1,
+        "checkpoint": 1,
+        "eval_fast": 1,
+        "eval_slow": 2,
+    }
+
+
 def _plus_minus_proportion(
     value: float, proportion: float = 0.1
 ) -> tuple[float, float]:
@@ -50,6 +50,7 @@ def _custom_serialized_config() -> Dict[Any, Any]:
         "optimizer": "SGD",
         "optimizer_kwargs": {"lr": 0.01, "momentum": 0.9},
         "batch_size": 64,
+        "grad_accumulation_steps": 1,
         "dataloader_cfg": {"num_workers": 8, "drop_last": False},
         "intervals": {
             "print_loss": 100,
@@ -60,6 +61,13 @@ def _custom_serialized_config() -> Dict[Any, Any]:
         "intervals_count": None,
         "evals_max_new_tokens": 16,
         "validation_dataset_cfg": 100,
+        "teacher_forced_evals": False,
+        "precision": "fp32",
+        "async_evals": False,
+        "async_checkpoints": False,
+        "compile_backend": None,
+        "padding_mode": "longest",
+        "path_only_loss": False,
         "__format__": "TrainConfig(SerializableDataclass)",
     }
 
@@ -0,0 +1,77 @@
+import torch
+from maze_dataset import MazeDataset, MazeDatasetConfig
+
+from maze_transformer.evaluation.eval_model import evaluate_model
+from maze_transformer.evaluation.path_evals import PathEvals
+from maze_transformer.test_helpers.stub_logger import StubLogger
+from maze_transformer.training.async_evals import AsyncEvaluator
+from maze_transformer.training.config import GPT_CONFIGS, TRAINING_CONFIGS, ConfigHolder
+
+
+def test_async_evaluator_uses_snapshot():
+    cfg: ConfigHolder = ConfigHolder(
+        train_cfg=TRAINING_CONFIGS["test-v1"],
+        model_cfg=GPT_CONFIGS["tiny-v1"],
+        dataset_cfg=MazeDatasetConfig(name="test", grid_n=3, n_mazes=5),
+    )
+    dataset: MazeDataset = MazeDataset.generate(cfg.dataset_cfg)
+    # tokenize once, since the adjacency list is shuffled every time
+    dataset_tokens: list[list[str]] = dataset.as_tokens(
+        cfg.maze_tokenizer, join_tokens_individual_maze=False
+    )
+    model = cfg.create_model_zanj()
+    expected = evaluate_model(
+        model,
+        dataset,
+        dataset_tokens=dataset_tokens,
+        eval_functions=PathEvals.fast,
+        batch_size=cfg.train_cfg.batch_size,
+        max_new_tokens=cfg.train_cfg.evals_max_new_tokens,
+    )
+
+    logger: StubLogger = StubLogger()
+    evaluator: AsyncEvaluator = AsyncEvaluator(
+        cfg=cfg,
+        logger=logger,
+        val_dataset=dataset,
+        val_dataset_tokens=dataset_tokens,
+        max_pending=1,
+    )
+    evaluator.submit(model, iteration=3, eval_functions=PathEvals.fast)
+    # training keeps updating the weights while the evals run
+    with torch.no_grad():
+        for param in model.parameters():
+            param.add_(1.0)
+    evaluator.submit(model, iteration=4, eval_functions=PathEvals.fast)
+    evaluator.close()
+
+    results: list[dict] = [log[1][0] for log in logger.logs]
+    assert [r["iteration"] for r in results] == [3, 4]
+    assert results[0] == {
+        "iteration": 3,
+        **expected,
+        "eval_pad_fraction": results[0]["eval_pad_fraction"],
+    }
+    assert 0 <= results[0]["eval_pad_fraction"] < 1
+
+
+def test_async_evaluator_own_tokenizer():
+    cfg: ConfigHolder = ConfigHolder(
+        train_cfg=TRAINING_CONFIGS["test-v1"],
+        model_cfg=GPT_CONFIGS["tiny-v1"],
+        dataset_cfg=MazeDatasetConfig(name="test", grid_n=3, n_mazes=5),
+    )
+    model = cfg.create_model_zanj()
+    evaluator: AsyncEvaluator = AsyncEvaluator(
+        cfg=cfg,
+        logger=StubLogger(),
+        val_dataset=MazeDataset.generate(cfg.dataset_cfg),
+    )
+    evaluator.close()
+
+    assert evaluator.eval_model.tokenizer is not model.tokenizer
+    assert evaluator.eval_model.tokenizer.padding_side == "left"
+    assert model.tokenizer.padding_side == "left"
+    # changes to the eval tokenizer don't reach the training model
+    evaluator.eval_model.tokenizer.padding_side = "right"
+    assert model.tokenizer.padding_side == "left"
@@ -0,0 +1,97 @@
+from pathlib import Path
+
+import pytest
+import torch
+from maze_dataset import MazeDatasetConfig
+from zanj import ZANJ
+
+from maze_transformer.test_helpers.stub_logger import StubLogger
+from maze_transformer.training.checkpointing import (
+    AsyncCheckpointWriter,
+    find_train_state,
+    save_train_state,
+    snapshot_state_dict,
+)
+from maze_transformer.training.config import (
+    GPT_CONFIGS,
+    TRAINING_CONFIGS,
+    ConfigHolder,
+    ZanjHookedTransformer,
+)
+from maze_transformer.training.train_save_files import TRAIN_SAVE_FILES
+
+
+def test_snapshot_state_dict():
+    cfg: ConfigHolder = ConfigHolder(
+        train_cfg=TRAINING_CONFIGS["test-v1"],
+        model_cfg=GPT_CONFIGS["tiny-v1"],
+        dataset_cfg=MazeDatasetConfig(name="test", grid_n=3, n_mazes=5),
+    )
+    model: ZanjHookedTransformer = cfg.create_model_zanj()
+    snapshot: dict[str, torch.Tensor] = snapshot_state_dict(model)
+
+    for key, value in model.state_dict().items():
+        assert torch.equal(snapshot[key], value)
+        assert snapshot[key].data_ptr() != value.data_ptr()
+
+
+@pytest.mark.usefixtures("temp_dir")
+def test_async_checkpoint_writer(temp_dir: Path):
+    cfg: ConfigHolder = ConfigHolder(
+        train_cfg=TRAINING_CONFIGS["test-v1"],
+        model_cfg=GPT_CONFIGS["tiny-v1"],
+        dataset_cfg=MazeDatasetConfig(name="test", grid_n=3, n_mazes=5),
+    )
+    model: ZanjHookedTransformer = cfg.create_model_zanj()
+    model.training_records = {"wandb_url": "stub"}
+    logger: StubLogger = StubLogger()
+    writer: AsyncCheckpointWriter = AsyncCheckpointWriter(
+        logger=logger, max_in_flight=1
+    )
+
+    zanj: ZANJ = ZANJ(
+        custom_settings={"_load_state_dict_wrapper": {"recover_exact": True}}
+    )
+    for i in range(3):
+        zanj.save(model, temp_dir / f"model.sync_{i}.zanj")
+        writer.save(model, temp_dir / f"model.iter_{i}.zanj", aliases=[f"iter-{i}"])
+        # training keeps updating the weights while the checkpoint is written
+        with torch.no_grad():
+            for param in model.parameters():
+                param.add_(1.0)
+    writer.close()
+
+    # the same as saving synchronously at that point
+    for i in range(3):
+        loaded: ZanjHookedTransformer = zanj.read(temp_dir / f"model.iter_{i}.zanj")
+        expected: ZanjHookedTransformer = zanj.read(temp_dir / f"model.sync_{i}.zanj")
+        assert loaded.zanj_model_config.name == cfg.name
+        assert loaded.training_records == {"wandb_url": "stub"}
+        for key, value in loaded.state_dict().items():
+            assert torch.equal(value, expected.state_dict()[key])
+
+    # uploads happen after each write, in order
+    assert [log[2]["aliases"] for log in logger.logs] == [
+        ["iter-0"],
+        ["iter-1"],
+        ["iter-2"],
+    ]
+
+
+@pytest.mark.usefixtures("temp_dir")
+def test_find_train_state(temp_dir: Path):
+    checkpoints_dir: Path = temp_dir / TRAIN_SAVE_FILES.checkpoints
+    checkpoints_dir.mkdir()
+    with pytest.raises(FileNotFoundError):
+        find_train_state(temp_dir)
+
+    for iteration in [2, 10, 7]:
+        save_train_state(
+            {"iteration": iteration},
+            checkpoints_dir / TRAIN_SAVE_FILES.train_state_checkpt(iteration),
+        )
+    latest: Path = checkpoints_dir / TRAIN_SAVE_FILES.train_state_checkpt(10)
+    assert find_train_state(temp_dir) == latest
+    assert find_train_state(checkpoints_dir) == latest
+    assert find_train_state(latest) == latest
+    assert torch.load(find_train_state(temp_dir)) == {"iteration": 10}
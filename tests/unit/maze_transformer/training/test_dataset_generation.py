@@ -0,0 +1,112 @@
+from pathlib import Path
+
+import pytest
+from maze_dataset import MazeDataset, MazeDatasetConfig
+
+from maze_transformer.training.dataset_generation import (
+    _chunk_path,
+    _write_chunk,
+    generate_datasets,
+    generated_dataset_fname,
+    split_validation_dataset,
+)
+from maze_transformer.training.streaming_dataset import generate_solved_maze
+
+
+def test_generate_datasets(temp_dir: Path):
+    cfgs = [
+        MazeDatasetConfig(name="train", grid_n=3, n_mazes=10),
+        MazeDatasetConfig(name="val", grid_n=4, n_mazes=5),
+    ]
+    messages: list[str] = list()
+    datasets = generate_datasets(
+        cfgs,
+        local_base_path=temp_dir / "parallel",
+        n_workers=2,
+        chunk_size=3,
+        progress=messages.append,
+    )
+    datasets_serial = generate_datasets(
+        cfgs, local_base_path=temp_dir / "serial", n_workers=1
+    )
+
+    assert [len(dataset) for dataset in datasets] == [10, 5]
+    assert datasets == datasets_serial
+    assert "mazes/sec" in messages[-1]
+    for cfg, dataset in zip(cfgs, datasets):
+        # saved without the chunks, and read back instead of generated again
+        fname: str = generated_dataset_fname(cfg)
+        assert (temp_dir / "parallel" / f"{fname}.zanj").exists()
+        assert not (temp_dir / "parallel" / f"{fname}.chunks").exists()
+        # but not where `from_config` would mistake it for `MazeDataset.generate`'s mazes
+        with pytest.raises(ValueError):
+            MazeDataset.from_config(
+                cfg,
+                do_generate=False,
+                do_download=False,
+                local_base_path=temp_dir / "parallel",
+            )
+    assert (
+        generate_datasets(
+            cfgs, local_base_path=temp_dir / "parallel", progress=messages.append
+        )
+        == datasets
+    )
+    assert "generating" not in messages[-1]
+
+
+def test_generate_datasets_repeated_cfg(temp_dir: Path):
+    # i.e. a validation config equal to the training one
+    cfg = MazeDatasetConfig(name="test", grid_n=3, n_mazes=6)
+    messages: list[str] = list()
+    datasets = generate_datasets(
+        [cfg, MazeDatasetConfig.load(cfg.serialize())],
+        local_base_path=temp_dir,
+        n_workers=2,
+        chunk_size=2,
+        progress=messages.append,
+    )
+    assert len(datasets) == 2
+    assert datasets[0] is datasets[1]
+    assert len(datasets[0]) == 6
+    assert "generating 6 mazes for 1 datasets in 3 chunks" in messages[0]
+
+
+def test_generate_datasets_reuses_chunks(temp_dir: Path):
+    cfg = MazeDatasetConfig(name="test", grid_n=3, n_mazes=6)
+    # as if an earlier generation was interrupted after its second chunk
+    chunks_dir: Path = temp_dir / f"{generated_dataset_fname(cfg)}.chunks"
+    chunks_dir.mkdir(parents=True)
+    other_mazes = [generate_solved_maze(cfg, seed=0, index=i) for i in range(3)]
+    _write_chunk(_chunk_path(chunks_dir, 3), other_mazes)
+
+    messages: list[str] = list()
+    (dataset,) = generate_datasets(
+        [cfg], local_base_path=temp_dir, chunk_size=3, progress=messages.append
+    )
+    assert dataset.mazes[3:] == other_mazes
+    assert dataset.mazes[:3] == [
+        generate_solved_maze(cfg, seed=cfg.seed, index=i) for i in range(3)
+    ]
+    assert messages[0].startswith("generating 3 mazes")
+
+
+def test_generate_datasets_collects_generation_meta(temp_dir: Path):
+    cfg = (
+        MazeDataset.generate(MazeDatasetConfig(name="test", grid_n=3, n_mazes=4))
+        .filter_by.collect_generation_meta()
+        .cfg
+    )
+    (dataset,) = generate_datasets([cfg], local_base_path=temp_dir, chunk_size=3)
+    assert dataset.generation_metadata_collected["func_name"] == {"gen_dfs": 4}
+
+
+def test_split_validation_dataset():
+    cfg = MazeDatasetConfig(name="test", grid_n=3, n_mazes=10)
+    dataset = MazeDataset.generate(cfg)
+    train_dataset, val_dataset = split_validation_dataset(dataset, 4)
+
+    assert len(train_dataset) == train_dataset.cfg.n_mazes == 6
+    assert len(val_dataset) == val_dataset.cfg.n_mazes == 4
+    assert train_dataset.mazes + val_dataset.mazes == dataset.mazes
+    assert cfg.n_mazes == dataset.cfg.n_mazes == len(dataset) == 10
@@ -0,0 +1,77 @@
+import os
+import socket
+
+import pytest
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from maze_dataset import MazeDataset, MazeDatasetConfig
+from muutils.statcounter import StatCounter
+
+from maze_transformer.test_helpers.distributed import run_without_teardown
+from maze_transformer.training.distributed import (
+    all_reduce_mean,
+    broadcast_object,
+    get_rank,
+    get_world_size,
+    init_distributed,
+    is_main_process,
+    reduce_stat_counters,
+    shard_dataset,
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_not_distributed():
+    assert not init_distributed()
+    assert (get_rank(), get_world_size(), is_main_process()) == (0, 1, True)
+    assert broadcast_object("x") == "x"
+    assert all_reduce_mean(1.5) == 1.5
+    scores: dict[str, StatCounter] = {"a": StatCounter([1, 2])}
+    assert reduce_stat_counters(scores) is scores
+
+    dataset: MazeDataset = MazeDataset.generate(
+        MazeDatasetConfig(name="test", grid_n=3, n_mazes=3)
+    )
+    assert shard_dataset(dataset) == (dataset, None)
+
+
+def _check_collectives(rank: int, world_size: int, port: int, dataset: MazeDataset):
+    os.environ.update(
+        RANK=str(rank),
+        LOCAL_RANK=str(rank),
+        WORLD_SIZE=str(world_size),
+        MASTER_ADDR="127.0.0.1",
+        MASTER_PORT=str(port),
+    )
+    assert init_distributed(backend="gloo")
+    assert get_rank() == rank
+    assert is_main_process() == (rank == 0)
+    assert broadcast_object(f"from rank {rank}") == "from rank 0"
+    assert all_reduce_mean(float(rank)) == 0.5
+
+    reduced: dict[str, StatCounter] = reduce_stat_counters(
+        {"rank": StatCounter([rank, rank])}
+    )
+    assert reduced["rank"] == StatCounter([0, 0, 1, 1])
+
+    tokens: list[list[str]] = [[str(i)] for i in range(len(dataset))]
+    shard, shard_tokens = shard_dataset(dataset, tokens)
+    assert shard.mazes == dataset.mazes[rank::world_size]
+    assert shard_tokens == tokens[rank::world_size]
+
+
+@pytest.mark.skipif(not dist.is_available(), reason="torch.distributed not available")
+def test_collectives_gloo():
+    dataset: MazeDataset = MazeDataset.generate(
+        MazeDatasetConfig(name="test", grid_n=3, n_mazes=5)
+    )
+    mp.spawn(
+        run_without_teardown,
+        args=(_check_collectives, 2, _free_port(), dataset),
+        nprocs=2,
+    )
@@ -1,10 +1,16 @@
 import pytest
+import torch
 from maze_dataset import MazeDataset, MazeDatasetConfig, SolvedMaze
 from maze_dataset.tokenization import MazeTokenizer, TokenizationMode
 
 from maze_transformer.test_helpers.stub_logger import StubLogger
 from maze_transformer.training.config import GPT_CONFIGS, TRAINING_CONFIGS, ConfigHolder
-from maze_transformer.training.training import get_dataloader
+from maze_transformer.training.tokenized_dataset import TokenizedMazeDataset
+from maze_transformer.training.training import (
+    LengthGroupedSampler,
+    ResumableSampler,
+    get_dataloader,
+)
 
 
 @pytest.mark.parametrize(
@@ -43,3 +49,100 @@ def test_get_dataloader(tok_mode: TokenizationMode):
         for dataloader_maze in dataloader_mazes
     )
     assert batch1 != other_batch1  # adj_list is shuffled for every sample
+
+
+@pytest.mark.parametrize(
+    "tok_mode",
+    [
+        pytest.param(TokenizationMode.AOTP_UT_rasterized, id="rasterized"),
+        pytest.param(TokenizationMode.AOTP_UT_uniform, id="uniform"),
+    ],
+)
+def test_get_dataloader_pretokenized(tok_mode: TokenizationMode):
+    dataset_config = MazeDatasetConfig(name="test", grid_n=3, n_mazes=5)
+    dataset = MazeDataset.generate(dataset_config)
+    config_holder: ConfigHolder = ConfigHolder(
+        dataset_cfg=dataset_config,
+        model_cfg=GPT_CONFIGS["nano-v1"],
+        train_cfg=TRAINING_CONFIGS["test-v1"],
+        maze_tokenizer=MazeTokenizer(tokenization_mode=tok_mode),
+    )
+    config_holder.train_cfg.batch_size = 5
+    dataloader = get_dataloader(dataset, config_holder, StubLogger(), pretokenize=True)
+    assert isinstance(dataloader.dataset, TokenizedMazeDataset)
+
+    batch: torch.Tensor = next(iter(dataloader))
+    assert batch.shape[0] == 5
+
+    # the batch should match what the model would produce from the equivalent strings
+    model = config_holder.create_model_zanj()
+    batch_strings: list[str] = [
+        " ".join(config_holder.maze_tokenizer.decode(x.tolist()))
+        for x in dataloader.dataset
+    ]
+    pretokenized_sorted = sorted(batch.tolist())
+    from_strings_sorted = sorted(model.to_tokens(batch_strings).cpu().tolist())
+    assert pretokenized_sorted == from_strings_sorted
+
+    # and contain the same mazes as the dataset
+    dataloader_mazes = [
+        SolvedMaze.from_tokens(tokens, config_holder.maze_tokenizer)
+        for tokens in batch_strings
+    ]
+    assert all(
+        any(dataloader_maze == dataset_maze for dataset_maze in dataset)
+        for dataloader_maze in dataloader_mazes
+    )
+
+
+def test_resumable_sampler():
+    sampler: ResumableSampler = ResumableSampler(10, shuffle=True)
+    order: list[int] = list(sampler)
+    assert sorted(order) == list(range(10))
+
+    # resuming regenerates the same order, from where it stopped
+    resumed: ResumableSampler = ResumableSampler(10, **sampler.state_dict(4))
+    assert len(resumed) == 6
+    assert list(resumed) == order[4:]
+
+    assert list(ResumableSampler(5, shuffle=False, start_index=2)) == [2, 3, 4]
+
+
+def test_resumable_sampler_sharded():
+    order: list[int] = list(ResumableSampler(11, seed=0))
+    shards: list[ResumableSampler] = [
+        ResumableSampler(11, seed=0, num_replicas=2, rank=rank) for rank in range(2)
+    ]
+    # processes get disjoint, equally sized shards of the same order, the tail is dropped
+    assert [len(shard) for shard in shards] == [5, 5]
+    assert list(shards[0]) == order[0:10:2]
+    assert list(shards[1]) == order[1:10:2]
+
+    # `start_index` counts the samples consumed by all processes
+    resumed: ResumableSampler = ResumableSampler(
+        11, **shards[1].state_dict(4), num_replicas=2, rank=1
+    )
+    assert list(resumed) == order[5:10:2]
+
+
+def test_length_grouped_sampler():
+    lengths: list[int] = [i % 7 for i in range(40)]
+    sampler: LengthGroupedSampler = LengthGroupedSampler(
+        lengths, batch_size=4, window_batches=5, seed=0
+    )
+    order: list[int] = list(sampler)
+    assert sorted(order) == list(range(40))
+    # each window of 5 batches is sorted by length, then the batches are shuffled
+    for window_start in range(0, 40, 20):
+        batch_lengths: list[list[int]] = sorted(
+            sorted(lengths[i] for i in order[start : start + 4])
+            for start in range(window_start, window_start + 20, 4)
+        )
+        flat: list[int] = [x for batch in batch_lengths for x in batch]
+        assert flat == sorted(flat)
+
+    # the order is determined by the seed, so resuming works as for `ResumableSampler`
+    resumed: LengthGroupedSampler = LengthGroupedSampler(
+        lengths, batch_size=4, window_batches=5, **sampler.state_dict(8)
+    )
+    assert list(resumed) == order[8:]
@@ -0,0 +1,81 @@
+import json
+import threading
+from pathlib import Path
+
+import pytest
+from muutils.statcounter import StatCounter
+
+from maze_transformer.training.jsonl_logger import JSONLLogger
+from maze_transformer.training.train_save_files import TRAIN_SAVE_FILES
+
+
+def _read_log(path: Path) -> list[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_jsonl_logger(temp_dir: Path):
+    logger = JSONLLogger.create(
+        config=dict(name="test"),
+        project="test-project",
+        job_type="train-model",
+        output_dir=temp_dir,
+    )
+    logger.summary(dict(n_batches=3))
+    logger.log_metric(dict(loss=1.5))
+    logger.log_metric_hist(dict(iteration=1, score=StatCounter([1, 2, 2, 3])))
+    logger.upload_model(temp_dir / "model.zanj", aliases=["latest"])
+    logger.close()
+    # closing again does nothing, logging after closing raises
+    logger.close()
+    with pytest.raises(RuntimeError):
+        logger.progress("after close")
+
+    records = _read_log(temp_dir / TRAIN_SAVE_FILES.log)
+    assert [r["type"] for r in records] == [
+        "config",
+        "progress",
+        "summary",
+        "metric",
+        "metric",
+        "model",
+    ]
+    assert records[0]["project"] == "test-project"
+    assert records[0]["config"] == dict(name="test")
+    assert records[2]["data"] == dict(n_batches=3)
+    assert [r["step"] for r in records[3:5]] == [0, 1]
+    assert records[3]["data"] == dict(loss=1.5)
+
+    # the whole counter is kept, along with its summary
+    score = records[4]["data"]["score"]
+    assert StatCounter.load(score) == StatCounter([1, 2, 2, 3])
+    assert score["summary"]["median"] == 2
+    assert score["summary"]["mean"] == 2
+    assert records[5]["aliases"] == ["latest"]
+
+
+def test_jsonl_logger_batches_and_appends(temp_dir: Path):
+    path: Path = temp_dir / TRAIN_SAVE_FILES.log
+    # a long flush interval, so the records are written in batches of `max_batch_size`
+    logger = JSONLLogger(path, flush_interval=60, max_batch_size=10)
+
+    # from several threads, as with async evals
+    def _log_metrics():
+        for i in range(25):
+            logger.log_metric_hist(dict(i=i))
+
+    threads = [threading.Thread(target=_log_metrics) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logger.close()
+
+    # a resumed run appends to the same log
+    logger = JSONLLogger(path)
+    logger.log_metric_hist(dict(i=-1))
+    logger.close()
+
+    records = _read_log(path)
+    assert [r["step"] for r in records[:100]] == list(range(100))
+    assert records[100] == dict(records[100], step=0, data=dict(i=-1))
@@ -0,0 +1,90 @@
+import torch
+from maze_dataset import MazeDataset, MazeDatasetConfig
+
+from maze_transformer.evaluation.eval_model import evaluate_logits, get_path_target_mask
+from maze_transformer.training.config import (
+    GPT_CONFIGS,
+    TRAINING_CONFIGS,
+    ConfigHolder,
+    ZanjHookedTransformer,
+)
+from maze_transformer.training.loss import (
+    next_token_loss_ignore_padding,
+    path_token_loss,
+)
+from maze_transformer.utils.padding import pad_to_bucket
+
+
+def _get_model_and_mazes() -> tuple[ConfigHolder, ZanjHookedTransformer, list[str]]:
+    torch.manual_seed(0)
+    cfg: ConfigHolder = ConfigHolder(
+        train_cfg=TRAINING_CONFIGS["test-v1"],
+        model_cfg=GPT_CONFIGS["nano-v1"],
+        dataset_cfg=MazeDatasetConfig(name="test", grid_n=3, n_mazes=4),
+    )
+    model: ZanjHookedTransformer = cfg.create_model_zanj()
+    dataset: MazeDataset = MazeDataset.generate(cfg.dataset_cfg)
+    maze_tokens: list[str] = [
+        " ".join(x) for x in dataset.as_tokens(cfg.maze_tokenizer)
+    ]
+    return cfg, model, maze_tokens
+
+
+def test_next_token_loss_ignore_padding():
+    cfg, model, maze_tokens = _get_model_and_mazes()
+    padding_idx: int = cfg.maze_tokenizer.padding_token_index
+
+    # without padding, the same as the loss of the model
+    tokens: torch.Tensor = model.to_tokens(maze_tokens[:1])
+    assert (tokens != padding_idx).all()
+    logits, loss = model(tokens, return_type="both")
+    assert torch.allclose(
+        next_token_loss_ignore_padding(logits, tokens, padding_idx), loss
+    )
+
+    # with padding, the same no matter how much padding there is
+    batch: torch.Tensor = model.to_tokens(maze_tokens)
+    batch_padded: torch.Tensor = pad_to_bucket(batch, padding_idx, bucket_size=64)
+    assert batch_padded.shape[1] > batch.shape[1]
+    assert torch.allclose(
+        next_token_loss_ignore_padding(model(batch), batch, padding_idx),
+        next_token_loss_ignore_padding(model(batch_padded), batch_padded, padding_idx),
+        atol=1e-5,
+    )
+
+
+def test_path_token_loss():
+    cfg, model, maze_tokens = _get_model_and_mazes()
+    batch: torch.Tensor = model.to_tokens(maze_tokens)
+    logits: torch.Tensor = model(batch)
+    path_mask: torch.Tensor = get_path_target_mask(batch, cfg)
+    assert path_mask.shape == (batch.shape[0], batch.shape[1] - 1)
+    assert path_mask.any(dim=1).all()
+
+    # the mean of the teacher-forced token losses, which are computed over the same tokens
+    token_loss = evaluate_logits(logits, batch, cfg)["teacher_forced/token_loss"]
+    assert torch.isclose(
+        path_token_loss(logits, batch, path_mask),
+        torch.tensor(token_loss.mean(), dtype=logits.dtype),
+        atol=1e-5,
+    )
+
+
+def test_path_token_loss_no_path_tokens():
+    cfg, model, maze_tokens = _get_model_and_mazes()
+    batch: torch.Tensor = model.to_tokens(maze_tokens)
+    logits: torch.Tensor = model(batch)
+    path_mask: torch.Tensor = torch.zeros(
+        batch.shape[0], batch.shape[1] - 1, dtype=torch.bool
+    )
+
+    loss: torch.Tensor = path_token_loss(logits, batch, path_mask)
+    assert loss.item() == 0
+    loss.backward()
+    assert all(
+        param.grad is not None
+        and not param.grad.isnan().any()
+        and (param.grad == 0).all()
+        for param in model.parameters()
+        if param.requires_grad
+    )
@@ -0,0 +1,37 @@
+import math
+import time
+
+import pytest
+import torch
+
+from maze_transformer.training.step_timer import STEP_SECTIONS, StepTimer
+
+
+def test_step_timer():
+    timer: StepTimer = StepTimer(torch.device("cpu"))
+
+    items: list[int] = list()
+    for item in timer.time_iterator(iter(range(4))):
+        with timer.section("forward"):
+            time.sleep(0.01)
+        timer.add("checkpoint", 1.0)
+        timer.count(n_samples=2, n_tokens=10)
+        items.append(item)
+        if item % 2 == 1:
+            timer.step()
+    assert items == [0, 1, 2, 3]
+
+    summary: dict[str, float] = timer.summary()
+    # per optimizer step, of which there were 2
+    assert summary["timing/checkpoint"] == 2.0
+    assert summary["timing/forward"] >= 0.02
+    assert summary["timing/data_wait"] < summary["timing/forward"]
+    assert set(f"timing/{name}" for name in STEP_SECTIONS) < set(summary)
+    assert summary["throughput/tokens_per_sec"] == pytest.approx(
+        summary["throughput/samples_per_sec"] * 5
+    )
+    assert math.isnan(summary["memory/peak_mb"]) or summary["memory/peak_mb"] > 0
+
+    # everything is reset after a summary
+    assert timer.n_steps == 0 and timer.n_samples == 0
+    assert all(seconds == 0.0 for seconds in timer.times.values())
@@ -0,0 +1,166 @@
+import numpy as np
+import pytest
+import torch
+from maze_dataset import MazeDatasetConfig, SolvedMaze
+from maze_dataset.tokenization import MazeTokenizer, TokenizationMode
+from torch.utils.data import DataLoader
+
+from maze_transformer.test_helpers.stub_logger import StubLogger
+from maze_transformer.training.config import GPT_CONFIGS, TRAINING_CONFIGS, ConfigHolder
+from maze_transformer.training.streaming_dataset import (
+    SharedHashFilter,
+    StreamingMazeDataset,
+    generate_distinct_mazes,
+    generate_solved_maze,
+    maze_hash_key,
+)
+from maze_transformer.training.training import get_dataloader
+
+
+def _get_mazes(dataset: StreamingMazeDataset, num_workers: int) -> list[SolvedMaze]:
+    return list(
+        DataLoader(
+            dataset, batch_size=None, num_workers=num_workers, collate_fn=lambda x: x
+        )
+    )
+
+
+def _keys(mazes: list[SolvedMaze]) -> set[bytes]:
+    return {maze_hash_key(maze) for maze in mazes}
+
+
+def test_shared_hash_filter():
+    hash_filter = SharedHashFilter(n_bits=2**16)
+    assert not hash_filter.add(b"a")
+    assert not hash_filter.add(b"b")
+    assert hash_filter.add(b"a")
+    assert hash_filter.add(b"b")
+
+
+def test_shared_hash_filter_for_capacity():
+    hash_filter = SharedHashFilter.for_capacity(10_000, false_positive_rate=0.01)
+    for i in range(10_000):
+        hash_filter.add(b"a%d" % i)
+    assert all(hash_filter.add(b"a%d" % i) for i in range(10_000))
+    # few enough new keys that the filter stays close to its capacity
+    n_false_positives: int = sum(hash_filter.add(b"b%d" % i) for i in range(1_000))
+    assert n_false_positives < 25
+
+
+def test_generate_solved_maze_deterministic():
+    cfg = MazeDatasetConfig(name="test", grid_n=5, n_mazes=10)
+    np_state = np.random.get_state()
+    maze = generate_solved_maze(cfg, seed=1, index=3)
+    # the global random state is left untouched
+    assert np.array_equal(np.random.get_state()[1], np_state[1])
+    assert maze == generate_solved_maze(cfg, seed=1, index=3)
+    assert maze != generate_solved_maze(cfg, seed=1, index=4)
+    assert maze != generate_solved_maze(cfg, seed=2, index=3)
+
+
+def test_streaming_dataset_independent_of_workers():
+    cfg = MazeDatasetConfig(name="test", grid_n=5, n_mazes=10)
+    mazes = _get_mazes(StreamingMazeDataset(cfg), num_workers=0)
+    mazes_workers = _get_mazes(StreamingMazeDataset(cfg), num_workers=2)
+
+    assert len(mazes) == len(mazes_workers) == 10
+    assert len(_keys(mazes)) == 10
+    assert _keys(mazes) == _keys(mazes_workers)
+    assert all(isinstance(maze, SolvedMaze) for maze in mazes)
+
+
+def test_streaming_dataset_skips_duplicates():
+    # there are only a few distinct 2x2 mazes, so most candidates are duplicates
+    cfg = MazeDatasetConfig(name="test", grid_n=2, n_mazes=200)
+    with pytest.warns(UserWarning, match="duplicates"):
+        mazes = list(StreamingMazeDataset(cfg, max_consecutive_duplicates=100))
+    assert 0 < len(mazes) < 200
+    assert len(_keys(mazes)) == len(mazes)
+
+
+def test_streaming_dataset_excludes_validation():
+    cfg = MazeDatasetConfig(name="test", grid_n=3, n_mazes=20)
+    val_dataset = generate_distinct_mazes(cfg, n_mazes=10, seed=cfg.seed + 1)
+    assert len(val_dataset) == val_dataset.cfg.n_mazes == 10
+    assert cfg.n_mazes == 20
+    assert len(_keys(val_dataset.mazes)) == 10
+
+    mazes = list(StreamingMazeDataset(cfg, exclude=val_dataset.mazes))
+    assert len(mazes) == 20
+    assert not _keys(mazes) & _keys(val_dataset.mazes)
+
+
+def test_streaming_dataset_resume():
+    cfg = MazeDatasetConfig(name="test", grid_n=5, n_mazes=10)
+    dataset = StreamingMazeDataset(cfg)
+    mazes = list(dataset)
+
+    state = dataset.state_dict(n_consumed=4)
+    assert state == dict(seed=cfg.seed, start_index=4, num_workers=0)
+    resumed_dataset = StreamingMazeDataset(cfg)
+    resumed_dataset.load_state_dict(state)
+    resumed = list(resumed_dataset)
+    assert len(resumed) == len(resumed_dataset) == 6
+    assert _keys(resumed) == _keys(mazes[4:])
+
+
+def test_streaming_dataset_resume_needs_one_worker():
+    cfg = MazeDatasetConfig(name="test", grid_n=5, n_mazes=10)
+    state = StreamingMazeDataset(cfg, num_workers=2).state_dict(n_consumed=4)
+    with pytest.raises(ValueError, match="num_workers"):
+        StreamingMazeDataset(cfg).load_state_dict(state)
+    with pytest.raises(ValueError, match="num_workers"):
+        StreamingMazeDataset(cfg, num_workers=2).load_state_dict(
+            dict(state, num_workers=1)
+        )
+
+
+def test_streaming_dataset_applies_filters():
+    cfg = MazeDatasetConfig(
+        name="test",
+        grid_n=4,
+        n_mazes=10,
+        applied_filters=[dict(name="path_length", args=(), kwargs=dict(min_length=6))],
+    )
+    assert any(
+        len(generate_solved_maze(cfg, seed=cfg.seed, index=i).solution) < 6
+        for i in range(20)
+    )
+    mazes = list(StreamingMazeDataset(cfg))
+    assert len(mazes) == 10
+    assert all(len(maze.solution) >= 6 for maze in mazes)
+
+    val_dataset = generate_distinct_mazes(cfg, n_mazes=5, seed=cfg.seed + 1)
+    assert all(len(maze.solution) >= 6 for maze in val_dataset)
+
+    # filters which need the whole dataset can't be applied to a stream
+    cfg.applied_filters = [
+        dict(name="cut_percentile_shortest", args=(), kwargs=dict(percentile=10.0))
+    ]
+    with pytest.raises(ValueError, match="cut_percentile_shortest"):
+        StreamingMazeDataset(cfg)
+
+
+def test_get_dataloader_streaming():
+    dataset_config = MazeDatasetConfig(name="test", grid_n=3, n_mazes=10)
+    config_holder: ConfigHolder = ConfigHolder(
+        dataset_cfg=dataset_config,
+        model_cfg=GPT_CONFIGS["nano-v1"],
+        train_cfg=TRAINING_CONFIGS["test-v1"],
+        maze_tokenizer=MazeTokenizer(
+            tokenization_mode=TokenizationMode.AOTP_UT_uniform
+        ),
+    )
+    config_holder.train_cfg.batch_size = 5
+    dataloader = get_dataloader(
+        StreamingMazeDataset(dataset_config),
+        config_holder,
+        StubLogger(),
+        pretokenize=True,
+        sampler_state=dict(seed=dataset_config.seed, start_index=5),
+    )
+
+    batches: list[torch.Tensor] = list(dataloader)
+    assert len(dataloader) == len(batches) == 1
+    assert batches[0].shape[0] == 5
+    assert batches[0].dtype == torch.long
@@ -0,0 +1,109 @@
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pytest
+from maze_dataset import MazeDataset, MazeDatasetConfig, SolvedMaze
+from maze_dataset.tokenization import MazeTokenizer, TokenizationMode
+
+from maze_transformer.training import tokenized_dataset
+from maze_transformer.training.tokenized_dataset import (
+    TokenizedMazeDataset,
+    dataset_content_hash,
+    token_cache_fname,
+)
+
+
+def _get_dataset_and_tokenizer(
+    n_mazes: int = 5,
+) -> tuple[MazeDataset, MazeTokenizer]:
+    dataset: MazeDataset = MazeDataset.generate(
+        MazeDatasetConfig(name="test", grid_n=3, n_mazes=n_mazes)
+    )
+    maze_tokenizer: MazeTokenizer = MazeTokenizer(
+        tokenization_mode=TokenizationMode.AOTP_UT_uniform, max_grid_size=3
+    )
+    return dataset, maze_tokenizer
+
+
+def test_tokenized_dataset_round_trip():
+    dataset, maze_tokenizer = _get_dataset_and_tokenizer()
+    tokenized: TokenizedMazeDataset = TokenizedMazeDataset.from_maze_dataset(
+        dataset, maze_tokenizer
+    )
+
+    assert len(tokenized) == len(dataset)
+    assert tokenized.lengths.sum() == len(tokenized.tokens)
+    for maze, tokens, ids in zip(
+        dataset, tokenized.as_tokens(maze_tokenizer), tokenized
+    ):
+        assert maze_tokenizer.encode(tokens) == ids.tolist()
+        assert SolvedMaze.from_tokens(tokens, maze_tokenizer) == maze
+
+
+@pytest.mark.usefixtures("temp_dir")
+def test_token_cache(temp_dir: Path):
+    dataset, maze_tokenizer = _get_dataset_and_tokenizer()
+    written: TokenizedMazeDataset = TokenizedMazeDataset.from_maze_dataset(
+        dataset, maze_tokenizer, cache_dir=temp_dir
+    )
+    assert all(p.exists() for p in written.cache_paths)
+
+    # second time around, read the memory-mapped cache instead of re-encoding
+    read: TokenizedMazeDataset = TokenizedMazeDataset.from_maze_dataset(
+        dataset, maze_tokenizer, cache_dir=temp_dir
+    )
+    assert isinstance(read.tokens, np.memmap)
+    assert read.cache_paths == written.cache_paths
+    assert np.array_equal(read.tokens, written.tokens)
+    assert np.array_equal(read.offsets, written.offsets)
+
+    # pickling (i.e. for dataloader workers) only sends the paths
+    assert len(pickle.dumps(read)) < read.tokens.nbytes
+    unpickled: TokenizedMazeDataset = pickle.loads(pickle.dumps(read))
+    assert isinstance(unpickled.tokens, np.memmap)
+    assert all(a.tolist() == b.tolist() for a, b in zip(unpickled, read))
+
+
+def test_token_cache_fname():
+    dataset, maze_tokenizer = _get_dataset_and_tokenizer(n_mazes=4)
+    fname: str = token_cache_fname(dataset, maze_tokenizer)
+    assert fname == token_cache_fname(dataset, maze_tokenizer)
+
+    # different tokenizer
+    assert fname != token_cache_fname(
+        dataset,
+        MazeTokenizer(
+            tokenization_mode=TokenizationMode.AOTP_UT_rasterized, max_grid_size=3
+        ),
+    )
+
+    # two halves of a split with the same config
+    half_a: MazeDataset = MazeDataset(dataset.cfg, mazes=dataset.mazes[:2])
+    half_b: MazeDataset = MazeDataset(dataset.cfg, mazes=dataset.mazes[2:])
+    half_a.update_self_config()
+    assert token_cache_fname(half_a, maze_tokenizer) != token_cache_fname(
+        half_b, maze_tokenizer
+    )
+
+    # same config, length and first and last mazes, but a different maze in the middle
+    other, _ = _get_dataset_and_tokenizer(n_mazes=8)
+    mixed: MazeDataset = MazeDataset(
+        dataset.cfg, mazes=[dataset.mazes[0], other.mazes[5], *dataset.mazes[2:]]
+    )
+    assert mixed.mazes[1] != dataset.mazes[1]
+    assert token_cache_fname(mixed, maze_tokenizer) != fname
+
+
+def test_dataset_content_hash_stored(monkeypatch):
+    dataset, _ = _get_dataset_and_tokenizer(n_mazes=4)
+    content_hash: str = dataset_content_hash(dataset)
+
+    # looked up again without hashing the mazes
+    monkeypatch.setattr(tokenized_dataset.hashlib, "sha256", None)
+    assert dataset_content_hash(dataset) == content_hash
+    monkeypatch.undo()
+
+    # but hashed again once the mazes change
+    dataset.mazes = dataset.mazes[::-1]
+    assert dataset_content_hash(dataset) != content_hash
@@ -0,0 +1,33 @@
+from muutils.statcounter import StatCounter
+
+from maze_transformer.training.wandb_logger import WandbLogger
+
+
+class _RecordingRun:
+    def __init__(self):
+        self.logged: list[dict] = list()
+        self.defined: dict[str, str | None] = dict()
+
+    def log(self, data: dict) -> None:
+        self.logged.append(data)
+
+    def define_metric(self, name: str, step_metric: str | None = None) -> None:
+        self.defined[name] = step_metric
+
+
+def test_wandb_logger_plots_tagged_metrics_against_iteration():
+    run: _RecordingRun = _RecordingRun()
+    logger: WandbLogger = WandbLogger(run)
+
+    logger.log_metric_hist({"loss": 1.0})
+    assert run.defined == dict()
+
+    # i.e. async evals, logged on a later step than the iteration they belong to
+    logger.log_metric_hist({"iteration": 0, "node_overlap": StatCounter([1, 2])})
+    logger.log_metric_hist({"iteration": 5, "node_overlap": StatCounter([3])})
+    assert run.defined == {"iteration": None, "node_overlap-mean": "iteration"}
+    assert run.logged == [
+        {"loss": 1.0},
+        {"iteration": 0, "node_overlap-mean": 1.5},
+        {"iteration": 5, "node_overlap-mean": 3.0},
+    ]